@@ -0,0 +1,256 @@
+"""
+Score analytics served from incrementally maintained rollups.
+
+Every batch of ReviewResult rows written by persistence.ResultWriter also
+updates ScoreRollup and ScoreHistogram, in the same transaction, at day,
+week and month granularity. The /analytics endpoints only read those
+tables, and each bucket size reads its own rows. A query therefore reads
+at most one row per period, review type, metric (and score bin) in its
+range, however many reviews there are. "all" sums month rows, or day
+rows when since/until fall inside a month. since and until are widened
+to whole buckets.
+
+Means and standard deviations are exact. Percentiles are nearest-rank
+over one-point histogram bins: exact for whole-number scores, otherwise
+rounded down to the point.
+
+rebuild() recomputes both tables from ReviewResult. Migration
+0002_score_rollups uses it to backfill existing databases.
+"""
+import math
+import datetime
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+
+from database import upsert_sums
+from models import ReviewResult, ScoreRollup, ScoreHistogram, SCORE_COLUMNS
+
+GRANULARITIES = ("day", "week", "month")
+BUCKETS = GRANULARITIES + ("all",)
+# "reviews" counts every review; the others are the score columns
+METRICS = ("reviews",) + SCORE_COLUMNS
+DEFAULT_PERCENTILES = (25, 50, 75, 90, 95)
+REBUILD_BATCH_SIZE = 1000
+
+ROLLUP_KEYS = ("granularity", "period_start", "review_type", "metric")
+HISTOGRAM_KEYS = ROLLUP_KEYS + ("bin",)
+
+
+def period_start(moment: datetime.datetime, bucket: str) -> Optional[datetime.datetime]:
+    """Start of the day, ISO week or month containing moment; None for "all" """
+    if bucket == "all":
+        return None
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def score_bin(value: float) -> int:
+    return min(100, max(0, math.floor(value)))
+
+def _naive_utc(moment: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    # created_at is stored as naive UTC
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+# --- Maintenance ---
+
+def _periods(created_at: datetime.datetime, cache: dict) -> tuple:
+    """((granularity, period_start), ...) for created_at, cached per calendar day"""
+    date = created_at.date()
+    periods = cache.get(date)
+    if periods is None:
+        periods = cache[date] = tuple((g, period_start(created_at, g)) for g in GRANULARITIES)
+    return periods
+
+def aggregate(rows: Iterable[dict]) -> Tuple[dict, dict]:
+    """
+    Fold ReviewResult rows (dicts with review_type, created_at and the score
+    columns) into {rollup key: [count, total, total_squares]} and
+    {histogram key: count}.
+    """
+    rollups = defaultdict(lambda: [0, 0.0, 0.0])
+    bins = defaultdict(int)
+    periods_by_date = {}
+    for row in rows:
+        review_type = row["review_type"]
+        scores = [(metric, value, score_bin(value)) for metric in SCORE_COLUMNS
+                  if (value := row.get(metric)) is not None]
+        for granularity, start in _periods(row["created_at"], periods_by_date):
+            rollups[(granularity, start, review_type, "reviews")][0] += 1
+            for metric, value, score in scores:
+                entry = rollups[(granularity, start, review_type, metric)]
+                entry[0] += 1
+                entry[1] += value
+                entry[2] += value * value
+                bins[(granularity, start, review_type, metric, score)] += 1
+    return rollups, bins
+
+def record(connection, rows: Iterable[dict]):
+    """Add written ReviewResult rows to the rollups, inside the caller's transaction"""
+    rollups, bins = aggregate(rows)
+    # Sorted so concurrent writers take row locks in the same order
+    if rollups:
+        upsert_sums(connection, ScoreRollup.__table__, ROLLUP_KEYS, [
+            {**dict(zip(ROLLUP_KEYS, key)), "count": count, "total": total, "total_squares": squares}
+            for key, (count, total, squares) in sorted(rollups.items())
+        ], ("count", "total", "total_squares"))
+    if bins:
+        upsert_sums(connection, ScoreHistogram.__table__, HISTOGRAM_KEYS, [
+            {**dict(zip(HISTOGRAM_KEYS, key)), "count": count}
+            for key, count in sorted(bins.items())
+        ], ("count",))
+
+def rebuild(connection):
+    """Recompute both rollup tables from every ReviewResult row"""
+    connection.execute(delete(ScoreRollup))
+    connection.execute(delete(ScoreHistogram))
+    columns = [ReviewResult.id, ReviewResult.review_type, ReviewResult.created_at,
+               *(getattr(ReviewResult, name) for name in SCORE_COLUMNS)]
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(*columns).where(ReviewResult.id > last_id).order_by(ReviewResult.id).limit(REBUILD_BATCH_SIZE)
+        ).mappings().all()
+        if not rows:
+            break
+        record(connection, rows)
+        last_id = rows[-1]["id"]
+
+
+# --- Queries ---
+
+def parse_metrics(metrics: Optional[str]) -> List[str]:
+    """Validate a comma-separated metric= list; all metrics when empty"""
+    if not metrics:
+        return list(METRICS)
+    requested = [m.strip() for m in metrics.split(",") if m.strip()]
+    unknown = [m for m in requested if m not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(unknown)}. Allowed: {', '.join(METRICS)}")
+    return requested
+
+def parse_percentiles(percentiles: Optional[str]) -> List[float]:
+    if not percentiles:
+        return list(DEFAULT_PERCENTILES)
+    try:
+        values = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid percentiles: {percentiles}")
+    if any(not 0 <= p <= 100 for p in values):
+        raise ValueError("Percentiles must be between 0 and 100")
+    return values
+
+def percentiles_of(histogram: Dict[int, int], quantiles: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles of one-point bins"""
+    scores = sorted(score for score, count in histogram.items() if count)
+    if not scores:
+        return {f"p{q:g}": None for q in quantiles}
+    cumulative = list(accumulate(histogram[score] for score in scores))
+    result = {}
+    for q in quantiles:
+        rank = max(1, math.ceil(q / 100 * cumulative[-1]))
+        result[f"p{q:g}"] = float(scores[min(bisect_left(cumulative, rank), len(scores) - 1)])
+    return result
+
+def _granularity(bucket: str, since: Optional[datetime.datetime], until: Optional[datetime.datetime]) -> str:
+    """Rows a bucket is read from: its own, or for "all" the coarsest that fits since and until"""
+    if bucket != "all":
+        return bucket
+    if all(moment is None or period_start(moment, "month") == moment for moment in (since, until)):
+        return "month"
+    return "day"
+
+def _query(connection, table, bucket: str, review_type: Optional[str], metrics: List[str],
+           since: Optional[datetime.datetime], until: Optional[datetime.datetime], sums: list, by_bin: bool):
+    granularity = _granularity(bucket, since, until)
+    keys = [table.c.review_type, table.c.metric] + ([table.c.bin] if by_bin else [])
+    if bucket == "all":
+        statement = select(*keys, *[func.sum(table.c[name]).label(name) for name in sums]).group_by(*keys)
+    else:
+        # One row per key already, nothing to sum
+        statement = select(table.c.period_start, *keys, *[table.c[name] for name in sums])
+    statement = statement.where(table.c.granularity == granularity, table.c.metric.in_(metrics))
+    if review_type:
+        statement = statement.where(table.c.review_type == review_type)
+    if since:
+        statement = statement.where(table.c.period_start >= period_start(since, granularity))
+    if until:
+        statement = statement.where(table.c.period_start < until)
+    return connection.execute(statement).all()
+
+def _series(engine, bucket: str, review_type: Optional[str], metrics: List[str],
+            since: Optional[datetime.datetime], until: Optional[datetime.datetime]) -> Tuple[dict, dict]:
+    """{(period_start, review_type, metric): [count, total, total_squares]} and {same key: {bin: count}}"""
+    since, until = _naive_utc(since), _naive_utc(until)
+    with engine.connect() as connection:
+        rollup_rows = _query(connection, ScoreRollup.__table__, bucket, review_type, metrics,
+                             since, until, ["count", "total", "total_squares"], by_bin=False)
+        histogram_rows = _query(connection, ScoreHistogram.__table__, bucket, review_type, metrics,
+                                since, until, ["count"], by_bin=True)
+    if bucket == "all":
+        sums = {(None, review_type, metric): values for review_type, metric, *values in rollup_rows}
+        series = ((None, review_type, metric, score, count) for review_type, metric, score, count in histogram_rows)
+    else:
+        sums = {(start, review_type, metric): values for start, review_type, metric, *values in rollup_rows}
+        series = histogram_rows
+    histograms = defaultdict(dict)
+    for start, review_type, metric, score, count in series:
+        histograms[(start, review_type, metric)][score] = count
+    return sums, histograms
+
+def _item(key: tuple) -> dict:
+    start, review_type, metric = key
+    return {"period_start": start, "review_type": review_type, "metric": metric}
+
+def score_summary(engine, bucket: str = "all", review_type: Optional[str] = None,
+                  metrics: Optional[List[str]] = None, since: Optional[datetime.datetime] = None,
+                  until: Optional[datetime.datetime] = None, percentiles: Optional[List[float]] = None) -> List[dict]:
+    """Count, mean, standard deviation and percentiles per period, review type and metric"""
+    quantiles = list(DEFAULT_PERCENTILES) if percentiles is None else percentiles
+    sums, histograms = _series(engine, bucket, review_type, metrics or list(METRICS), since, until)
+    items = []
+    for key in sorted(sums, key=lambda k: (k[0] or datetime.datetime.min, k[1], k[2])):
+        count, total, squares = sums[key]
+        item = _item(key)
+        item["count"] = count
+        if key[2] == "reviews":
+            item.update(mean=None, stddev=None, percentiles={})
+        else:
+            mean = total / count if count else None
+            variance = max(0.0, squares / count - mean * mean) if count else None
+            item["mean"] = round(mean, 2) if mean is not None else None
+            item["stddev"] = round(math.sqrt(variance), 2) if variance is not None else None
+            item["percentiles"] = percentiles_of(histograms.get(key, {}), quantiles)
+        items.append(item)
+    return items
+
+def distribution(engine, bucket: str = "all", review_type: Optional[str] = None,
+                 metrics: Optional[List[str]] = None, since: Optional[datetime.datetime] = None,
+                 until: Optional[datetime.datetime] = None, bin_width: int = 10) -> List[dict]:
+    """Score histograms per period, review type and metric, in bins of bin_width points"""
+    metrics = [m for m in (metrics or METRICS) if m != "reviews"]
+    _, histograms = _series(engine, bucket, review_type, metrics, since, until)
+    # The last bin is closed so it also holds 100
+    last_start = (99 // bin_width) * bin_width
+    items = []
+    for key in sorted(histograms, key=lambda k: (k[0] or datetime.datetime.min, k[1], k[2])):
+        counts = defaultdict(int)
+        for score, count in histograms[key].items():
+            counts[min(score // bin_width * bin_width, last_start)] += count
+        item = _item(key)
+        item["count"] = sum(counts.values())
+        item["bins"] = [
+            {"start": start, "end": min(start + bin_width, 100), "count": counts.get(start, 0)}
+            for start in range(0, last_start + 1, bin_width)
+        ]
+        items.append(item)
+    return items
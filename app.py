@@ -2,11 +2,43 @@ import streamlit as st
 import requests
 import json
 import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
 
 # URL of your FastAPI backend
 API_URL = "http://127.0.0.1:8000"
+# (connect, read) seconds; the read timeout is per chunk, so streams can run longer
+API_TIMEOUT = (5, 300)
+# Connections kept open to the API, shared by every session of this Streamlit server
+API_POOL_SIZE = 20
+# Retries for connection errors, and for 502/503/504 on idempotent methods only
+API_RETRIES = 3
+
+@st.cache_resource(show_spinner=False)
+def get_api_session() -> requests.Session:
+    """
+    One pooled keep-alive session for all users and reruns. Sharing it
+    between script threads is fine since the API sets no cookies.
+    """
+    retry = Retry(
+        total=API_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # Not POST: reviews are saved to history
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Adds br and zstd when their decoders (brotli, zstandard) are installed
+    session.headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
+    return session
 
 st.set_page_config(page_title="INTUITIX", layout="wide")
+# After set_page_config, which must be the first Streamlit call of a run
+api = get_api_session()
 st.title("INTUITIX: AI-Powered Peer Review & Plagiarism Checker")
 
 # --- Tabs for different functions ---
@@ -49,7 +81,7 @@ with tab_writeup:
                     form_data = {"text": writeup_content}
                 
                 try:
-                    resp = requests.post(f"{API_URL}/review/writeup", data=form_data, files=file_upload)
+                    resp = api.post(f"{API_URL}/review/writeup", data=form_data, files=file_upload, timeout=API_TIMEOUT)
                     
                     if resp.status_code == 200:
                         data = resp.json()["feedback"]
@@ -136,30 +168,41 @@ with tab_code:
         if not code_content:
             st.warning("Please paste your code or upload a file.")
         else:
-            with st.spinner("Reviewing code..."):
-                form_data = {"language": language}
-                file_upload = None
-                
-                if code_file:
-                    file_upload = {"file": (code_file.name, code_file.getvalue(), code_file.type or "application/octet-stream")}
-                else:
-                    form_data["code"] = code_content
+            form_data = {"language": language}
+            file_upload = None
+            
+            if code_file:
+                file_upload = {"file": (code_file.name, code_file.getvalue(), code_file.type or "application/octet-stream")}
+            else:
+                form_data["code"] = code_content
 
-                try:
-                    resp = requests.post(f"{API_URL}/review/code", data=form_data, files=file_upload)
-                    
+            try:
+                # Stream the review so the Markdown shows up as it is generated
+                with api.post(f"{API_URL}/review/code/stream", data=form_data, files=file_upload, stream=True,
+                              timeout=API_TIMEOUT) as resp:
                     if resp.status_code == 200:
-                        data = resp.json()["feedback"]
-                        st.success("✅ Code Review Complete")
                         st.subheader("Feedback")
-                        if isinstance(data, dict) and "feedback" in data:
-                            st.markdown(data["feedback"])
-                        else:
-                            st.markdown(data)
+                        placeholder = st.empty()
+                        feedback = ""
+                        event = None
+                        for line in resp.iter_lines(decode_unicode=True):
+                            if line.startswith("event:"):
+                                event = line[len("event:"):].strip()
+                            elif line.startswith("data:"):
+                                payload = json.loads(line[len("data:"):])
+                                if event == "delta":
+                                    feedback += payload["text"]
+                                    placeholder.markdown(feedback + "▌")
+                                elif event == "done":
+                                    placeholder.markdown(feedback)
+                                    st.success("✅ Code Review Complete")
+                                elif event == "error":
+                                    placeholder.markdown(feedback)
+                                    st.error(payload["detail"])
                     else:
                         st.error(f"Error: {resp.status_code} - {resp.json().get('detail', 'Unknown error')}")
-                except Exception as e:
-                    st.error(f"Failed to connect to API: {e}")
+            except Exception as e:
+                st.error(f"Failed to connect to API: {e}")
 
 # --- Text Plagiarism Check Tab ---
 with tab_plagiarism:
@@ -172,7 +215,7 @@ with tab_plagiarism:
             with st.spinner("Analyzing text for plagiarism..."):
                 payload = {"text": plagiarism_text, "filename": "text_plagiarism_check"}
                 try:
-                    resp = requests.post(f"{API_URL}/review/plagiarism", json=payload)
+                    resp = api.post(f"{API_URL}/review/plagiarism", json=payload, timeout=API_TIMEOUT)
                     if resp.status_code == 200:
                         data = resp.json()["feedback"]
                         st.success("✅ Text Plagiarism Check Complete")
@@ -257,7 +300,7 @@ with tab_code_plagiarism:
                     "language": code_plagiarism_language
                 }
                 try:
-                    resp = requests.post(f"{API_URL}/review/code_plagiarism", json=payload)
+                    resp = api.post(f"{API_URL}/review/code_plagiarism", json=payload, timeout=API_TIMEOUT)
                     if resp.status_code == 200:
                         data = resp.json()["feedback"]
                         st.success("✅ Code Plagiarism Check Complete")
@@ -317,29 +360,99 @@ with tab_code_plagiarism:
                     st.error(f"Failed to connect to API: {e}")
 
 # --- History Tab ---
+HISTORY_PAGE_SIZES = [25, 50, 100, 200]
+HISTORY_REVIEW_TYPES = ["All", "writeup", "code", "plagiarism", "code_plagiarism"]
+# Scores come back as their own numeric columns, so no JSON needs parsing here
+HISTORY_COLUMNS = ["id", "filename", "review_type", "grammar", "clarity", "structure",
+                   "plagiarism_score", "feedback", "created_at"]
+# Seconds a fetched page is reused across reruns; reviews themselves never change
+HISTORY_CACHE_TTL = 60
+REVIEW_CACHE_TTL = 3600
+FEEDBACK_PREVIEW_CHARS = 200
+
+@st.cache_data(ttl=HISTORY_CACHE_TTL, show_spinner=False)
+def fetch_history_page(cursor, limit, review_type):
+    params = {"limit": limit, "fields": ",".join(HISTORY_COLUMNS)}
+    if cursor:
+        params["cursor"] = cursor
+    if review_type:
+        params["review_type"] = review_type
+    resp = api.get(f"{API_URL}/history", params=params, timeout=API_TIMEOUT)
+    if resp.status_code != 200:
+        raise RuntimeError(resp.json().get("detail", "Unknown error"))
+    return resp.json()
+
+@st.cache_data(ttl=REVIEW_CACHE_TTL, max_entries=100, show_spinner=False)
+def fetch_review(review_id):
+    resp = api.get(f"{API_URL}/history/{review_id}", timeout=API_TIMEOUT)
+    if resp.status_code != 200:
+        raise RuntimeError(resp.json().get("detail", "Unknown error"))
+    return resp.json()
+
+# history_cursors holds the cursor of every page visited; the last one is shown
+if "history_cursors" not in st.session_state:
+    st.session_state["history_cursors"] = [None]
+
+def reset_history_paging():
+    st.session_state["history_cursors"] = [None]
+
+def refresh_history():
+    fetch_history_page.clear()
+    reset_history_paging()
+
+def next_history_page(cursor):
+    st.session_state["history_cursors"].append(cursor)
+
+def previous_history_page():
+    st.session_state["history_cursors"].pop()
+
 with tab_history:
     st.header("Past Reviews")
-    
-    if st.button("Refresh History"):
-        st.rerun()
 
+    filter_cols = st.columns([2, 1, 1])
+    history_type = filter_cols[0].selectbox("Review type", HISTORY_REVIEW_TYPES,
+                                            key="history_type", on_change=reset_history_paging)
+    page_size = filter_cols[1].selectbox("Per page", HISTORY_PAGE_SIZES, index=1,
+                                         key="history_page_size", on_change=reset_history_paging)
+    filter_cols[2].button("Refresh History", on_click=refresh_history)
+
+    cursors = st.session_state["history_cursors"]
     try:
-        resp = requests.get(f"{API_URL}/history")
-        if resp.status_code == 200:
-            df = pd.DataFrame(resp.json())
-            if not df.empty:
-                df["scores_dict"] = df["scores"].apply(lambda x: json.loads(x) if isinstance(x, str) else x)
-                
-                display_df = df[["filename", "review_type", "feedback", "created_at"]].copy()
-                display_df["scores"] = df["scores_dict"].apply(lambda x: ", ".join([f"{k}: {v}" for k, v in x.items()]) if x else "N/A")
-                
-                st.dataframe(display_df, use_container_width=True)
-                
-                with st.expander("See Raw Data"):
-                    st.json(resp.json())
-            else:
-                st.info("No reviews yet.")
-        else:
-            st.error(f"Error: {resp.json().get('detail', 'Unknown error')}")
+        page = fetch_history_page(cursors[-1], page_size, None if history_type == "All" else history_type)
     except Exception as e:
-        st.error(f"Failed to connect to API: {e}")
\ No newline at end of file
+        st.error(f"Failed to load history: {e}")
+        page = None
+
+    if page is not None:
+        df = pd.DataFrame(page["items"], columns=HISTORY_COLUMNS)
+        if df.empty and len(cursors) == 1:
+            st.info("No reviews yet.")
+        else:
+            df["created_at"] = pd.to_datetime(df["created_at"])
+            df["feedback"] = df["feedback"].str.slice(0, FEEDBACK_PREVIEW_CHARS)
+            st.dataframe(df.set_index("id"), use_container_width=True)
+
+            nav_cols = st.columns([1, 1, 4])
+            nav_cols[0].button("◀ Newer", key="history_newer", disabled=len(cursors) == 1,
+                               on_click=previous_history_page)
+            nav_cols[1].button("Older ▶", key="history_older", disabled=not page["next_cursor"],
+                               on_click=next_history_page, args=(page["next_cursor"],))
+            nav_cols[2].caption(f"Page {len(cursors)}")
+
+            # The full response is only fetched for the review picked here
+            labels = dict(zip(df["id"], df["filename"] + " (" + df["review_type"] + ")"))
+            review_id = st.selectbox("Review details", list(labels), index=None,
+                                     format_func=lambda i: f"#{i} {labels[i]}",
+                                     placeholder="Select a review to see its full response",
+                                     key="history_detail")
+            if review_id is not None:
+                try:
+                    review = fetch_review(review_id)
+                    full_response = review.get("full_response")
+                    try:
+                        review["full_response"] = json.loads(full_response) if full_response else None
+                    except ValueError:
+                        pass
+                    st.json(review)
+                except Exception as e:
+                    st.error(f"Failed to load review {review_id}: {e}")
@@ -0,0 +1,74 @@
+"""
+Batch reviews: many documents in one request.
+
+Items are fanned out to review_service with at most BATCH_CONCURRENCY in
+flight per batch (the LLM client has its own global limit on top). The
+response is NDJSON, one line per item in completion order, followed by
+the pairwise similarity of the batch's own documents and a summary line.
+"""
+import os
+import json
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+import minhash_lsh
+import winnowing
+import review_service
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+
+
+def batch_similarity(review_type: str, texts: List[str], language: Optional[str]) -> List[dict]:
+    """Pairwise plagiarism across the documents of a single batch"""
+    if review_type in review_service.CODE_REVIEW_TYPES:
+        return winnowing.pairwise_similar(texts, language or "Other")
+    return minhash_lsh.pairwise_similar(texts)
+
+def _line(payload: dict) -> bytes:
+    return (json.dumps(payload, default=str) + "\n").encode("utf-8")
+
+async def stream_batch(review_type: str, items: List[dict], language: Optional[str] = None,
+                       no_cache: bool = False) -> AsyncIterator[bytes]:
+    """
+    items are {"text": ..., "filename": ...} dicts. Yields NDJSON lines:
+    {"type": "item", ...} per document, then {"type": "batch_similarity", ...}
+    and finally {"type": "done", ...}.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_one(index: int, item: dict) -> dict:
+        async with semaphore:
+            try:
+                feedback, cache_status = await review_service.run_review(
+                    review_type, item["text"], item.get("filename"), language, no_cache
+                )
+                return {"type": "item", "index": index, "filename": item.get("filename"),
+                        "status": "success", "feedback": feedback, "cache": cache_status}
+            except Exception as e:
+                return {"type": "item", "index": index, "filename": item.get("filename"),
+                        "status": "error", "detail": str(e)}
+
+    tasks = [asyncio.create_task(run_one(i, item)) for i, item in enumerate(items)]
+    similarity_task = asyncio.create_task(run_in_threadpool(
+        batch_similarity, review_type, [item["text"] for item in items], language
+    ))
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            failed += result["status"] == "error"
+            yield _line(result)
+
+        pairs = await similarity_task
+        for pair in pairs:
+            pair["filenames"] = [items[pair["a"]].get("filename"), items[pair["b"]].get("filename")]
+        yield _line({"type": "batch_similarity", "pairs": pairs})
+        yield _line({"type": "done", "count": len(items), "failed": failed})
+    finally:
+        # Client went away or the stream errored: don't keep reviewing for nobody
+        for task in tasks:
+            task.cancel()
+        similarity_task.cancel()
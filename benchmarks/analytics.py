@@ -0,0 +1,109 @@
+"""
+/analytics query time from the rollups versus a scan of ReviewResult.
+
+Seeds a temporary SQLite database with --reviews reviews spread over
+--days days. Rows are inserted and rolled up in batches the way
+persistence.ResultWriter does. It then times analytics.score_summary() for
+each bucket against the same averages computed by a GROUP BY over
+ReviewResult, the query the rollups replace.
+
+    python -m benchmarks.analytics --reviews 1000000 --days 365
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import func, insert, select
+from sqlmodel import SQLModel
+
+import analytics
+from database import make_engine
+from models import ReviewResult, score_columns
+
+REVIEW_TYPES = ("writeup", "code", "plagiarism", "code_plagiarism")
+BATCH_SIZE = 1000
+
+def _scores(review_type: str) -> dict:
+    if review_type == "writeup":
+        return {name: random.randint(30, 100) for name in ("grammar", "clarity", "structure")}
+    if review_type in ("plagiarism", "code_plagiarism"):
+        return {"plagiarism_score": random.randint(0, 100)}
+    return {}
+
+def seed(engine, reviews: int, days: int) -> float:
+    """Insert and roll up reviews; returns the seconds spent in analytics.record"""
+    SQLModel.metadata.create_all(engine)
+    started = datetime.datetime(2024, 1, 1)
+    seconds = days * 86400
+    rollup_seconds = 0.0
+    for offset in range(0, reviews, BATCH_SIZE):
+        rows = []
+        for i in range(offset, min(reviews, offset + BATCH_SIZE)):
+            review_type = random.choice(REVIEW_TYPES)
+            scores = _scores(review_type)
+            rows.append({
+                "filename": f"bench_{i}.txt", "review_type": review_type, "scores": scores,
+                **score_columns(scores), "feedback": "", "full_response": "{}",
+                "created_at": started + datetime.timedelta(seconds=i * seconds // reviews),
+            })
+        with engine.begin() as connection:
+            connection.execute(insert(ReviewResult.__table__), rows)
+            rollup_started = time.perf_counter()
+            analytics.record(connection, rows)
+            rollup_seconds += time.perf_counter() - rollup_started
+    return rollup_seconds
+
+def full_scan(engine):
+    groups = [ReviewResult.review_type]
+    with engine.connect() as connection:
+        return connection.execute(
+            select(*groups, func.count(), func.avg(ReviewResult.grammar), func.avg(ReviewResult.clarity),
+                   func.avg(ReviewResult.structure), func.avg(ReviewResult.plagiarism_score))
+            .group_by(*groups)
+        ).all()
+
+def timed(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics rollup query benchmark")
+    parser.add_argument("--reviews", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed_started = time.perf_counter()
+        rollup_seconds = seed(engine, args.reviews, args.days)
+        seed_seconds = time.perf_counter() - seed_started
+        print(f"{args.reviews} reviews over {args.days} days seeded in {seed_seconds:.1f}s, "
+              f"{rollup_seconds / seed_seconds:.0%} of it updating rollups "
+              f"({rollup_seconds * 1e6 / args.reviews:.1f} us per review)")
+
+        print(f"\n{'query':<36} {'median ms':>10}")
+        print(f"{'full scan, averages by type':<36} {timed(lambda: full_scan(engine), args.repeat):>10.1f}")
+        for bucket in ("all", "month", "week", "day"):
+            ms = timed(lambda: analytics.score_summary(engine, bucket), args.repeat)
+            print(f"{'rollups, bucket=' + bucket:<36} {ms:>10.1f}")
+        last_month = datetime.datetime(2024, 1, 1) + datetime.timedelta(days=args.days - 30)
+        ms = timed(lambda: analytics.score_summary(engine, "day", since=last_month), args.repeat)
+        print(f"{'rollups, bucket=day, last 30 days':<36} {ms:>10.1f}")
+        ms = timed(lambda: analytics.score_summary(engine, "all", since=last_month), args.repeat)
+        print(f"{'rollups, bucket=all, last 30 days':<36} {ms:>10.1f}")
+        ms = timed(lambda: analytics.distribution(engine, "all"), args.repeat)
+        print(f"{'rollups, distribution':<36} {ms:>10.1f}")
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
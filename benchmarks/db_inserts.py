@@ -0,0 +1,74 @@
+"""
+Concurrent insert throughput of ReviewResult rows, before and after the
+engine tuning in database.make_engine().
+
+Each thread mimics an endpoint: open a Session, add one ReviewResult,
+commit. "baseline" is a plain create_engine() with SQLite defaults,
+"tuned" is make_engine() with WAL, synchronous=NORMAL and a busy timeout.
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.db_inserts --threads 16 --rows 200
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from database import make_engine
+from models import ReviewResult, score_columns
+
+SCORES = {"grammar": 80, "clarity": 75, "structure": 70}
+
+def run(engine, threads: int, rows: int) -> dict:
+    SQLModel.metadata.create_all(engine)
+    errors = []
+
+    def worker():
+        for i in range(rows):
+            try:
+                with Session(engine) as session:
+                    session.add(ReviewResult(
+                        filename=f"bench_{i}.txt",
+                        review_type="writeup",
+                        scores=SCORES,
+                        **score_columns(SCORES),
+                        feedback="Benchmark feedback " * 20,
+                        full_response="{}"
+                    ))
+                    session.commit()
+            except Exception as e:
+                errors.append(str(e).splitlines()[0])
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    inserted = threads * rows - len(errors)
+    return {"rows_per_sec": inserted / elapsed, "errors": len(errors), "elapsed": elapsed,
+            "first_error": errors[0] if errors else ""}
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent ReviewResult insert benchmark")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--rows", type=int, default=200, help="Inserts per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configs = {
+            "baseline": create_engine(f"sqlite:///{os.path.join(tmp, 'baseline.db')}", echo=False),
+            "tuned": make_engine(f"sqlite:///{os.path.join(tmp, 'tuned.db')}"),
+        }
+        print(f"{'engine':>10} {'rows/s':>10} {'errors':>8} {'seconds':>8}")
+        for name, engine in configs.items():
+            result = run(engine, args.threads, args.rows)
+            print(f"{name:>10} {result['rows_per_sec']:>10.1f} {result['errors']:>8} {result['elapsed']:>8.2f}"
+                  + (f"  ({result['first_error']})" if result["errors"] else ""))
+            engine.dispose()
+
+if __name__ == "__main__":
+    main()
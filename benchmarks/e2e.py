@@ -0,0 +1,300 @@
+"""
+End-to-end throughput and latency of the API against the fake LLM server.
+
+Starts benchmarks.fake_llm_server and `uvicorn main:app` (on a fresh
+SQLite database) in subprocesses, then drives each endpoint in turn with
+--concurrency closed-loop clients. Every request carries a freshly
+generated document, so the response cache and the plagiarism corpus see
+realistic misses rather than one repeated input.
+
+Per endpoint it reports p50/p95/p99 latency, requests per second, error
+count, ReviewResult rows written per second (counted in the database, so
+write-behind batches and multiple workers are included) and the app's
+resident memory. Results are written as JSON, tagged with the
+git commit, so two runs can be compared:
+
+    python -m benchmarks.e2e --concurrency 16 --requests 200 --latency 0.2 --tokens-per-second 500
+    python -m benchmarks.e2e --compare benchmarks/results/e2e-<old>.json
+
+Extra app settings can be passed through with --env NAME=VALUE.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.llm_concurrency import free_port, wait_for_port
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+ENDPOINTS = ["writeup", "code", "plagiarism", "code_plagiarism", "history"]
+
+WORDS = (
+    "analysis argument evidence method result data model system process value study theory "
+    "approach design change effect factor impact level measure pattern policy practice role "
+    "structure context research question response source strategy support test trend view "
+    "clear early final general large local major modern natural recent similar simple social "
+    "specific strong useful careful direct formal global human limited national open public"
+).split()
+IDENTIFIERS = "count total items value result index buffer record entry node cache score limit offset".split()
+
+
+# --- Inputs ---
+
+def make_text(rng: random.Random, paragraphs: int = 4, sentences: int = 6) -> str:
+    """Essay-like text that doesn't overlap with the other generated texts"""
+    body = []
+    for _ in range(paragraphs):
+        body.append(" ".join(
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 18))).capitalize() + "."
+            for _ in range(sentences)
+        ))
+    return "\n\n".join(body)
+
+def make_code(rng: random.Random, functions: int = 4) -> str:
+    parts = []
+    for _ in range(functions):
+        a, b = rng.sample(IDENTIFIERS, 2)
+        parts.append(
+            f"def {a}_{b}_{rng.randrange(10 ** 6)}({a}, {b}):\n"
+            f"    {a} = {a} + {rng.randint(1, 99)}\n"
+            f"    for i in range({b}):\n"
+            f"        {a} = {a} * i % {rng.randint(2, 999)}\n"
+            f"    return {a}\n"
+        )
+    return "\n\n".join(parts)
+
+def make_request(endpoint: str, rng: random.Random) -> dict:
+    """Keyword arguments for httpx.AsyncClient.request"""
+    if endpoint == "writeup":
+        return {"method": "POST", "url": "/review/writeup", "data": {"text": make_text(rng)}}
+    if endpoint == "code":
+        return {"method": "POST", "url": "/review/code", "data": {"language": "Python", "code": make_code(rng)}}
+    if endpoint == "plagiarism":
+        return {"method": "POST", "url": "/review/plagiarism", "json": {"text": make_text(rng)}}
+    if endpoint == "code_plagiarism":
+        return {"method": "POST", "url": "/review/code_plagiarism",
+                "json": {"text": make_code(rng), "language": "Python"}}
+    return {"method": "GET", "url": "/history", "params": {"limit": 20}}
+
+
+# --- Measurements ---
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def rss_mb(pid: int) -> float:
+    """Resident memory of pid and its child processes (uvicorn workers), Linux only"""
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, StopIteration):
+            continue
+    return round(total_kb / 1024, 1)
+
+async def rows_written(db_path: str, settle_seconds: float = 0.5) -> int:
+    """ReviewResult rows in the database once write-behind batches have stopped arriving"""
+    def count() -> int:
+        with sqlite3.connect(db_path) as connection:
+            return connection.execute("SELECT COUNT(*) FROM reviewresult").fetchone()[0]
+
+    rows = count()
+    for _ in range(60):
+        await asyncio.sleep(settle_seconds)
+        latest = count()
+        if latest == rows:
+            break
+        rows = latest
+    return rows
+
+async def run_endpoint(client: httpx.AsyncClient, endpoint: str, requests: int, concurrency: int,
+                       warmup: int, rng: random.Random, app_pid: int, db_path: str) -> dict:
+    for _ in range(warmup):
+        await client.request(**make_request(endpoint, rng))
+
+    payloads = [make_request(endpoint, rng) for _ in range(requests)]
+    latencies = []
+    errors = {}
+    written_before = await rows_written(db_path)
+
+    async def worker():
+        while payloads:
+            payload = payloads.pop()
+            start = time.perf_counter()
+            try:
+                response = await client.request(**payload)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    written = await rows_written(db_path) - written_before
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1),
+        "db_rows_per_sec": round(written / elapsed, 2),
+        "rss_mb": rss_mb(app_pid),
+    }
+
+
+# --- Reporting ---
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_table(results: dict, baseline: dict = None):
+    columns = ["rps", "p50_ms", "p95_ms", "p99_ms", "db_rows_per_sec", "rss_mb"]
+    print(f"{'endpoint':<16}" + "".join(f"{c:>16}" for c in columns) + f"{'errors':>8}")
+    for endpoint, row in results.items():
+        cells = []
+        for column in columns:
+            cell = f"{row[column]:.1f}"
+            old = (baseline or {}).get(endpoint, {}).get(column)
+            if old:
+                cell += f" ({(row[column] - old) / old:+.0%})"
+            cells.append(f"{cell:>16}")
+        print(f"{endpoint:<16}" + "".join(cells) + f"{sum(row['errors'].values()):>8}")
+
+async def drive(args, app_port: int, app_pid: int, db_path: str) -> dict:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", timeout=args.timeout,
+                                 limits=limits) as client:
+        results = {}
+        for endpoint in args.endpoints:
+            results[endpoint] = await run_endpoint(
+                client, endpoint, args.requests, args.concurrency, args.warmup, rng, app_pid, db_path
+            )
+            print(f"{endpoint}: {results[endpoint]['rps']} req/s, p95 {results[endpoint]['p95_ms']} ms")
+        return results
+
+def wait_for_health(port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"App on port {port} did not become healthy")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end API benchmark against the fake LLM server")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per endpoint")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Fake LLM generation rate")
+    parser.add_argument("--app-workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra environment for the app, e.g. PERSIST_MODE=sync")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/e2e-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier result file to show changes against")
+    args = parser.parse_args()
+
+    llm_port, app_port = free_port(), free_port()
+    tmp = tempfile.TemporaryDirectory()
+    db_path = os.path.join(tmp.name, "bench.db")
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{llm_port}",
+        "GROQ_API_KEY": "fake-key",
+        "LLM_ROUTE": "groq:llama-3.1-8b-instant",
+        # Measure the service, not the client-side provider rate limits
+        "LLM_RPM_LIMIT": "0",
+        "LLM_TPM_LIMIT": "0",
+        "LLM_MAX_CONCURRENCY": str(max(16, args.concurrency)),
+    })
+    env.update(item.split("=", 1) for item in args.env)
+
+    fake = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_llm_server", "--port", str(llm_port),
+        "--latency", str(args.latency), "--tokens-per-second", str(args.tokens_per_second),
+    ], cwd=REPO_ROOT)
+    app = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port),
+        "--workers", str(args.app_workers), "--log-level", "warning",
+    # The app's stdout is its per-request logging, which would drown the report
+    ], cwd=tmp.name, env={**env, "PYTHONPATH": REPO_ROOT}, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(llm_port)
+        wait_for_health(app_port)
+        rss_start = rss_mb(app.pid)
+        results = asyncio.run(drive(args, app_port, app.pid, db_path))
+    finally:
+        app.terminate()
+        fake.terminate()
+        app.wait()
+        fake.wait()
+        tmp.cleanup()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "concurrency": args.concurrency, "requests": args.requests, "warmup": args.warmup,
+            "latency": args.latency, "tokens_per_second": args.tokens_per_second,
+            "app_workers": args.app_workers, "seed": args.seed, "env": args.env,
+        },
+        "rss_start_mb": rss_start,
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline['commit']} ({baseline['timestamp']}):")
+    print()
+    print_table(results, baseline["results"] if baseline else None)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"e2e-{report['commit']}-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
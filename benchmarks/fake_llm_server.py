@@ -0,0 +1,232 @@
+"""
+Fake Groq/OpenAI-compatible chat completion server for offline benchmarks.
+
+It sleeps for a configurable latency and answers with canned content shaped
+like what review_logic.py expects, so the whole app can be exercised
+without a GROQ_API_KEY or network access.
+
+Run it with:
+    python -m benchmarks.fake_llm_server --port 8100 --latency 0.5 --tokens-per-second 200
+
+--latency is the fixed time to first token and --tokens-per-second the
+generation rate (0 = instant), so long replies take longer than short ones.
+
+and point the app at it with GROQ_BASE_URL=http://127.0.0.1:8100
+
+Faults can be injected to exercise llm_transport.py: --fail-rate answers
+that share of requests with --fail-status (429 by default, with a
+retry-after header), and --hang-rate leaves that share of requests
+hanging for --hang-seconds so client timeouts fire. POST /faults changes
+these settings on a running server.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake LLM Server")
+
+# Overridden from the command line or POST /faults
+CONFIG = {
+    "latency": 0.5,
+    "tokens_per_second": 0.0,
+    "fail_rate": 0.0,
+    "fail_status": 429,
+    "retry_after": 1.0,
+    "hang_rate": 0.0,
+    "hang_seconds": 60.0,
+}
+STATS = {"requests": 0, "failed": 0, "hung": 0}
+
+WRITEUP_RESPONSE = {
+    "scores": {"grammar": 82, "clarity": 78, "structure": 74},
+    "overall_feedback": "The text is generally well written with a clear argument.",
+    "justifications": {
+        "grammar_justification": "Few grammatical mistakes.",
+        "clarity_justification": "Most sentences are easy to follow.",
+        "structure_justification": "Paragraphs follow a logical order.",
+        "improvement_suggestions": "Add a stronger conclusion."
+    },
+    "per_paragraph_feedback": []
+}
+
+PLAGIARISM_RESPONSE = {
+    "plagiarism_score": 35,
+    "confidence": "Medium",
+    "summary": "The text appears mostly original.",
+    "sources": [],
+    "matched_phrases": [],
+    "recommendations": ["Verify originality"]
+}
+
+CODE_PLAGIARISM_RESPONSE = {
+    "plagiarism_score": 40,
+    "confidence": "Medium",
+    "summary": "The code uses common patterns.",
+    "sources": [],
+    "indicators": [],
+    "recommendations": ["Review code originality"]
+}
+
+CODE_REVIEW_RESPONSE = """## Code Review
+
+**Correctness:** No obvious bugs.
+
+**Best Practices:** Consider adding type hints.
+
+**Readability:** Naming is clear.
+
+**Suggestions:** Add unit tests.
+"""
+
+def canned_content(prompt: str) -> str:
+    """Pick a response shaped like the one the prompt asks for"""
+    if "plagiarism" in prompt.lower():
+        if "CODE:" in prompt:
+            return json.dumps(CODE_PLAGIARISM_RESPONSE)
+        return json.dumps(PLAGIARISM_RESPONSE)
+    if "grammar" in prompt.lower():
+        return json.dumps(WRITEUP_RESPONSE)
+    return CODE_REVIEW_RESPONSE
+
+def generation_seconds(content: str) -> float:
+    """Time to produce content at the configured latency and token rate"""
+    seconds = CONFIG["latency"]
+    if CONFIG["tokens_per_second"] > 0:
+        seconds += (len(content) // 4) / CONFIG["tokens_per_second"]
+    return seconds
+
+def completion_body(model: str, content: str, prompt: str) -> dict:
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+            "logprobs": None
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+def stream_events(model: str, content: str):
+    """
+    Yield the content as OpenAI-style SSE chunks. The generation time is
+    spread across the pieces so the first one arrives almost immediately.
+    """
+    pieces = re.findall(r"\S+\s*|\s+", content) or [""]
+    delay = generation_seconds(content) / len(pieces)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    async def events():
+        for index, piece in enumerate(pieces):
+            await asyncio.sleep(delay)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": piece} if index == 0 else {"content": piece},
+                    "finish_reason": None,
+                    "logprobs": None
+                }]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop", "logprobs": None}]
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+async def injected_fault() -> Optional[JSONResponse]:
+    """Error response or hang for this request according to CONFIG, if any"""
+    if random.random() < CONFIG["hang_rate"]:
+        STATS["hung"] += 1
+        await asyncio.sleep(CONFIG["hang_seconds"])
+    if random.random() < CONFIG["fail_rate"]:
+        STATS["failed"] += 1
+        status = CONFIG["fail_status"]
+        headers = {"retry-after": str(CONFIG["retry_after"])} if status in (429, 503) else {}
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": f"Injected fault ({status})", "type": "fake_fault"}},
+            headers=headers
+        )
+    return None
+
+@app.post("/faults")
+async def set_faults(request: Request):
+    """Update fault injection settings; returns the settings and request counters"""
+    updates = await request.json()
+    for key, value in updates.items():
+        if key in CONFIG:
+            CONFIG[key] = type(CONFIG[key])(value)
+    return {"config": CONFIG, "stats": STATS}
+
+@app.get("/faults")
+async def get_faults():
+    return {"config": CONFIG, "stats": STATS}
+
+@app.post("/openai/v1/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    STATS["requests"] += 1
+    fault = await injected_fault()
+    if fault is not None:
+        return fault
+    prompt = "\n".join(m.get("content") or "" for m in body.get("messages", []))
+    if body.get("stream"):
+        return stream_events(body.get("model", "fake"), canned_content(prompt))
+    content = canned_content(prompt)
+    await asyncio.sleep(generation_seconds(content))
+    return completion_body(body.get("model", "fake"), content, prompt)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Generation rate, 0 for instant")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with an error")
+    parser.add_argument("--fail-status", type=int, default=429, help="HTTP status for injected errors")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry-after seconds sent with 429/503")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of requests that hang")
+    parser.add_argument("--hang-seconds", type=float, default=60.0, help="How long a hanging request waits")
+    args = parser.parse_args()
+
+    CONFIG["latency"] = args.latency
+    CONFIG["tokens_per_second"] = args.tokens_per_second
+    CONFIG["fail_rate"] = args.fail_rate
+    CONFIG["fail_status"] = args.fail_status
+    CONFIG["retry_after"] = args.retry_after
+    CONFIG["hang_rate"] = args.hang_rate
+    CONFIG["hang_seconds"] = args.hang_seconds
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
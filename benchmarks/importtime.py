@@ -0,0 +1,101 @@
+"""
+Cold import time of the API and what importing it leaves behind.
+
+Runs `python -X importtime -c "import main"` in fresh interpreters with
+DATABASE_URL, GROQ_API_KEY and .env out of the picture, so it also checks
+that importing the app needs no secrets and builds no engine or LLM
+client. Reports the median total and the slowest top-level imports.
+
+    python -m benchmarks.importtime --runs 5 --top 15
+    python -m benchmarks.importtime --budget-ms 2000   # non-zero exit when over budget
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Printed by the child after the import so the parent can check for side effects
+PROBE = (
+    "import sys, main, database, llm_backends; "
+    "print('engine_built=%s' % (database._engine is not None)); "
+    "print('backends_built=%d' % len(llm_backends.router.backends)); "
+    "print('groq_imported=%s' % ('groq' in sys.modules)); "
+    "print('httpx_imported=%s' % ('httpx' in sys.modules))"
+)
+
+_LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def run_once(module: str) -> tuple:
+    """(total microseconds, {top-level module: cumulative microseconds}, probe output)"""
+    env = {k: v for k, v in os.environ.items() if k not in ("DATABASE_URL", "GROQ_API_KEY")}
+    code = PROBE if module == "main" else f"import {module}"
+    # An empty working directory keeps load_dotenv() from finding a .env file
+    with tempfile.TemporaryDirectory() as cwd:
+        env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                                capture_output=True, text=True, env=env, cwd=cwd)
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr.splitlines()[-1]}")
+
+    # A module's line comes after those of the modules it imported, which
+    # are indented one level deeper
+    total = 0
+    top_level = {}
+    children = {}
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if depth == 3:
+            children[name] = cumulative
+        elif depth == 1:
+            if name == module:
+                total, top_level = cumulative, children
+            children = {}
+    return total, top_level, result.stdout.strip()
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import time of the API")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Slowest direct imports to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail when the median exceeds this")
+    args = parser.parse_args()
+
+    totals = []
+    per_module = {}
+    probe = ""
+    for _ in range(args.runs):
+        total, top_level, probe = run_once(args.module)
+        totals.append(total)
+        for name, micros in top_level.items():
+            per_module.setdefault(name, []).append(micros)
+
+    median_ms = statistics.median(totals) / 1000
+    print(f"import {args.module}: median {median_ms:.1f} ms, "
+          f"min {min(totals) / 1000:.1f} ms, max {max(totals) / 1000:.1f} ms over {args.runs} runs")
+    print(f"\n{'module':<32} {'median ms':>10}")
+    slowest = sorted(per_module.items(), key=lambda item: -statistics.median(item[1]))
+    for name, values in slowest[:args.top]:
+        print(f"{name:<32} {statistics.median(values) / 1000:>10.1f}")
+
+    failed = False
+    if probe:
+        print()
+        for line in probe.splitlines():
+            print(line)
+        # Importing the app must not connect to the database or build LLM clients
+        failed = "engine_built=True" in probe or "backends_built=0" not in probe
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        print(f"\nOver budget: {median_ms:.1f} ms > {args.budget_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Load test for the async review_logic path against the fake LLM server.
+
+Starts benchmarks.fake_llm_server in a subprocess, then runs
+analyze_writeup_async at increasing concurrency levels and prints the
+throughput for each. With a fixed per-call latency, throughput should
+grow linearly with concurrency up to LLM_MAX_CONCURRENCY.
+
+    python -m benchmarks.llm_concurrency --latency 0.2 --levels 1 2 4 8 16 32
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port: int, timeout: float = 15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+async def run_level(concurrency: int, rounds: int) -> float:
+    from review_logic import analyze_writeup_async
+
+    total = concurrency * rounds
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait("The quick brown fox jumps over the lazy dog. " * 20)
+
+    async def worker():
+        while not queue.empty():
+            text = queue.get_nowait()
+            result = await analyze_writeup_async(text)
+            if result["scores"]["grammar"] == 0:
+                raise RuntimeError(result["overall_feedback"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+async def run_all(levels, rounds):
+    results = []
+    for level in levels:
+        results.append((level, await run_level(level, rounds)))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Async LLM path throughput vs concurrency")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM seconds per completion")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--rounds", type=int, default=5, help="Requests per worker at each level")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_llm_server",
+        "--port", str(port), "--latency", str(args.latency)
+    ])
+    try:
+        wait_for_port(port)
+        os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{port}"
+        os.environ.setdefault("GROQ_API_KEY", "fake-key")
+        os.environ["LLM_MAX_CONCURRENCY"] = str(max(args.levels))
+        # Measure the async path itself, not the client-side rate limiter
+        os.environ["LLM_RPM_LIMIT"] = "0"
+        os.environ["LLM_TPM_LIMIT"] = "0"
+
+        results = asyncio.run(run_all(args.levels, args.rounds))
+    finally:
+        server.terminate()
+        server.wait()
+
+    base = results[0][1] / results[0][0]
+    print(f"{'concurrency':>12} {'req/s':>10} {'speedup':>10} {'linearity':>10}")
+    for level, rps in results:
+        print(f"{level:>12} {rps:>10.2f} {rps / results[0][1]:>10.2f} {rps / (base * level):>10.0%}")
+
+if __name__ == "__main__":
+    main()
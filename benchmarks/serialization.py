@@ -0,0 +1,112 @@
+"""
+Serialization cost and payload size of a /history page, before and after
+rendering with orjson from row tuples.
+
+Rows are read once from a temporary SQLite database with the same
+select() /history uses. "before" builds each item with getattr, runs the
+payload through jsonable_encoder and renders it with JSONResponse, as
+FastAPI does for a returned dict. "after" zips each row tuple into a dict
+and renders it with ORJSONResponse. Payload sizes are reported raw, gzip
+and Brotli (when installed) compressed by compression.CompressionMiddleware.
+
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlmodel import Session, SQLModel, select
+
+import history
+from compression import CompressionMiddleware
+from database import make_engine
+from models import ReviewResult, score_columns
+
+SCORES = {"grammar": 80, "clarity": 75, "structure": 70}
+
+def seed(engine, rows: int):
+    SQLModel.metadata.create_all(engine)
+    started = datetime.datetime(2024, 1, 1)
+    with Session(engine) as session:
+        for i in range(rows):
+            session.add(ReviewResult(
+                filename=f"bench_{i}.txt",
+                review_type="writeup",
+                scores=SCORES,
+                **score_columns(SCORES),
+                feedback="Clear argument, but the second section needs sources. " * 8,
+                full_response="{}",
+                created_at=started + datetime.timedelta(seconds=i)
+            ))
+        session.commit()
+
+def fetch(engine, selected: list, before: bool) -> list:
+    if before:
+        names = dict.fromkeys(["id", "created_at"] + selected)
+    else:
+        names = selected + [name for name in ("id", "created_at") if name not in selected]
+    statement = history.apply_cursor(select(*[getattr(ReviewResult, name) for name in names]), None)
+    with Session(engine) as session:
+        return session.exec(statement).all()
+
+def render_before(rows: list, selected: list) -> bytes:
+    payload = {"items": [{name: getattr(row, name) for name in selected} for row in rows], "next_cursor": None}
+    return JSONResponse(jsonable_encoder(payload)).body
+
+def render_after(rows: list, selected: list) -> bytes:
+    payload = {"items": [dict(zip(selected, row)) for row in rows], "next_cursor": None}
+    return ORJSONResponse(payload).body
+
+def timed(func, repeat: int) -> tuple:
+    """(median milliseconds, last result)"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description="/history page serialization benchmark")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows on the page")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fields", default=None, help="fields= projection, as for /history")
+    args = parser.parse_args()
+
+    selected = history.parse_fields(args.fields)
+    compressor = CompressionMiddleware(app=None)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed(engine, args.rows)
+
+        results = {}
+        for label, before, render in (("before", True, render_before), ("after", False, render_after)):
+            rows = fetch(engine, selected, before)
+            ms, body = timed(lambda: render(rows, selected), args.repeat)
+            results[label] = (ms, body)
+        engine.dispose()
+
+    before_ms, before_body = results["before"]
+    after_ms, after_body = results["after"]
+    print(f"{args.rows} rows, fields={','.join(selected)}, median of {args.repeat}")
+    print(f"\n{'':<8} {'serialize ms':>13} {'bytes':>11}")
+    print(f"{'before':<8} {before_ms:>13.1f} {len(before_body):>11}")
+    print(f"{'after':<8} {after_ms:>13.1f} {len(after_body):>11}")
+    print(f"speedup  {before_ms / after_ms:>12.1f}x")
+
+    encodings = ["gzip"] + (["br"] if compressor.brotli is not None else [])
+    print(f"\n{'encoding':<8} {'compress ms':>13} {'bytes':>11} {'ratio':>7}")
+    for encoding in encodings:
+        ms, compressed = timed(lambda: compressor.compress(after_body, encoding), args.repeat)
+        print(f"{encoding:<8} {ms:>13.1f} {len(compressed):>11} {len(after_body) / len(compressed):>6.1f}x")
+    if compressor.brotli is None:
+        print("(install brotli to compare Brotli)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import copy
+import json
+import hashlib
+import threading
+import datetime
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select, delete
+
+from database import get_engine
+from models import CachedResponse
+from review_logic import PROMPT_VERSION, TEMPERATURE, is_error_result
+from llm_backends import router
+from metrics import cache_requests, db_operation_seconds
+
+# In-memory tier: number of results kept per worker process
+CACHE_MEMORY_SIZE = int(os.getenv("CACHE_MEMORY_SIZE", "1024"))
+# How long a cached result stays valid (both tiers)
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Persistent tier: rows kept in the database before the oldest are evicted
+CACHE_DB_MAX_ENTRIES = int(os.getenv("CACHE_DB_MAX_ENTRIES", "100000"))
+# Run expiry/eviction on the persistent tier every N writes
+CACHE_DB_EVICT_EVERY = 100
+
+def normalize_text(text: str) -> str:
+    """Normalize input so trivially different resubmissions share a cache entry"""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.strip().split("\n"))
+
+def make_cache_key(review_type: str, text: str, language: Optional[str] = None) -> str:
+    """Content-addressed key for a review_logic call"""
+    material = json.dumps([
+        review_type,
+        (language or "").lower(),
+        router.route_spec(review_type),
+        PROMPT_VERSION,
+        TEMPERATURE,
+        normalize_text(text),
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Small thread-safe LRU with per-entry expiry"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= datetime.datetime.utcnow():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value, expires_at: datetime.datetime):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """Two-tier cache (memory LRU + database) in front of review_logic"""
+
+    def __init__(self, memory_size: int = CACHE_MEMORY_SIZE, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 db_max_entries: int = CACHE_DB_MAX_ENTRIES):
+        self.memory = LRUCache(memory_size)
+        self.ttl = datetime.timedelta(seconds=ttl_seconds)
+        self.db_max_entries = db_max_entries
+        self._writes = 0
+        self._stats_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+    def _count(self, name: str, review_type: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+        cache_requests.inc(review_type=review_type, result=name)
+
+    def _db_get(self, key: str):
+        with db_operation_seconds.time(operation="cache_read"), Session(get_engine()) as session:
+            row = session.get(CachedResponse, key)
+            if row is None or row.expires_at <= datetime.datetime.utcnow():
+                return None
+            return json.loads(row.result), row.expires_at
+
+    def _db_put(self, key: str, review_type: str, value, expires_at: datetime.datetime):
+        with db_operation_seconds.time(operation="cache_write"), Session(get_engine()) as session:
+            session.merge(CachedResponse(
+                key=key,
+                review_type=review_type,
+                result=json.dumps(value),
+                expires_at=expires_at
+            ))
+            session.commit()
+            with self._stats_lock:
+                self._writes += 1
+                evict = self._writes % CACHE_DB_EVICT_EVERY == 0
+            if evict:
+                self._evict(session)
+
+    def _evict(self, session: Session):
+        """Drop expired rows, then the oldest rows beyond db_max_entries"""
+        session.exec(delete(CachedResponse).where(CachedResponse.expires_at <= datetime.datetime.utcnow()))
+        cutoff = session.exec(
+            select(CachedResponse.created_at)
+            .order_by(CachedResponse.created_at.desc())
+            .offset(self.db_max_entries)
+            .limit(1)
+        ).first()
+        if cutoff is not None:
+            session.exec(delete(CachedResponse).where(CachedResponse.created_at <= cutoff))
+        session.commit()
+
+    async def get_or_compute(
+        self,
+        review_type: str,
+        text: str,
+        language: Optional[str],
+        compute: Callable[[], Awaitable[Any]],
+        no_cache: bool = False,
+    ) -> Tuple[Any, str]:
+        """
+        Return (result, cache_status) where cache_status is "hit", "miss" or "bypass".
+        Error results are never stored.
+        """
+        if no_cache:
+            self.count_bypass(review_type)
+            return await compute(), "bypass"
+
+        value = await self.lookup(review_type, text, language)
+        if value is not None:
+            return value, "hit"
+
+        value = await compute()
+        await self.store(review_type, text, language, value)
+        return value, "miss"
+
+    def count_bypass(self, review_type: str):
+        self._count("bypassed", review_type)
+
+    async def lookup(self, review_type: str, text: str, language: Optional[str]):
+        """Return a copy of the cached result, or None (counted as a miss)"""
+        key = make_cache_key(review_type, text, language)
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits", review_type)
+            return copy.deepcopy(value)
+
+        stored = await run_in_threadpool(self._db_get, key)
+        if stored is not None:
+            value, expires_at = stored
+            self.memory.put(key, copy.deepcopy(value), expires_at)
+            self._count("db_hits", review_type)
+            return value
+
+        self._count("misses", review_type)
+        return None
+
+    async def store(self, review_type: str, text: str, language: Optional[str], value):
+        """Cache a freshly computed result unless it is an error"""
+        if is_error_result(value):
+            return
+        key = make_cache_key(review_type, text, language)
+        expires_at = datetime.datetime.utcnow() + self.ttl
+        self.memory.put(key, copy.deepcopy(value), expires_at)
+        await run_in_threadpool(self._db_put, key, review_type, value, expires_at)
+        self._count("stores", review_type)
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        hits = stats["memory_hits"] + stats["db_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,170 @@
+"""
+Split long inputs into pieces that fit an LLM token budget.
+
+Prose is split on section headings and paragraphs, code on top-level
+definitions, so each chunk is something a reviewer could comment on by
+itself. Pieces are packed greedily up to the budget. Anything still too
+big (a giant paragraph or function) falls back to sentence or line
+splits.
+"""
+import os
+import re
+from typing import List, NamedTuple
+
+# Rough token estimate for Llama-style tokenizers on English text and code
+CHARS_PER_TOKEN = 4
+
+WRITEUP_CHUNK_TOKENS = int(os.getenv("WRITEUP_CHUNK_TOKENS", "1200"))
+PLAGIARISM_CHUNK_TOKENS = int(os.getenv("PLAGIARISM_CHUNK_TOKENS", "1000"))
+CODE_CHUNK_TOKENS = int(os.getenv("CODE_CHUNK_TOKENS", "2000"))
+
+
+class TextChunk(NamedTuple):
+    text: str
+    first_paragraph: int  # 1-based, in the whole document
+    last_paragraph: int
+
+class CodeChunk(NamedTuple):
+    text: str
+    first_line: int  # 1-based, in the whole file
+    last_line: int
+
+
+_HEADING_RE = re.compile(r"^\s*(#{1,6}\s+\S|\d+(\.\d+)*[.)]?\s+[A-Z]|[A-Z][A-Z0-9 ,:'-]{3,}$)")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def paragraphs(text: str) -> List[str]:
+    """Blank-line separated paragraphs; a heading line always starts a new one"""
+    result = []
+    current = []
+    for line in text.replace("\r\n", "\n").split("\n"):
+        if not line.strip():
+            if current:
+                result.append("\n".join(current))
+                current = []
+            continue
+        if current and _HEADING_RE.match(line):
+            result.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        result.append("\n".join(current))
+    return result
+
+def _split_oversized(piece: str, max_chars: int) -> List[str]:
+    """Sentence splits, then hard splits, for a paragraph bigger than a chunk"""
+    parts = []
+    current = ""
+    for sentence in _SENTENCE_RE.split(piece):
+        while len(sentence) > max_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            parts.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+def split_text(text: str, max_tokens: int, label: bool = True) -> List[TextChunk]:
+    """
+    Pack paragraphs into chunks of at most max_tokens. With label=True,
+    paragraphs are numbered in the chunk text as [P1], [P2], ... so
+    feedback can refer to them.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    first = 1
+    size = 0
+
+    def flush(last: int):
+        nonlocal current, size, first
+        if current:
+            chunks.append(TextChunk("\n\n".join(current), first, last))
+        current = []
+        size = 0
+        first = last + 1
+
+    for number, paragraph in enumerate(paragraphs(text), start=1):
+        labelled = f"[P{number}] {paragraph}" if label else paragraph
+        if len(labelled) > max_chars:
+            flush(number - 1)
+            for part in _split_oversized(labelled, max_chars):
+                chunks.append(TextChunk(part, number, number))
+            first = number + 1
+            continue
+        if current and size + len(labelled) + 2 > max_chars:
+            flush(number - 1)
+        current.append(labelled)
+        size += len(labelled) + 2
+    flush(first + len(current) - 1)
+    return chunks
+
+def _top_level_starts(lines: List[str], language: str) -> List[int]:
+    """Line indexes where a top-level block (function, class, statement) begins"""
+    starts = [0]
+    if (language or "").lower() == "python":
+        for i, line in enumerate(lines[1:], start=1):
+            if line and not line[0].isspace() and not lines[i - 1].lstrip().startswith("@"):
+                starts.append(i)
+        return starts
+
+    # Brace languages: a new block starts on a non-blank line at depth 0
+    depth = 0
+    for i, line in enumerate(lines):
+        if i and depth == 0 and line.strip():
+            starts.append(i)
+        depth = max(0, depth + line.count("{") - line.count("}"))
+    return starts
+
+def split_code(code: str, language: str, max_tokens: int) -> List[CodeChunk]:
+    """Pack top-level blocks into chunks of at most max_tokens, keeping line numbers"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    lines = code.replace("\r\n", "\n").split("\n")
+    if len(code) <= max_chars:
+        return [CodeChunk(code, 1, len(lines))]
+
+    starts = _top_level_starts(lines, language) + [len(lines)]
+    blocks = [(starts[i], starts[i + 1]) for i in range(len(starts) - 1) if starts[i] < starts[i + 1]]
+
+    chunks = []
+    chunk_start = None
+    size = 0
+    for start, end in blocks:
+        block_size = sum(len(line) + 1 for line in lines[start:end])
+        if chunk_start is not None and size + block_size > max_chars:
+            chunks.append(CodeChunk("\n".join(lines[chunk_start:start]), chunk_start + 1, start))
+            chunk_start = None
+            size = 0
+        if block_size > max_chars:
+            # One huge block: split it on line boundaries
+            line_start = start
+            size = 0
+            for i in range(start, end):
+                if i > line_start and size + len(lines[i]) + 1 > max_chars:
+                    chunks.append(CodeChunk("\n".join(lines[line_start:i]), line_start + 1, i))
+                    line_start = i
+                    size = 0
+                size += len(lines[i]) + 1
+            chunk_start = line_start
+            continue
+        if chunk_start is None:
+            chunk_start = start
+        size += block_size
+    if chunk_start is not None:
+        chunks.append(CodeChunk("\n".join(lines[chunk_start:len(lines)]), chunk_start + 1, len(lines)))
+    return [chunk for chunk in chunks if chunk.text.strip()]
+
+def weighted_mean(values: List[float], weights: List[float]) -> float:
+    total = sum(weights)
+    if not total:
+        return sum(values) / len(values) if values else 0
+    return sum(v * w for v, w in zip(values, weights)) / total
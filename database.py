@@ -1,16 +1,183 @@
+"""
+Engine construction and schema setup.
+
+Importing this module has no side effects: the engine is built on the
+first get_engine() call, so tools and tests can import the app without a
+DATABASE_URL, and each process (uvicorn or job worker) builds its own
+engine after fork. Environment files are loaded by the entry points
+(main.py, worker.py), not here.
+"""
 import os
+import logging
+import threading
+from typing import List, Tuple
 from sqlmodel import SQLModel, create_engine
-from dotenv import load_dotenv
+from sqlalchemy import inspect, text, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+# Engine settings, all overridable from the environment
+DB_ECHO = _env_bool("DB_ECHO", False)
+
+# SQLite: WAL lets readers run alongside the single writer, NORMAL sync
+# only fsyncs at checkpoints, and busy_timeout makes writers wait for the
+# lock instead of failing with "database is locked".
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative values are KiB, so -65536 is a 64 MB page cache per connection
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+
+# MySQL / Postgres connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+
+def database_url() -> str:
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise ValueError("DATABASE_URL not found in .env file")
+    return url
 
-load_dotenv()
+def make_engine(url: str = None):
+    """
+    Build an engine tuned for the backend in url (defaults to DATABASE_URL):
+    pragmas for SQLite, pool sizing and health checks for everything else.
+    """
+    url = url or database_url()
+    backend = make_url(url).get_backend_name()
 
-# Correct: Get the variable by its name "DATABASE_URL"
-DATABASE_URL = os.getenv("DATABASE_URL") 
+    if backend != "sqlite":
+        return create_engine(
+            url,
+            echo=DB_ECHO,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
 
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL not found in .env file")
+    in_memory = make_url(url).database in (None, "", ":memory:")
+    new_engine = create_engine(
+        url,
+        echo=DB_ECHO,
+        # Sessions are used from FastAPI's threadpool
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    )
 
-engine = create_engine(DATABASE_URL, echo=False)
+    @event.listens_for(new_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.close()
+
+    return new_engine
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    """The process-wide engine, built from DATABASE_URL on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = make_engine()
+    return _engine
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    engine = get_engine()
+    try:
+        SQLModel.metadata.create_all(engine)
+    except DBAPIError:
+        # Another process starting at the same time created a table between
+        # the existence check and CREATE TABLE; the second pass skips it
+        SQLModel.metadata.create_all(engine)
+    add_missing_columns()
+    create_missing_indexes()
+
+    # Imported here because migrations needs the models registered first
+    import migrations
+    migrations.run_pending(engine)
+
+def add_missing_columns():
+    """
+    create_all() only creates missing tables, so columns added to a model
+    after its table exists (e.g. Submission.minhash) are added here.
+    New columns must be nullable.
+    """
+    engine = get_engine()
+    inspector = inspect(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            except DBAPIError:
+                # Fine if a process starting at the same time added it first
+                if column.name not in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+                    raise
+                continue
+            logger.info("added column", extra={"table": table.name, "column": column.name})
+
+def create_missing_indexes():
+    """Like add_missing_columns, for indexes declared on tables that already exist"""
+    engine = get_engine()
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(engine, checkfirst=True)
+            except DBAPIError:
+                if index.name not in {i["name"] for i in inspect(engine).get_indexes(table.name)}:
+                    raise
+
+def upsert_sums(connection, table, keys: Tuple[str, ...], rows: List[dict], sums: Tuple[str, ...]):
+    """Insert rows, adding their sums columns onto rows with the same keys that already exist"""
+    dialect = connection.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + statement.excluded[name] for name in sums}
+        )
+        connection.execute(statement, rows)
+    elif dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        statement = statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in sums}
+        )
+        connection.execute(statement, rows)
+    else:
+        for row in rows:
+            updated = connection.execute(
+                table.update()
+                .where(*[table.c[key] == row[key] for key in keys])
+                .values({name: table.c[name] + row[name] for name in sums})
+            )
+            if updated.rowcount == 0:
+                connection.execute(table.insert().values(row))
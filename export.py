@@ -0,0 +1,166 @@
+"""
+Streamed export of review history as CSV, NDJSON or Parquet.
+
+Rows are read with a server-side cursor (stream_results / yield_per) in
+EXPORT_BATCH_ROWS batches. Each batch is encoded and sent as one chunk
+of a chunked response before the next one is fetched, so memory stays
+the same however many rows match. Filters and field names are the ones
+/history takes.
+
+Database reads and encoding run on the threadpool, one batch per call.
+When the client disconnects, Starlette cancels the response.
+stream_export() then closes the row generator, which closes the cursor
+and returns the connection to the pool.
+
+Parquet needs pyarrow, which is optional. Each batch becomes one row
+group.
+"""
+import io
+import os
+import csv
+import json
+import importlib
+from typing import AsyncIterator, Callable, Dict, Iterator, List
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+
+import history
+from database import get_engine
+from models import ReviewResult
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Every field except id, the score columns and created_at is text; JSON
+# columns are written as their JSON text
+INTEGER_FIELDS = ("id",)
+FLOAT_FIELDS = ("grammar", "clarity", "structure", "plagiarism_score")
+JSON_FIELDS = ("scores",)
+
+
+def parquet_available() -> bool:
+    try:
+        importlib.import_module("pyarrow.parquet")
+    except ImportError:
+        return False
+    return True
+
+def _rows(statement) -> Iterator[List[tuple]]:
+    """Batches of rows from a server-side cursor; closing the generator releases it"""
+    with get_engine().connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS).execute(statement)
+        try:
+            for batch in result.partitions():
+                yield batch
+        finally:
+            result.close()
+
+def _converters(fields: List[str]) -> Dict[int, Callable]:
+    """Column index -> text conversion, only for the columns that need one"""
+    converters = {}
+    for i, name in enumerate(fields):
+        if name == "created_at":
+            converters[i] = lambda value: value.isoformat() if value is not None else None
+        elif name in JSON_FIELDS:
+            converters[i] = lambda value: json.dumps(value) if value is not None else None
+    return converters
+
+def _convert(batch: List[tuple], converters: Dict[int, Callable]) -> List[tuple]:
+    if not converters:
+        return batch
+    converted = []
+    for row in batch:
+        row = list(row)
+        for i, convert in converters.items():
+            row[i] = convert(row[i])
+        converted.append(row)
+    return converted
+
+
+# --- Encoders: one per format, each turns a batch of rows into one chunk ---
+
+def _csv(fields: List[str], batches: Iterator[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    converters = _converters(fields)
+    for batch in batches:
+        # csv writes None as an empty field
+        writer.writerows(_convert(batch, converters))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only: nothing matched
+        yield buffer.getvalue().encode("utf-8")
+
+def _ndjson(fields: List[str], batches: Iterator[List[tuple]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in batch)
+
+def _parquet_schema(pa, fields: List[str]):
+    types = []
+    for name in fields:
+        if name in INTEGER_FIELDS:
+            types.append(pa.int64())
+        elif name in FLOAT_FIELDS:
+            types.append(pa.float64())
+        elif name == "created_at":
+            types.append(pa.timestamp("us"))
+        else:
+            types.append(pa.string())
+    return pa.schema(list(zip(fields, types)))
+
+def _parquet(fields: List[str], batches: Iterator[List[tuple]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(pa, fields)
+    converters = {i: convert for i, convert in _converters(fields).items() if fields[i] in JSON_FIELDS}
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        chunk = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return chunk
+
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            columns = list(zip(*_convert(batch, converters))) if batch else [[] for _ in fields]
+            writer.write_table(pa.Table.from_arrays([list(column) for column in columns], schema=schema))
+            yield drain()
+    finally:
+        writer.close()
+    yield drain()
+
+ENCODERS = {"csv": _csv, "ndjson": _ndjson, "parquet": _parquet}
+
+
+def export_rows(fmt: str, fields: List[str], **filters) -> Iterator[bytes]:
+    """Encoded chunks of every ReviewResult matching the /history filters, newest first"""
+    statement = history.apply_filters(select(*[getattr(ReviewResult, name) for name in fields]), **filters)
+    statement = history.apply_cursor(statement, None)
+    batches = _rows(statement)
+    try:
+        yield from ENCODERS[fmt](fields, batches)
+    finally:
+        batches.close()
+
+async def stream_export(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Pull chunks on the threadpool; on disconnect, release the cursor straight away"""
+    try:
+        while True:
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                yield chunk
+    finally:
+        chunks.close()
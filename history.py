@@ -0,0 +1,80 @@
+"""
+Query helpers for the review history endpoints.
+
+History is paged with keyset cursors on (created_at, id), newest first,
+so each page is an index range scan no matter how deep the client pages.
+"""
+import json
+import base64
+import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+from models import ReviewResult
+
+# Columns the list view may request; full_response is only served by /history/{id}
+LIST_FIELDS = (
+    "id", "filename", "review_type", "scores", "feedback", "created_at",
+    "grammar", "clarity", "structure", "plagiarism_score",
+)
+DEFAULT_FIELDS = ("id", "filename", "review_type", "scores", "feedback", "created_at")
+# /export may also include the full response
+EXPORT_FIELDS = LIST_FIELDS + ("full_response",)
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def encode_cursor(created_at: datetime.datetime, review_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), review_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """Raises ValueError for anything that isn't a cursor we issued"""
+    try:
+        created_at, review_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.datetime.fromisoformat(created_at), int(review_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def parse_fields(fields: Optional[str], allowed: Tuple[str, ...] = LIST_FIELDS,
+                 default: Tuple[str, ...] = DEFAULT_FIELDS) -> List[str]:
+    """Validate a comma-separated fields= projection; repeated names are dropped"""
+    if not fields:
+        return list(default)
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return requested
+
+def apply_filters(statement, review_type: Optional[str] = None, filename: Optional[str] = None,
+                  since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None,
+                  min_plagiarism_score: Optional[float] = None, max_plagiarism_score: Optional[float] = None):
+    """
+    Shared filters: review_type and filename match exactly, since <= created_at < until,
+    and min <= plagiarism_score <= max.
+    """
+    if review_type:
+        statement = statement.where(ReviewResult.review_type == review_type)
+    if filename:
+        statement = statement.where(ReviewResult.filename == filename)
+    if since:
+        statement = statement.where(ReviewResult.created_at >= since)
+    if until:
+        statement = statement.where(ReviewResult.created_at < until)
+    if min_plagiarism_score is not None:
+        statement = statement.where(ReviewResult.plagiarism_score >= min_plagiarism_score)
+    if max_plagiarism_score is not None:
+        statement = statement.where(ReviewResult.plagiarism_score <= max_plagiarism_score)
+    return statement
+
+def apply_cursor(statement, cursor: Optional[str]):
+    """Order newest first and continue after the cursor row"""
+    if cursor:
+        created_at, review_id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            ReviewResult.created_at < created_at,
+            and_(ReviewResult.created_at == created_at, ReviewResult.id < review_id)
+        ))
+    return statement.order_by(ReviewResult.created_at.desc(), ReviewResult.id.desc())
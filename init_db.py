@@ -1,5 +1,10 @@
+from dotenv import load_dotenv
+
+# Load environment variables before database reads its settings
+load_dotenv()
+
 from sqlmodel import SQLModel
-from database import engine  # Imports the engine from your existing database.py
+from database import get_engine
 import models # By importing models, SQLModel knows about your tables
 
 def reset_database():
@@ -16,11 +21,11 @@ def reset_database():
         print("\nDropping all tables...")
         # We must import all models (like ReviewResult, Submission) in 'models.py'
         # so that SQLModel.metadata knows about them.
-        SQLModel.metadata.drop_all(engine)
+        SQLModel.metadata.drop_all(get_engine())
         print("All tables dropped.")
         
         print("\nCreating all tables...")
-        SQLModel.metadata.create_all(engine)
+        SQLModel.metadata.create_all(get_engine())
         print("All tables created successfully based on your models.py.")
         print("Database is now in sync!")
     else:
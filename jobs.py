@@ -0,0 +1,204 @@
+"""
+Durable job queue for long-running reviews, stored in the Job table.
+
+POST /jobs enqueues a review and returns at once. Worker processes
+(worker.py) claim jobs highest priority first, run them through
+review_service, and record the result. Failed jobs are retried with
+exponential backoff up to max_attempts, and never before the provider's
+retry_after when the LLM was unavailable. A job whose worker stops
+heartbeating for JOB_LEASE_SECONDS is put back in the queue, or failed if
+that was its last attempt.
+
+callback_url must be an http(s) URL whose host resolves to public
+addresses only, so jobs cannot be used to make the workers POST to
+internal services. Set JOB_CALLBACK_ALLOW_PRIVATE=true to allow private
+and loopback hosts (e.g. for local development).
+"""
+import os
+import json
+import uuid
+import socket
+import datetime
+import ipaddress
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from models import Job
+
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+JOB_CALLBACK_ALLOW_PRIVATE = os.getenv("JOB_CALLBACK_ALLOW_PRIVATE", "false").lower() in ("1", "true", "yes")
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+def validate_callback_url(url: str) -> str:
+    """Raise ValueError unless url is an http(s) URL on a public host"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url must be an http or https URL with a host")
+    if parts.username or parts.password:
+        raise ValueError("callback_url must not contain credentials")
+    if JOB_CALLBACK_ALLOW_PRIVATE:
+        return url
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)}
+    except (ValueError, OSError) as e:
+        raise ValueError(f"callback_url host cannot be resolved: {parts.hostname}") from e
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"callback_url must point to a public host, not {address}")
+    return url
+
+def enqueue(engine, review_type: str, text: str, filename: Optional[str] = None,
+            language: Optional[str] = None, no_cache: bool = False, priority: int = 0,
+            callback_url: Optional[str] = None, max_attempts: int = 3) -> Job:
+    """Raises ValueError for a callback_url validate_callback_url rejects"""
+    if callback_url is not None:
+        validate_callback_url(callback_url)
+    job = Job(
+        id=uuid.uuid4().hex,
+        review_type=review_type,
+        payload=json.dumps({"text": text, "filename": filename, "language": language, "no_cache": no_cache}),
+        priority=priority,
+        callback_url=callback_url,
+        max_attempts=max_attempts
+    )
+    with Session(engine) as session:
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+    return job
+
+def get_job(engine, job_id: str) -> Optional[Job]:
+    with Session(engine) as session:
+        return session.get(Job, job_id)
+
+def cancel(engine, job_id: str) -> bool:
+    """Cancel a queued or running job; False if it already finished"""
+    with Session(engine) as session:
+        updated = session.exec(
+            update(Job)
+            .where(Job.id == job_id, Job.status.in_(ACTIVE_STATUSES))
+            .values(status="cancelled", finished_at=_now())
+        )
+        session.commit()
+        return updated.rowcount == 1
+
+def requeue_stale(engine) -> List[Job]:
+    """
+    Put back jobs whose worker died mid-run. claim_next counts every run as
+    an attempt, so a job that keeps killing its worker is failed once it
+    has used max_attempts. Returns the jobs failed here.
+    """
+    cutoff = _now() - datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+    stale = (Job.status == "running", Job.heartbeat_at < cutoff)
+    failed = []
+    with Session(engine) as session:
+        for job_id in session.exec(select(Job.id).where(*stale, Job.attempts >= Job.max_attempts)).all():
+            # Conditional, so only one worker fails (and reports) each job
+            updated = session.exec(
+                update(Job)
+                .where(Job.id == job_id, *stale)
+                .values(status="failed", worker=None, finished_at=_now(),
+                        error="Worker stopped heartbeating on the last attempt")
+            )
+            if updated.rowcount == 1:
+                failed.append(job_id)
+        session.exec(update(Job).where(*stale).values(status="queued", worker=None))
+        session.commit()
+        return [session.get(Job, job_id) for job_id in failed]
+
+def claim_next(engine, worker_id: str) -> Optional[Job]:
+    """
+    Atomically take the next runnable job. The conditional UPDATE makes
+    this safe across processes: if another worker won the race, try again.
+    """
+    with Session(engine) as session:
+        for _ in range(5):
+            job_id = session.exec(
+                select(Job.id)
+                .where(Job.status == "queued", Job.run_after <= _now())
+                .order_by(Job.priority.desc(), Job.run_after, Job.created_at)
+                .limit(1)
+            ).first()
+            if job_id is None:
+                return None
+            now = _now()
+            claimed = session.exec(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "queued")
+                .values(status="running", worker=worker_id, attempts=Job.attempts + 1,
+                        started_at=now, heartbeat_at=now)
+            )
+            session.commit()
+            if claimed.rowcount == 1:
+                return session.get(Job, job_id)
+    return None
+
+def heartbeat(engine, job_id: str) -> str:
+    """Extend the lease and return the job's current status"""
+    with Session(engine) as session:
+        session.exec(update(Job).where(Job.id == job_id, Job.status == "running").values(heartbeat_at=_now()))
+        session.commit()
+        return session.exec(select(Job.status).where(Job.id == job_id)).one()
+
+def complete(engine, job_id: str, result: dict) -> bool:
+    """Record success unless the job was cancelled meanwhile"""
+    with Session(engine) as session:
+        updated = session.exec(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "running")
+            .values(status="succeeded", result=json.dumps(result), error=None, finished_at=_now())
+        )
+        session.commit()
+        return updated.rowcount == 1
+
+def fail(engine, job_id: str, error: str, retry_after: Optional[float] = None) -> str:
+    """
+    Schedule a retry with backoff, or mark failed after max_attempts.
+    retry_after (e.g. from an open circuit breaker) is the shortest wait,
+    so a provider outage does not use up every attempt while it lasts.
+    """
+    with Session(engine) as session:
+        job = session.get(Job, job_id)
+        if job is None or job.status != "running":
+            return job.status if job else "missing"
+        job.error = error
+        if job.attempts < job.max_attempts:
+            delay = max(JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), retry_after or 0)
+            job.status = "queued"
+            job.run_after = _now() + datetime.timedelta(seconds=delay)
+        else:
+            job.status = "failed"
+            job.finished_at = _now()
+        session.add(job)
+        session.commit()
+        return job.status
+
+def to_dict(job: Job) -> dict:
+    """Public view of a job for the API and callbacks"""
+    data = {
+        "job_id": job.id,
+        "review_type": job.review_type,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+    if job.result is not None:
+        data["result"] = json.loads(job.result)
+    if job.error is not None:
+        data["error"] = job.error
+    return data
@@ -0,0 +1,519 @@
+"""
+LLM backends and per-review-type routing.
+
+Three kinds of backend share one interface (complete / complete_async /
+stream_async over chat messages):
+
+- groq:  the hosted Groq API (needs GROQ_API_KEY)
+- local: any OpenAI-compatible server such as llama.cpp or vLLM
+         (LOCAL_LLM_BASE_URL, LOCAL_LLM_API_KEY)
+- stub:  a deterministic offline backend for CI and demos
+
+Routes are a comma-separated fallback chain of kind:model entries, set by
+LLM_ROUTE for every review type and LLM_ROUTE_<TYPE> per review type:
+
+    LLM_ROUTE=groq:llama-3.1-8b-instant
+    LLM_ROUTE_PLAGIARISM=local:qwen2.5-1.5b-instruct,groq:llama-3.1-8b-instant
+    LLM_ROUTE_CODE=groq:llama-3.3-70b-versatile,local:qwen2.5-coder-7b
+
+A call goes to the first backend in the chain that is healthy, and moves
+down the chain when a backend is unavailable or cannot be set up (e.g. no
+GROQ_API_KEY). Backends are built the first time a call tries them.
+Backends whose recent latency is above LLM_FALLBACK_LATENCY_SECONDS are
+tried after the fast ones, so load shifts away from a slow provider
+without waiting for it to fail outright. The average halves every
+LLM_LATENCY_HALF_LIFE_SECONDS without a new call, so a demoted backend is
+tried again once it has been idle long enough.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import weakref
+import logging
+import threading
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, NamedTuple, Optional
+
+from llm_transport import LLMTransport, LLMUnavailableError, LLM_TIMEOUT_SECONDS
+from metrics import llm_calls, llm_tokens
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROUTE = "groq:llama-3.1-8b-instant"
+LLM_ROUTE = os.getenv("LLM_ROUTE", DEFAULT_ROUTE)
+LOCAL_LLM_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "http://127.0.0.1:8080/v1")
+LOCAL_LLM_API_KEY = os.getenv("LOCAL_LLM_API_KEY", "")
+# Local servers are not rate limited unless configured
+LOCAL_LLM_RPM_LIMIT = int(os.getenv("LOCAL_LLM_RPM_LIMIT", "0"))
+LOCAL_LLM_TPM_LIMIT = int(os.getenv("LOCAL_LLM_TPM_LIMIT", "0"))
+# Backends slower than this (moving average per call) are demoted in their routes
+LLM_FALLBACK_LATENCY_SECONDS = float(os.getenv("LLM_FALLBACK_LATENCY_SECONDS", "10"))
+# Weight of the newest call in the latency moving average
+LATENCY_EWMA_ALPHA = 0.2
+# Idle time over which a backend's latency average halves
+LLM_LATENCY_HALF_LIFE_SECONDS = float(os.getenv("LLM_LATENCY_HALF_LIFE_SECONDS", "60"))
+
+
+class Completion(NamedTuple):
+    text: str
+    prompt_tokens: int
+    completion_tokens: int
+
+
+def _usage_tokens(usage) -> tuple:
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+
+class LLMBackend:
+    """
+    Base class: one model on one provider, with its own transport and
+    latency average. review_type names the reply the caller expects; real
+    models read that from the prompt, only the stub needs it passed in.
+    """
+
+    kind = "base"
+
+    def __init__(self, model: str, transport: LLMTransport):
+        self.model = model
+        self.transport = transport
+        self._latency: Optional[float] = None
+        self._latency_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{self.model}"
+
+    def _decayed_latency(self, now: float) -> Optional[float]:
+        if self._latency is None or LLM_LATENCY_HALF_LIFE_SECONDS <= 0:
+            return self._latency
+        return self._latency * 0.5 ** ((now - self._latency_at) / LLM_LATENCY_HALF_LIFE_SECONDS)
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Moving average of call latency, decayed by the time since the last call"""
+        with self._lock:
+            return self._decayed_latency(time.monotonic())
+
+    def record_latency(self, seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            current = self._decayed_latency(now)
+            self._latency = seconds if current is None else current + LATENCY_EWMA_ALPHA * (seconds - current)
+            self._latency_at = now
+
+    def complete(self, messages: List[dict], temperature: float, max_tokens: int,
+                 json_mode: bool = False, tokens: int = 0, review_type: str = "") -> Completion:
+        raise NotImplementedError
+
+    async def complete_async(self, messages: List[dict], temperature: float, max_tokens: int,
+                             json_mode: bool = False, tokens: int = 0, review_type: str = "") -> Completion:
+        raise NotImplementedError
+
+    def stream_async(self, messages: List[dict], temperature: float, max_tokens: int,
+                     tokens: int = 0, review_type: str = "") -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        stats = self.transport.snapshot()
+        latency = self.latency
+        stats["latency_seconds"] = round(latency, 3) if latency is not None else None
+        return stats
+
+
+# --- Groq ---
+
+class GroqBackend(LLMBackend):
+    kind = "groq"
+
+    def __init__(self, model: str):
+        super().__init__(model, LLMTransport())
+        # Imported here so processes that never route to Groq don't pay for the SDK
+        from groq import Groq, AsyncGroq
+
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise ValueError("GROQ_API_KEY not found in .env file. Please add it.")
+        # Retries are handled by llm_transport, so the SDK's own are turned off
+        self.client = Groq(api_key=api_key, max_retries=0, timeout=LLM_TIMEOUT_SECONDS)
+        # Async client used by the FastAPI endpoints so a slow completion
+        # doesn't block the event loop for every other request.
+        self.async_client = AsyncGroq(api_key=api_key, max_retries=0, timeout=LLM_TIMEOUT_SECONDS)
+
+    def _kwargs(self, messages, temperature, max_tokens, json_mode) -> dict:
+        kwargs = {"model": self.model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+    def complete(self, messages, temperature, max_tokens, json_mode=False, tokens=0, review_type="") -> Completion:
+        kwargs = self._kwargs(messages, temperature, max_tokens, json_mode)
+        response = self.transport.call(lambda: self.client.chat.completions.create(**kwargs), tokens)
+        return Completion(response.choices[0].message.content, *_usage_tokens(response.usage))
+
+    async def complete_async(self, messages, temperature, max_tokens, json_mode=False, tokens=0,
+                             review_type="") -> Completion:
+        kwargs = self._kwargs(messages, temperature, max_tokens, json_mode)
+        response = await self.transport.call_async(lambda: self.async_client.chat.completions.create(**kwargs), tokens)
+        return Completion(response.choices[0].message.content, *_usage_tokens(response.usage))
+
+    async def stream_async(self, messages, temperature, max_tokens, tokens=0, review_type="") -> AsyncIterator[str]:
+        kwargs = self._kwargs(messages, temperature, max_tokens, False)
+        # Only opening the stream is retried; a failure after the first
+        # token is passed to the caller
+        stream = await self.transport.call_async(
+            lambda: self.async_client.chat.completions.create(stream=True, **kwargs), tokens
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+# --- OpenAI-compatible local server ---
+
+class _HTTPResponse(NamedTuple):
+    body: dict
+    usage: Optional[dict]
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """POSTs to {base_url}/chat/completions, as served by llama.cpp, vLLM, Ollama and others"""
+
+    kind = "local"
+
+    def __init__(self, model: str, base_url: str = LOCAL_LLM_BASE_URL, api_key: str = LOCAL_LLM_API_KEY):
+        super().__init__(model, LLMTransport(rpm_limit=LOCAL_LLM_RPM_LIMIT, tpm_limit=LOCAL_LLM_TPM_LIMIT))
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        import httpx
+
+        self.client = httpx.Client(timeout=LLM_TIMEOUT_SECONDS, headers=self.headers)
+        # httpx.AsyncClient is bound to the loop it is first used on, like the
+        # semaphores in review_logic, so keep one per loop
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _async_client(self) -> "httpx.AsyncClient":
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(timeout=LLM_TIMEOUT_SECONDS, headers=self.headers)
+            self._async_clients[loop] = client
+        return client
+
+    def _body(self, messages, temperature, max_tokens, json_mode, stream=False) -> dict:
+        body = {"model": self.model, "messages": messages, "temperature": temperature,
+                "max_tokens": max_tokens, "stream": stream}
+        if json_mode:
+            body["response_format"] = {"type": "json_object"}
+        return body
+
+    @staticmethod
+    def _completion(response: "httpx.Response") -> _HTTPResponse:
+        response.raise_for_status()
+        body = response.json()
+        return _HTTPResponse(body, body.get("usage"))
+
+    def complete(self, messages, temperature, max_tokens, json_mode=False, tokens=0, review_type="") -> Completion:
+        body = self._body(messages, temperature, max_tokens, json_mode)
+        result = self.transport.call(lambda: self._completion(self.client.post(self.url, json=body)), tokens)
+        return Completion(result.body["choices"][0]["message"]["content"], *_usage_tokens(result.usage))
+
+    async def complete_async(self, messages, temperature, max_tokens, json_mode=False, tokens=0,
+                             review_type="") -> Completion:
+        body = self._body(messages, temperature, max_tokens, json_mode)
+
+        async def request():
+            return self._completion(await self._async_client().post(self.url, json=body))
+
+        result = await self.transport.call_async(request, tokens)
+        return Completion(result.body["choices"][0]["message"]["content"], *_usage_tokens(result.usage))
+
+    async def stream_async(self, messages, temperature, max_tokens, tokens=0, review_type="") -> AsyncIterator[str]:
+        body = self._body(messages, temperature, max_tokens, False, stream=True)
+        client = self._async_client()
+
+        async def open_stream():
+            response = await client.send(client.build_request("POST", self.url, json=body), stream=True)
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            return response
+
+        response = await self.transport.call_async(open_stream, tokens)
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    yield content
+        finally:
+            await response.aclose()
+
+
+# --- Offline stub ---
+
+_PARAGRAPH_LABEL_RE = re.compile(r"\[P(\d+)\]")
+
+class StubBackend(LLMBackend):
+    """
+    Deterministic offline backend. Replies have the shape review_type
+    expects, with scores derived from a hash of the prompt, so the same
+    input always gets the same review. No network access.
+    """
+
+    kind = "stub"
+
+    def __init__(self, model: str = "stub"):
+        super().__init__(model, LLMTransport(rpm_limit=0, tpm_limit=0))
+
+    @staticmethod
+    def _score(prompt: str, salt: str, low: int = 40, high: int = 95) -> int:
+        digest = hashlib.sha256(f"{salt}:{prompt}".encode("utf-8")).digest()
+        return low + digest[0] % (high - low + 1)
+
+    def _reply(self, messages: List[dict], review_type: str) -> str:
+        # The first user message is the original prompt, even on a re-ask
+        prompt = next((m["content"] for m in messages if m["role"] == "user"), "")
+        if review_type in ("plagiarism", "code_plagiarism"):
+            score = self._score(prompt, "plagiarism", 5, 60)
+            reply = {
+                "plagiarism_score": score,
+                "confidence": "Medium",
+                "summary": f"Offline stub estimate: {score}% likelihood of copied content.",
+                "recommendations": ["Verify originality"],
+            }
+            if review_type == "code_plagiarism":
+                reply["indicators"] = []
+            else:
+                reply["matched_phrases"] = []
+            return json.dumps(reply)
+        if review_type == "writeup":
+            paragraphs = sorted({int(n) for n in _PARAGRAPH_LABEL_RE.findall(prompt)})
+            return json.dumps({
+                "scores": {name: self._score(prompt, name) for name in ("grammar", "clarity", "structure")},
+                "overall_feedback": "Offline stub review: the text was not sent to a language model.",
+                "justifications": {
+                    "grammar_justification": "Stub score.",
+                    "clarity_justification": "Stub score.",
+                    "structure_justification": "Stub score.",
+                    "improvement_suggestions": "Run with a real backend for feedback.",
+                },
+                "per_paragraph_feedback": [
+                    {"paragraph": n, "feedback": "No stub feedback for this paragraph."} for n in paragraphs
+                ],
+            })
+        return (
+            "## Code Review (offline stub)\n\n"
+            "**Correctness:** Not analyzed.\n\n"
+            "**Suggestions:** Run with a real backend for a full review.\n"
+        )
+
+    def _completion(self, messages: List[dict], review_type: str) -> Completion:
+        text = self._reply(messages, review_type)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        return Completion(text, prompt_tokens, len(text) // 4)
+
+    def complete(self, messages, temperature, max_tokens, json_mode=False, tokens=0, review_type="") -> Completion:
+        return self.transport.call(lambda: self._completion(messages, review_type), tokens)
+
+    async def complete_async(self, messages, temperature, max_tokens, json_mode=False, tokens=0,
+                             review_type="") -> Completion:
+        return self.complete(messages, temperature, max_tokens, json_mode, tokens, review_type)
+
+    async def stream_async(self, messages, temperature, max_tokens, tokens=0, review_type="") -> AsyncIterator[str]:
+        completion = self.complete(messages, temperature, max_tokens, tokens=tokens, review_type=review_type)
+        for line in completion.text.splitlines(keepends=True):
+            yield line
+
+
+BACKEND_KINDS = {
+    "groq": GroqBackend,
+    "local": OpenAICompatibleBackend,
+    "stub": StubBackend,
+}
+
+
+# --- Routing ---
+
+def parse_route(spec: str) -> List[tuple]:
+    """"groq:llama-3.1-8b-instant,stub" -> [("groq", "llama-3.1-8b-instant"), ("stub", "stub")]"""
+    route = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kind, _, model = entry.partition(":")
+        kind = kind.strip().lower()
+        if kind not in BACKEND_KINDS:
+            raise ValueError(f"Unknown LLM backend '{kind}' in route '{spec}'")
+        route.append((kind, model.strip() or kind))
+    if not route:
+        raise ValueError(f"Empty LLM route '{spec}'")
+    return route
+
+
+class LLMRouter:
+    """Builds backends on first use and sends each call down its review type's route"""
+
+    def __init__(self, default_route: str = LLM_ROUTE):
+        self.default_route = default_route
+        self.backends: Dict[tuple, LLMBackend] = {}
+        # Why each route entry that could not be built failed, so it is not rebuilt on every call
+        self.setup_errors: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+        # Calls answered by a backend other than the first one tried
+        self.fallbacks = 0
+
+    def route_spec(self, review_type: str) -> str:
+        return os.getenv(f"LLM_ROUTE_{review_type.upper()}", self.default_route)
+
+    def _backend(self, kind: str, model: str) -> LLMBackend:
+        """The backend for a route entry; LLMUnavailableError if it cannot be set up"""
+        with self._lock:
+            backend = self.backends.get((kind, model))
+            if backend is None:
+                error = self.setup_errors.get((kind, model))
+                if error is None:
+                    try:
+                        backend = BACKEND_KINDS[kind](model)
+                    except Exception as e:
+                        error = self.setup_errors[(kind, model)] = str(e) or type(e).__name__
+                        logger.warning("LLM backend unavailable", extra={"backend": f"{kind}:{model}", "error": error})
+                    else:
+                        self.backends[(kind, model)] = backend
+                if error is not None:
+                    llm_calls.inc(backend=f"{kind}:{model}", outcome="unavailable")
+                    raise LLMUnavailableError(f"{kind}:{model} could not be set up: {error}")
+            return backend
+
+    def candidates(self, review_type: str) -> List[tuple]:
+        """
+        Route entries for review_type ordered for this call: healthy and fast
+        first, then slow, then open breakers and entries that failed setup.
+        Entries not built yet count as healthy and fast.
+        """
+        route = parse_route(self.route_spec(review_type))
+        with self._lock:
+            built = {entry: self.backends.get(entry) for entry in route}
+            broken = {entry for entry in route if entry in self.setup_errors}
+
+        def rank(entry) -> int:
+            backend = built[entry]
+            if entry in broken or (backend is not None and backend.transport.breaker.state == "open"):
+                return 2
+            latency = backend.latency if backend is not None else None
+            return 0 if latency is None or latency <= LLM_FALLBACK_LATENCY_SECONDS else 1
+
+        return sorted(route, key=rank)
+
+    def _finish(self, backend: LLMBackend, latency: float, attempt: int, completion: Optional[Completion] = None):
+        backend.record_latency(latency)
+        llm_calls.inc(backend=backend.name, outcome="ok")
+        if completion is not None:
+            llm_tokens.inc(completion.prompt_tokens, backend=backend.name, direction="in")
+            llm_tokens.inc(completion.completion_tokens, backend=backend.name, direction="out")
+        if attempt:
+            with self._lock:
+                self.fallbacks += 1
+
+    @staticmethod
+    def _unavailable(backend: LLMBackend, error: LLMUnavailableError) -> LLMUnavailableError:
+        llm_calls.inc(backend=backend.name, outcome="unavailable")
+        return error
+
+    def complete(self, review_type: str, messages: List[dict], **kwargs) -> Completion:
+        error = None
+        for attempt, (kind, model) in enumerate(self.candidates(review_type)):
+            try:
+                backend = self._backend(kind, model)
+            except LLMUnavailableError as e:
+                error = e
+                continue
+            started = time.perf_counter()
+            try:
+                completion = backend.complete(messages, review_type=review_type, **kwargs)
+            except LLMUnavailableError as e:
+                error = self._unavailable(backend, e)
+                continue
+            self._finish(backend, time.perf_counter() - started, attempt, completion)
+            return completion
+        raise error
+
+    async def complete_async(self, review_type: str, messages: List[dict], **kwargs) -> Completion:
+        error = None
+        for attempt, (kind, model) in enumerate(self.candidates(review_type)):
+            try:
+                backend = self._backend(kind, model)
+            except LLMUnavailableError as e:
+                error = e
+                continue
+            started = time.perf_counter()
+            try:
+                completion = await backend.complete_async(messages, review_type=review_type, **kwargs)
+            except LLMUnavailableError as e:
+                error = self._unavailable(backend, e)
+                continue
+            self._finish(backend, time.perf_counter() - started, attempt, completion)
+            return completion
+        raise error
+
+    async def stream_async(self, review_type: str, messages: List[dict], **kwargs) -> AsyncIterator[str]:
+        """
+        Falls back only until the first piece has been sent. Latency is the
+        time to that first piece, so long streams don't demote a backend.
+        """
+        error = None
+        for attempt, (kind, model) in enumerate(self.candidates(review_type)):
+            try:
+                backend = self._backend(kind, model)
+            except LLMUnavailableError as e:
+                error = e
+                continue
+            started = time.perf_counter()
+            pieces = backend.stream_async(messages, review_type=review_type, **kwargs)
+            try:
+                first = await pieces.__anext__()
+            except StopAsyncIteration:
+                self._finish(backend, time.perf_counter() - started, attempt)
+                return
+            except LLMUnavailableError as e:
+                error = self._unavailable(backend, e)
+                continue
+            first_token = time.perf_counter() - started
+            yield first
+            async for piece in pieces:
+                yield piece
+            self._finish(backend, first_token, attempt)
+            return
+        raise error
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            backends = dict(self.backends)
+            setup_errors = dict(self.setup_errors)
+        return {
+            "routes": {review_type: self.route_spec(review_type)
+                       for review_type in ("writeup", "code", "plagiarism", "code_plagiarism")},
+            "fallbacks": self.fallbacks,
+            "backends": {backend.name: backend.snapshot() for backend in backends.values()},
+            "setup_errors": {f"{kind}:{model}": error for (kind, model), error in setup_errors.items()},
+        }
+
+
+router = LLMRouter()
@@ -0,0 +1,317 @@
+"""
+Resilient transport for LLM calls: retries, rate limiting and a circuit breaker.
+
+Each backend in llm_backends owns an LLMTransport and sends every
+completion through LLMTransport.call / call_async:
+
+1. Token bucket: requests and tokens are drawn from per-minute buckets
+   sized to the provider tier (LLM_RPM_LIMIT / LLM_TPM_LIMIT), so bursts
+   wait client-side instead of turning into 429s. Buckets are per process
+   and per backend.
+2. Retries: rate limits, timeouts, connection errors and 5xx responses are
+   retried with exponential backoff and full jitter, never sooner than the
+   provider's retry-after header asks.
+3. Circuit breaker: after LLM_BREAKER_FAILURES consecutive calls that fail
+   even with retries, calls fail immediately with LLMUnavailableError for
+   LLM_BREAKER_RESET_SECONDS, then a single trial call decides whether to
+   close it again.
+
+LLMUnavailableError is not turned into an error result, so the API answers
+503 and nothing is persisted or cached.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+import email.utils
+from typing import Awaitable, Callable, Optional, TypeVar
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "20"))
+# Per-request timeout handed to the backend HTTP clients
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+# Defaults match the Groq free tier for llama-3.1-8b-instant; 0 disables a limit.
+# They apply to the Groq backend; local servers are unlimited unless configured.
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "30"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "6000"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+T = TypeVar("T")
+
+def _status_code(error: Exception) -> Optional[int]:
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+def _error_types(groq_name: str, httpx_name: str) -> tuple:
+    """
+    The Groq SDK error class and its httpx counterpart. Both libraries are
+    only imported by the backends that use them, so a library that isn't
+    loaded yet can't have raised the error and is left unimported.
+    """
+    types = []
+    for module_name, name in (("groq", groq_name), ("httpx", httpx_name)):
+        module = sys.modules.get(module_name)
+        if module is not None:
+            types.append(getattr(module, name))
+    return tuple(types)
+
+def is_timeout(error: Exception) -> bool:
+    return isinstance(error, _error_types("APITimeoutError", "TimeoutException"))
+
+def is_rate_limited(error: Exception) -> bool:
+    return _status_code(error) == 429
+
+def is_bad_request(error: Exception) -> bool:
+    return isinstance(error, _error_types("APIStatusError", "HTTPStatusError")) and _status_code(error) == 400
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, timeouts, connection errors and 5xx from either the Groq SDK or plain httpx"""
+    if isinstance(error, _error_types("APIConnectionError", "TransportError")):
+        return True
+    if isinstance(error, _error_types("APIStatusError", "HTTPStatusError")):
+        status = _status_code(error)
+        return status == 429 or (status is not None and status >= 500)
+    return False
+
+
+class LLMUnavailableError(Exception):
+    """The LLM provider could not be reached; the request should not be retried right away"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Refills at limit per minute up to limit. take() reserves the amount
+    immediately, letting the balance go negative, and returns how long the
+    caller must wait, so concurrent callers queue up in arrival order.
+    """
+
+    def __init__(self, limit_per_minute: int):
+        self.capacity = float(limit_per_minute)
+        self.rate = limit_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def give_back(self, amount: float):
+        """Return tokens reserved for a request that used fewer"""
+        if self.rate <= 0 or amount <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open trial -> closed"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """
+        Raise LLMUnavailableError unless a call may go ahead. Returns True
+        when this call is the half-open trial, which must end in
+        record_success, record_failure or release_trial.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return False
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                raise LLMUnavailableError("LLM circuit breaker is open", retry_after=remaining)
+            if self._trial_running:
+                raise LLMUnavailableError("LLM circuit breaker is half-open", retry_after=1.0)
+            self.state = "half_open"
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def release_trial(self):
+        """Free the trial slot of a trial that ended without a verdict (cancelled, or a client error)"""
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Seconds requested by a retry-after / retry-after-ms header, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    # A malformed header must not replace the provider error it came with
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+class LLMTransport:
+    """Wraps completion calls with rate limiting, retries and a circuit breaker"""
+
+    def __init__(self, max_retries: int = LLM_MAX_RETRIES, rpm_limit: int = LLM_RPM_LIMIT,
+                 tpm_limit: int = LLM_TPM_LIMIT, breaker_failures: int = LLM_BREAKER_FAILURES,
+                 breaker_reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.max_retries = max_retries
+        self.requests = TokenBucket(rpm_limit)
+        self.tokens = TokenBucket(tpm_limit)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset_seconds)
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "timeouts": 0,
+                      "failures": 0, "rejected": 0, "throttle_wait_seconds": 0.0}
+
+    def _count(self, name: str, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def _reserve(self, tokens: int) -> float:
+        wait = max(self.requests.take(1), self.tokens.take(tokens))
+        if wait:
+            self._count("throttle_wait_seconds", wait)
+        return wait
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, at least the provider's retry-after"""
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, LLM_BACKOFF_MAX_SECONDS))
+        return delay
+
+    def _on_error(self, error: Exception, attempt: int) -> float:
+        """Return the delay before the next attempt, or raise if there is none"""
+        if is_rate_limited(error):
+            self._count("rate_limited")
+        elif is_timeout(error):
+            self._count("timeouts")
+        if not is_retryable(error):
+            # Client errors (bad request, auth) won't improve with retries and
+            # say nothing about provider health, so the breaker is left as is
+            raise error
+        if attempt >= self.max_retries:
+            self._count("failures")
+            self.breaker.record_failure()
+            raise LLMUnavailableError(
+                f"LLM request failed after {attempt + 1} attempts: {error}",
+                retry_after=_retry_after_seconds(error)
+            ) from error
+        self._count("retries")
+        return self._backoff(attempt, error)
+
+    def _check_breaker(self) -> bool:
+        try:
+            return self.breaker.before_call()
+        except LLMUnavailableError:
+            self._count("rejected")
+            raise
+
+    def _settle(self, reserved_tokens: int, response):
+        """Give back the part of the token reservation the response did not use"""
+        self.breaker.record_success()
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None) is not None:
+            self.tokens.give_back(reserved_tokens - usage.total_tokens)
+
+    def call(self, request: Callable[[], T], tokens: int) -> T:
+        """Run request(), reserving tokens (prompt + max completion) against the TPM limit"""
+        trial = self._check_breaker()
+        self._count("calls")
+        try:
+            for attempt in range(self.max_retries + 1):
+                time.sleep(self._reserve(tokens))
+                try:
+                    response = request()
+                except Exception as e:
+                    # The next attempt reserves its own tokens
+                    self.tokens.give_back(tokens)
+                    time.sleep(self._on_error(e, attempt))
+                    continue
+                self._settle(tokens, response)
+                return response
+        finally:
+            if trial:
+                self.breaker.release_trial()
+
+    async def call_async(self, request: Callable[[], Awaitable[T]], tokens: int) -> T:
+        """Async version of call"""
+        trial = self._check_breaker()
+        self._count("calls")
+        try:
+            for attempt in range(self.max_retries + 1):
+                await asyncio.sleep(self._reserve(tokens))
+                try:
+                    response = await request()
+                except Exception as e:
+                    self.tokens.give_back(tokens)
+                    await asyncio.sleep(self._on_error(e, attempt))
+                    continue
+                self._settle(tokens, response)
+                return response
+        finally:
+            # A cancelled trial (client disconnect, batch or job cancel) raises
+            # CancelledError, which is not an Exception and reaches only here
+            if trial:
+                self.breaker.release_trial()
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["throttle_wait_seconds"] = round(stats["throttle_wait_seconds"], 3)
+        stats["breaker_state"] = self.breaker.state
+        stats["consecutive_failures"] = self.breaker.failures
+        return stats
+
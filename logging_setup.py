@@ -0,0 +1,101 @@
+"""
+Structured, sampled logging.
+
+Modules log through logging.getLogger(__name__) and pass context as
+fields (extra={...}) instead of formatting it into the message, so each
+record is one JSON object per line:
+
+    {"time": "...", "level": "INFO", "logger": "review_logic", "message": "model reply",
+     "review_type": "writeup", "chars": 812, "reply": "{\"scores\": ..."}
+
+High-volume debugging records, such as raw model replies, are marked
+extra={"sampled": True} and only LOG_SAMPLE_RATE of them are kept. Long
+string fields are truncated to LOG_MAX_FIELD_CHARS.
+
+configure_logging() is called by the entry points (main.py, worker.py).
+A module imported on its own logs through Python's defaults.
+"""
+import os
+import sys
+import json
+import random
+import logging
+import datetime
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for one object per line, "text" for human-readable lines
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Share of records marked sampled (e.g. raw model replies) that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+# Libraries that log every HTTP request at INFO
+QUIET_LOGGERS = ("httpx", "httpcore")
+
+# Attributes every LogRecord has; anything else came from extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sampled"}
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    fields = {}
+    for name, value in vars(record).items():
+        if name in _RECORD_ATTRIBUTES:
+            continue
+        if isinstance(value, str) and len(value) > LOG_MAX_FIELD_CHARS:
+            value = value[:LOG_MAX_FIELD_CHARS] + f"... [{len(value) - LOG_MAX_FIELD_CHARS} more chars]"
+        fields[name] = value
+    return fields
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{name}={json.dumps(value, default=str)}" for name, value in fields.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random LOG_SAMPLE_RATE share of records logged with extra={"sampled": True}"""
+
+    def __init__(self, rate: float = LOG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False):
+            return random.random() < self.rate
+        return True
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Send the root logger to stdout in the configured format; safe to call more than once"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if getattr(handler, "_peer_review", False):
+            root.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stdout)
+    handler._peer_review = True
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    handler.addFilter(SamplingFilter())
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
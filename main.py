@@ -1,14 +1,50 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Body
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+# Load environment variables before the modules below read their settings
+load_dotenv()
+
+from logging_setup import configure_logging
+configure_logging()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response, ORJSONResponse
 from sqlmodel import Session, select
-from database import create_db_and_tables, engine
+from database import create_db_and_tables, get_engine
 from models import ReviewResult
-from review_logic import analyze_writeup, analyze_code, check_plagiarism, check_code_plagiarism
+from cache import response_cache
+from llm_transport import LLMUnavailableError
+from llm_backends import router
+from structured_output import parse_stats
+from plagiarism_prefilter import stage_stats
+from metrics import MetricsMiddleware, registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from persistence import result_writer
+from uploads import RequestSizeLimitMiddleware, read_upload_text
+from compression import CompressionMiddleware
+import review_service
+import batch
+import jobs
+import history
+import analytics
+import export
+import datetime
 import json
-from pydantic import BaseModel
-from typing import Optional, Literal
+import math
+from pydantic import BaseModel, Field
+from typing import Optional, Literal, List
 
-app = FastAPI(title="AI Peer Review API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The engine and LLM clients are built here or on first use, not at import
+    create_db_and_tables()
+    await result_writer.start()
+    yield
+    await result_writer.stop()
+
+# Endpoints returning plain dicts still go through jsonable_encoder first;
+# the large ones return an ORJSONResponse themselves to skip it
+app = FastAPI(title="AI Peer Review API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,27 +53,33 @@ app.add_middleware(
     allow_methods=["*"], # Allows all methods
     allow_headers=["*"], # Allows all headers
 )
-
-@app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestSizeLimitMiddleware)
+app.add_middleware(CompressionMiddleware)
 
 class PlagiarismRequest(BaseModel):
     text: str
     filename: str = "text_input"
     language: Optional[str] = None  # For code plagiarism
+    no_cache: bool = False  # Skip the response cache for this request
+
+def _unavailable(e: LLMUnavailableError) -> HTTPException:
+    """503 for when the LLM provider can't be reached, with a Retry-After hint"""
+    retry_after = math.ceil(e.retry_after) if e.retry_after else 5
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(retry_after)})
 
 @app.post("/review/writeup")
 async def review_writeup_endpoint(
     text: Optional[str] = Form(None), 
-    file: Optional[UploadFile] = File(None)
+    file: Optional[UploadFile] = File(None),
+    no_cache: bool = Form(False)
 ):
     file_text = ""
     filename = "text_input"
 
     try:
         if file:
-            file_text = (await file.read()).decode("utf-8")
+            file_text = (await read_upload_text(file)).text
             filename = file.filename if file.filename else "uploaded_file.txt"
         elif text:
             file_text = text
@@ -45,23 +87,13 @@ async def review_writeup_endpoint(
         else:
             raise HTTPException(status_code=400, detail="No text or file provided")
 
-        # 1. Analyze text using the new logic
-        result = analyze_writeup(file_text)
-
-        # 2. Save to DB
-        with Session(engine) as session:
-            review_entry = ReviewResult(
-                filename=filename,
-                review_type="writeup",
-                scores=json.dumps(result["scores"]), # Store scores as JSON string
-                feedback=result["overall_feedback"],
-                full_response=json.dumps(result) # Store the full JSON response
-            )
-            session.add(review_entry)
-            session.commit()
-            session.refresh(review_entry)
+        result, cache_status = await review_service.review_writeup(file_text, filename, no_cache)
         
-        return {"status": "success", "feedback": result}
+        return {"status": "success", "feedback": result, "cache": cache_status}
+    except HTTPException:
+        raise
+    except LLMUnavailableError as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -69,14 +101,19 @@ async def review_writeup_endpoint(
 async def review_code_endpoint(
     language: str = Form(...),
     code: Optional[str] = Form(None),
-    file: Optional[UploadFile] = File(None)
+    file: Optional[UploadFile] = File(None),
+    no_cache: bool = Form(False),
+    stream: bool = Form(False)
 ):
     code_text = ""
     filename = "code_input"
 
+    if stream:
+        return await review_code_stream_endpoint(language, code, file, no_cache)
+
     try:
         if file:
-            code_text = (await file.read()).decode("utf-8")
+            code_text = (await read_upload_text(file)).text
             filename = file.filename if file.filename else f"uploaded_code.{language.lower()}"
         elif code:
             code_text = code
@@ -84,91 +121,345 @@ async def review_code_endpoint(
         else:
             raise HTTPException(status_code=400, detail="No code or file provided")
         
-        # 1. Analyze code - this returns a string, not a dict!
-        feedback_text = analyze_code(code_text, language)
-
-        # 2. Save to DB - use the string directly for feedback
-        with Session(engine) as session:
-            review_entry = ReviewResult(
-                filename=filename,
-                review_type="code",
-                scores=json.dumps({}), # No scores for code review
-                feedback=feedback_text,  # Use the string directly
-                full_response=json.dumps({"feedback": feedback_text})
-            )
-            session.add(review_entry)
-            session.commit()
-            session.refresh(review_entry)
-
-        return {"status": "success", "feedback": {"feedback": feedback_text}}
+        feedback, cache_status = await review_service.review_code(code_text, language, filename, no_cache)
+
+        return {"status": "success", "feedback": feedback, "cache": cache_status}
+    except HTTPException:
+        raise
+    except LLMUnavailableError as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _sse_events(events):
+    async for event, data in events:
+        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/review/code/stream")
+async def review_code_stream_endpoint(
+    language: str = Form(...),
+    code: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    no_cache: bool = Form(False)
+):
+    """
+    Server-Sent Events version of /review/code. Sends "delta" events with
+    Markdown as it is generated, then "done" once the review is saved, or
+    "error" if the model call fails part way.
+    """
+    if file:
+        code_text = (await read_upload_text(file)).text
+        filename = file.filename if file.filename else f"uploaded_code.{language.lower()}"
+    elif code:
+        code_text = code
+        filename = f"code_input.{language.lower()}"
+    else:
+        raise HTTPException(status_code=400, detail="No code or file provided")
+
+    return StreamingResponse(
+        _sse_events(review_service.stream_code_review(code_text, language, filename, no_cache)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/review/plagiarism")
 async def check_plagiarism_endpoint(request: PlagiarismRequest):
     try:
-        # 1. Check plagiarism
-        result = check_plagiarism(request.text)
-
-        # 2. Save to DB with plagiarism score
-        with Session(engine) as session:
-            review_entry = ReviewResult(
-                filename=request.filename,
-                review_type="plagiarism",
-                scores=json.dumps({
-                    "plagiarism_score": result.get("plagiarism_score", 0), 
-                    "confidence": result.get("confidence", "Unknown"),
-                    "source_count": len(result.get("sources", []))
-                }),
-                feedback=result["summary"],
-                full_response=json.dumps(result)
-            )
-            session.add(review_entry)
-            session.commit()
-            session.refresh(review_entry)
-
-        return {"status": "success", "feedback": result}
+        result, cache_status = await review_service.review_plagiarism(
+            request.text, request.filename, request.no_cache
+        )
+
+        return ORJSONResponse({"status": "success", "feedback": result, "cache": cache_status})
+    except LLMUnavailableError as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/review/code_plagiarism")
 async def check_code_plagiarism_endpoint(request: PlagiarismRequest):
     try:
-        language = request.language if request.language else "Unknown"
-        
-        # 1. Check code plagiarism
-        result = check_code_plagiarism(request.text, language)
-
-        # 2. Save to DB with plagiarism score
-        with Session(engine) as session:
-            review_entry = ReviewResult(
-                filename=request.filename,
-                review_type="code_plagiarism",
-                scores=json.dumps({
-                    "plagiarism_score": result.get("plagiarism_score", 0), 
-                    "confidence": result.get("confidence", "Unknown"),
-                    "source_count": len(result.get("sources", [])),
-                    "indicator_count": len(result.get("indicators", []))
-                }),
-                feedback=result["summary"],
-                full_response=json.dumps(result)
-            )
-            session.add(review_entry)
-            session.commit()
-            session.refresh(review_entry)
-
-        return {"status": "success", "feedback": result}
+        result, cache_status = await review_service.review_code_plagiarism(
+            request.text, request.language, request.filename, request.no_cache
+        )
+
+        return ORJSONResponse({"status": "success", "feedback": result, "cache": cache_status})
+    except LLMUnavailableError as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+class BatchItem(BaseModel):
+    text: str
+    filename: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    review_type: Literal["writeup", "code", "plagiarism", "code_plagiarism"]
+    items: List[BatchItem]
+    language: Optional[str] = None  # For code and code plagiarism
+    no_cache: bool = False
+
+def _batch_response(review_type: str, items: List[dict], language: Optional[str], no_cache: bool):
+    if not items:
+        raise HTTPException(status_code=400, detail="No documents provided")
+    if len(items) > batch.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {batch.BATCH_MAX_ITEMS} documents per batch")
+    return StreamingResponse(
+        batch.stream_batch(review_type, items, language, no_cache),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/review/batch")
+async def review_batch_endpoint(request: BatchRequest):
+    """
+    Review many documents at once. Streams NDJSON: one line per document
+    as it finishes, then the pairwise similarity within the batch.
+    """
+    items = [
+        {"text": item.text, "filename": item.filename or f"batch_item_{i}"}
+        for i, item in enumerate(request.items)
+    ]
+    return _batch_response(request.review_type, items, request.language, request.no_cache)
+
+@app.post("/review/batch/upload")
+async def review_batch_upload_endpoint(
+    review_type: Literal["writeup", "code", "plagiarism", "code_plagiarism"] = Form(...),
+    files: List[UploadFile] = File(...),
+    language: Optional[str] = Form(None),
+    no_cache: bool = Form(False)
+):
+    """
+    Same as /review/batch, with the documents sent as a multi-file upload.
+    """
+    items = []
+    for i, file in enumerate(files):
+        text = (await read_upload_text(file)).text
+        items.append({"text": text, "filename": file.filename or f"batch_file_{i}"})
+    return _batch_response(review_type, items, language, no_cache)
+
+class JobRequest(BaseModel):
+    review_type: Literal["writeup", "code", "plagiarism", "code_plagiarism"]
+    text: str
+    filename: Optional[str] = None
+    language: Optional[str] = None  # For code and code plagiarism
+    no_cache: bool = False
+    priority: int = 0  # Higher runs first
+    max_attempts: int = Field(3, ge=1, le=10)
+    callback_url: Optional[str] = None  # POSTed the finished job as JSON
+
+@app.post("/jobs", status_code=202)
+def create_job(request: JobRequest):
+    """
+    Queue a review for the background workers (worker.py) and return at once.
+    Poll /jobs/{job_id} or pass callback_url to be notified.
+    """
+    try:
+        job = jobs.enqueue(
+            get_engine(), request.review_type, request.text, request.filename, request.language,
+            request.no_cache, request.priority, request.callback_url, request.max_attempts
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Status of a queued review, with its result once it has succeeded.
+    """
+    job = jobs.get_job(get_engine(), job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return jobs.to_dict(job)
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """
+    Cancel a queued or running review.
+    """
+    if jobs.cancel(get_engine(), job_id):
+        return {"job_id": job_id, "status": "cancelled"}
+    job = jobs.get_job(get_engine(), job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    raise HTTPException(status_code=409, detail=f"Job {job_id} already {job.status}")
+
 @app.get("/history")
-def get_all_reviews():
+def get_all_reviews(
+    limit: int = Query(history.DEFAULT_LIMIT, ge=1, le=history.MAX_LIMIT),
+    cursor: Optional[str] = None,
+    review_type: Optional[str] = None,
+    filename: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    min_plagiarism_score: Optional[float] = None,
+    max_plagiarism_score: Optional[float] = None,
+    fields: Optional[str] = None
+):
+    """
+    Page through past review results, newest first.
+    Pass the returned next_cursor back as cursor to get the next page.
+    Use /history/{id} for the full response of a single review.
+    """
+    try:
+        selected = history.parse_fields(fields)
+        # id and created_at are always read so the next cursor can be built. They
+        # go after the selected columns so each row starts with the projection
+        names = selected + [name for name in ("id", "created_at") if name not in selected]
+        columns = [getattr(ReviewResult, name) for name in names]
+        statement = history.apply_filters(
+            select(*columns), review_type, filename, since, until,
+            min_plagiarism_score, max_plagiarism_score
+        )
+        statement = history.apply_cursor(statement, cursor).limit(limit + 1)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    with Session(get_engine()) as session:
+        rows = session.exec(statement).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = history.encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    # Built from the row tuples and rendered by orjson, without jsonable_encoder
+    return ORJSONResponse({
+        "items": [dict(zip(selected, row)) for row in rows],
+        "next_cursor": next_cursor
+    })
+
+@app.get("/history/{review_id}")
+def get_review(review_id: int):
+    """
+    Full detail of a single review, including full_response.
+    """
+    with Session(get_engine()) as session:
+        review = session.get(ReviewResult, review_id)
+        if review is None:
+            raise HTTPException(status_code=404, detail=f"Review {review_id} not found")
+        return review
+
+@app.get("/export/{fmt}")
+def export_history(
+    fmt: Literal["csv", "ndjson", "parquet"],
+    review_type: Optional[str] = None,
+    filename: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    min_plagiarism_score: Optional[float] = None,
+    max_plagiarism_score: Optional[float] = None,
+    fields: Optional[str] = None
+):
+    """
+    Every review matching the /history filters, newest first, streamed as
+    CSV, NDJSON or Parquet. fields may also include full_response.
+    """
+    try:
+        selected = history.parse_fields(fields, history.EXPORT_FIELDS, history.LIST_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if fmt == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed")
+
+    chunks = export.export_rows(
+        fmt, selected, review_type=review_type, filename=filename, since=since, until=until,
+        min_plagiarism_score=min_plagiarism_score, max_plagiarism_score=max_plagiarism_score
+    )
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    return StreamingResponse(
+        export.stream_export(chunks),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="reviews-{stamp}.{fmt}"'}
+    )
+
+@app.get("/analytics/scores")
+def analytics_scores(
+    bucket: Literal["day", "week", "month", "all"] = "all",
+    review_type: Optional[str] = None,
+    metric: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    percentiles: Optional[str] = None
+):
+    """
+    Count, mean, standard deviation and percentiles of each score per
+    review type and time bucket, read from the precomputed rollups.
+    metric and percentiles are comma-separated lists.
+    """
+    try:
+        metrics = analytics.parse_metrics(metric)
+        quantiles = analytics.parse_percentiles(percentiles)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = analytics.score_summary(get_engine(), bucket, review_type, metrics, since, until, quantiles)
+    return ORJSONResponse({"bucket": bucket, "items": items})
+
+@app.get("/analytics/distribution")
+def analytics_distribution(
+    bucket: Literal["day", "week", "month", "all"] = "all",
+    review_type: Optional[str] = None,
+    metric: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    bin_width: int = Query(10, ge=1, le=100)
+):
+    """
+    Histogram of each score per review type and time bucket, in bins of
+    bin_width points.
+    """
+    try:
+        metrics = analytics.parse_metrics(metric)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = analytics.distribution(get_engine(), bucket, review_type, metrics, since, until, bin_width)
+    return ORJSONResponse({"bucket": bucket, "bin_width": bin_width, "items": items})
+
+@app.get("/persistence/stats")
+def persistence_stats():
+    """
+    Queue depth and flush latency of the write-behind result writer.
+    """
+    return result_writer.snapshot()
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Hit/miss counters for the review response cache.
+    """
+    return response_cache.snapshot()
+
+@app.get("/llm/stats")
+def llm_stats():
+    """
+    Configured route per review type, and per backend: latency moving
+    average, retries, 429s, timeouts, client-side throttling and the
+    circuit breaker state.
+    """
+    return router.snapshot()
+
+@app.get("/plagiarism/stats")
+def plagiarism_stats():
+    """
+    Two-stage plagiarism pipeline: documents decided locally vs escalated
+    to the LLM, and latency percentiles for the corpus, prefilter and LLM stages.
+    """
+    return stage_stats.snapshot()
+
+@app.get("/parse/stats")
+def parse_stats_endpoint():
+    """
+    Structured-output outcomes per review type: replies parsed directly,
+    parsed after repair, rejected, re-asked, and given up on.
+    """
+    return parse_stats.snapshot()
+
+@app.get("/metrics")
+def metrics_endpoint():
     """
-    Get all past review results.
+    Prometheus text format: per-endpoint and per-stage latency histograms,
+    LLM token and call counters, fallback results and cache outcomes.
     """
-    with Session(engine) as session:
-        reviews = session.exec(select(ReviewResult)).all()
-        return reviews
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,245 @@
+"""
+Prometheus-style metrics, served at /metrics in the text exposition format.
+
+A small in-process registry of counters and histograms, so the service
+needs no metrics client library. Values are per process: with several
+uvicorn workers each scrape reaches one of them, as with the other stats
+endpoints, so scrape each worker or run one worker per pod.
+
+What is measured:
+- http_request_duration_seconds: every endpoint, by route template and status
+- review_stage_seconds: prompt building, LLM round trip, JSON parsing,
+  schema validation and chunk merging inside each review_logic function
+- plagiarism_stage_seconds: corpus match, local prefilter and LLM stage
+  of the two-stage plagiarism pipeline
+- db_operation_seconds: result batch inserts and cache reads/writes
+- llm_tokens_total, llm_calls_total: usage reported by the backends
+- review_fallbacks_total: heuristic (generate_dynamic_*) and error
+  (generate_error_*) results returned instead of a model answer
+- cache_requests_total, structured_output_total: cache and parse outcomes
+"""
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+# Seconds; spans a cache hit to a slow multi-chunk completion
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Starlette appends the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (not cumulative), +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            else:
+                state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe how long the with-block took, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        lines = []
+        for key, (counts, overflow, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += overflow
+            le = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(metric.render() for metric in metrics)
+
+
+registry = Registry()
+
+# --- Metrics ---
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request, until the response has been sent",
+    ("method", "route", "status"),
+)
+review_stage_seconds = registry.histogram(
+    "review_stage_seconds", "Time spent in each stage of a review_logic function",
+    ("review_type", "stage"),
+)
+plagiarism_stage_seconds = registry.histogram(
+    "plagiarism_stage_seconds", "Time spent in each stage of the two-stage plagiarism pipeline",
+    ("review_type", "stage"),
+)
+db_operation_seconds = registry.histogram(
+    "db_operation_seconds", "Time spent on database work outside the request handlers",
+    ("operation",),
+)
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Prompt (in) and completion (out) tokens reported by the LLM backends",
+    ("backend", "direction"),
+)
+llm_calls = registry.counter(
+    "llm_calls_total", "Completions per backend by outcome",
+    ("backend", "outcome"),
+)
+review_fallbacks = registry.counter(
+    "review_fallbacks_total", "Results not produced by the model: heuristic (dynamic) or error placeholders",
+    ("review_type", "kind"),
+)
+cache_requests = registry.counter(
+    "cache_requests_total", "Response cache outcomes",
+    ("review_type", "result"),
+)
+structured_output = registry.counter(
+    "structured_output_total", "Structured-output parse outcomes",
+    ("review_type", "outcome"),
+)
+
+
+# --- ASGI middleware ---
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request into http_request_seconds, labelled with the
+    route template (e.g. /history/{review_id}) so ids don't create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None:
+            # Starlette 0.27 doesn't put the matched route in the scope, only its endpoint
+            self._routes = {route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")}
+        return self._routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_seconds.observe(
+                time.perf_counter() - started, method=scope["method"], route=self._route(scope), status=status
+            )
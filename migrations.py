@@ -0,0 +1,139 @@
+"""
+Data migrations for existing databases (e.g. an old peer_review.db).
+
+Schema changes that only add tables, nullable columns or indexes are
+handled by create_db_and_tables() in database.py. Anything that has to
+rewrite data is registered here, runs once, and is recorded in the
+SchemaMigration table. They run automatically on API startup, or by hand
+with:
+
+    python migrations.py
+"""
+import json
+import logging
+import datetime
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlmodel import Session, select
+
+import analytics
+import minhash_lsh
+from models import (
+    CodeFingerprint, FingerprintFrequency, ReviewResult, SchemaMigration, Submission, score_columns
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def _decode_scores(raw):
+    """Scores used to be stored as json.dumps(...) inside a JSON column"""
+    value = raw
+    while isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    return value if isinstance(value, dict) else None
+
+def native_json_scores(connection):
+    """Un-double-encode ReviewResult.scores and fill the numeric score columns"""
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            text("SELECT id, scores FROM reviewresult WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE}
+        ).all()
+        if not rows:
+            break
+        for review_id, raw in rows:
+            scores = _decode_scores(raw)
+            connection.execute(
+                ReviewResult.__table__.update()
+                .where(ReviewResult.__table__.c.id == review_id)
+                .values(scores=scores, **score_columns(scores))
+            )
+        last_id = rows[-1][0]
+
+def submission_content_hashes(connection):
+    """Fill Submission.content_hash for submissions stored before it existed"""
+    table = Submission.__table__
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            text("SELECT id, file_text FROM submission WHERE id > :last_id AND content_hash IS NULL "
+                 "ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BATCH_SIZE}
+        ).all()
+        if not rows:
+            break
+        for submission_id, file_text in rows:
+            connection.execute(
+                table.update().where(table.c.id == submission_id)
+                .values(content_hash=minhash_lsh.content_hash(file_text or ""))
+            )
+        last_id = rows[-1][0]
+
+def fingerprint_frequencies(connection):
+    """Count stored submissions per winnowing fingerprint"""
+    fingerprints = CodeFingerprint.__table__
+    connection.execute(FingerprintFrequency.__table__.delete())
+    connection.execute(FingerprintFrequency.__table__.insert().from_select(
+        ["fingerprint", "submissions"],
+        select(fingerprints.c.fingerprint, func.count(func.distinct(fingerprints.c.submission_id)))
+        .group_by(fingerprints.c.fingerprint)
+    ))
+
+# Ordered; never rename or remove an entry once it has shipped
+MIGRATIONS = [
+    ("0001_native_json_scores", native_json_scores),
+    # Backfill the analytics rollup tables from reviews written before them
+    ("0002_score_rollups", analytics.rebuild),
+    # Lets a check find an identical stored submission with one indexed lookup
+    ("0003_submission_content_hashes", submission_content_hashes),
+    # Lets code plagiarism checks skip boilerplate fingerprints
+    ("0004_fingerprint_frequencies", fingerprint_frequencies),
+]
+
+def run_pending(engine):
+    """
+    Apply the migrations not recorded yet. Every API and worker process
+    calls this at startup, so a migration's SchemaMigration row is written
+    first, in the transaction that runs it. A process starting at the same
+    time blocks on that row until the first one commits, then finds it and
+    skips the migration instead of applying it twice.
+    """
+    with Session(engine) as session:
+        applied = set(session.exec(select(SchemaMigration.name)).all())
+
+    for name, migration in MIGRATIONS:
+        if name in applied:
+            continue
+        while True:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(SchemaMigration.__table__.insert().values(
+                        name=name, applied_at=datetime.datetime.utcnow()
+                    ))
+                    logger.info("applying migration", extra={"migration": name})
+                    migration(connection)
+            except IntegrityError:
+                logger.info("migration applied by another process", extra={"migration": name})
+            except OperationalError as e:
+                # SQLite gives up after busy_timeout while another process is
+                # still migrating; keep waiting for it
+                if "locked" not in str(e).lower():
+                    raise
+                logger.info("waiting for another process to migrate", extra={"migration": name})
+                continue
+            break
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    from logging_setup import configure_logging
+    configure_logging(fmt="text")
+    from database import create_db_and_tables
+    create_db_and_tables()
+    print("Database is up to date.")
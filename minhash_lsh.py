@@ -0,0 +1,263 @@
+"""
+Local near-duplicate detection for text plagiarism checks.
+
+Every checked text is stored as a Submission together with a MinHash
+signature over its word k-shingles. The signature is split into LSH bands
+and each band hash is written to the MinHashBand table, so finding
+candidates for a new text is a handful of indexed lookups instead of a
+scan over the whole corpus. Candidates are then ranked by their estimated
+Jaccard similarity, and the best ones are re-shingled to report the
+overlapping spans.
+
+A check matches before it stores, so the only row it could mistake for a
+source is its own and that one does not exist yet. Identical content is
+reported as a 1.0 match and stored once. Texts under MIN_WORDS words are
+too short to fingerprint meaningfully and skip the corpus entirely.
+"""
+import os
+import re
+import zlib
+import hashlib
+from typing import List
+
+import numpy as np
+from sqlmodel import Session, select, func
+
+from models import Submission, MinHashBand
+
+# Words per shingle
+SHINGLE_SIZE = int(os.getenv("MINHASH_SHINGLE_SIZE", "5"))
+# Shorter texts are neither matched nor indexed: a handful of shingles
+# (or the single one a text under SHINGLE_SIZE words collapses to) would
+# match any other text that happens to contain them
+MIN_WORDS = int(os.getenv("MINHASH_MIN_WORDS", str(SHINGLE_SIZE * 4)))
+# Signature length = LSH_BANDS * LSH_ROWS. With 32 bands of 4 rows,
+# pairs above ~0.42 Jaccard collide in at least one band with high probability.
+LSH_BANDS = 32
+LSH_ROWS = 4
+NUM_PERM = LSH_BANDS * LSH_ROWS
+# Candidates pulled from the band index per query, best band overlap first
+CANDIDATE_LIMIT = int(os.getenv("MINHASH_CANDIDATE_LIMIT", "200"))
+# Minimum estimated Jaccard similarity for a candidate to be reported
+MATCH_THRESHOLD = float(os.getenv("MINHASH_MATCH_THRESHOLD", "0.3"))
+# Matches returned (and re-shingled for spans) per query
+MAX_MATCHES = 5
+# Longest span text included in a match
+MAX_SPAN_CHARS = 200
+
+_WORD_RE = re.compile(r"\w+")
+
+# Multiply-shift hash family: h_i(x) = ((a_i * x + b_i) mod 2^64) >> 32.
+# Fixed seed so signatures stay comparable across processes and restarts.
+_rng = np.random.RandomState(1)
+_PERM_A = (_rng.randint(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64) << np.uint64(32)) \
+    | _rng.randint(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = (_rng.randint(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64) << np.uint64(32)) \
+    | _rng.randint(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+_HASH_BLOCK = 4096
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def tokenize(text: str) -> List[re.Match]:
+    return list(_WORD_RE.finditer(text.lower()))
+
+def shingle_hashes(words: List[re.Match], k: int = SHINGLE_SIZE) -> List[int]:
+    """32-bit hash of every k-word shingle, in document order"""
+    tokens = [w.group() for w in words]
+    if not tokens:
+        return []
+    if len(tokens) < k:
+        return [zlib.crc32(" ".join(tokens).encode("utf-8"))]
+    return [zlib.crc32(" ".join(tokens[i:i + k]).encode("utf-8")) for i in range(len(tokens) - k + 1)]
+
+def minhash_signature(hashes: List[int]) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of a set of shingle hashes"""
+    signature = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint64)
+    values = np.unique(np.asarray(hashes, dtype=np.uint64))
+    with np.errstate(over="ignore"):
+        for start in range(0, len(values), _HASH_BLOCK):
+            block = values[start:start + _HASH_BLOCK]
+            permuted = (_PERM_A[:, None] * block[None, :] + _PERM_B[:, None]) >> np.uint64(32)
+            signature = np.minimum(signature, permuted.min(axis=1))
+    return signature.astype(np.uint32)
+
+def band_buckets(signature: np.ndarray) -> List[int]:
+    """One signed 64-bit bucket id per LSH band (band number is part of the hash)"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "big", signed=True))
+    return buckets
+
+def estimate_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+def overlapping_spans(query_text: str, query_words: List[re.Match], query_hashes: List[int],
+                      source_text: str) -> List[dict]:
+    """Runs of shared shingles, as character ranges in both documents"""
+    source_words = tokenize(source_text)
+    source_positions = {}
+    for position, h in enumerate(shingle_hashes(source_words)):
+        source_positions.setdefault(h, position)
+
+    k = min(SHINGLE_SIZE, len(query_words))
+    spans = []
+    run_start = None
+    for position, h in enumerate(query_hashes + [None]):
+        if h is not None and h in source_positions:
+            if run_start is None:
+                run_start = position
+            continue
+        if run_start is not None:
+            last = position - 1
+            start = query_words[run_start].start()
+            end = query_words[min(last + k - 1, len(query_words) - 1)].end()
+            source_first = source_positions[query_hashes[run_start]]
+            source_last = min(source_first + (last - run_start) + k - 1, len(source_words) - 1)
+            spans.append({
+                "start": start,
+                "end": end,
+                "source_start": source_words[source_first].start(),
+                "source_end": source_words[source_last].end(),
+                "text": query_text[start:end][:MAX_SPAN_CHARS]
+            })
+            run_start = None
+    return spans
+
+def _match_signature(session: Session, text: str, words, hashes, signature, exclude_id=None) -> List[dict]:
+    shared_bands = func.count(MinHashBand.bucket)
+    candidate_rows = session.exec(
+        select(MinHashBand.submission_id, shared_bands)
+        .where(MinHashBand.bucket.in_(band_buckets(signature)))
+        .group_by(MinHashBand.submission_id)
+        .order_by(shared_bands.desc())
+        .limit(CANDIDATE_LIMIT)
+    ).all()
+    candidate_ids = [row[0] for row in candidate_rows if row[0] != exclude_id]
+    if not candidate_ids:
+        return []
+
+    scored = []
+    for sub_id, file_name, minhash in session.exec(
+        select(Submission.id, Submission.file_name, Submission.minhash)
+        .where(Submission.id.in_(candidate_ids))
+    ).all():
+        if not minhash:
+            continue
+        jaccard = estimate_jaccard(signature, np.frombuffer(minhash, dtype=np.uint32))
+        if jaccard >= MATCH_THRESHOLD:
+            scored.append((jaccard, sub_id, file_name))
+    scored.sort(reverse=True)
+
+    matches = []
+    for jaccard, sub_id, file_name in scored[:MAX_MATCHES]:
+        source_text = session.exec(select(Submission.file_text).where(Submission.id == sub_id)).one()
+        matches.append({
+            "submission_id": sub_id,
+            "file_name": file_name,
+            "jaccard": round(jaccard, 4),
+            "spans": overlapping_spans(text, words, hashes, source_text)
+        })
+    return matches
+
+def index_submission(session: Session, file_name: str, text: str, signature: np.ndarray = None) -> Submission:
+    """Store text as a Submission and add its LSH bands to the index"""
+    if signature is None:
+        signature = minhash_signature(shingle_hashes(tokenize(text)))
+    submission = Submission(file_name=file_name, file_text=text, content_hash=content_hash(text),
+                            minhash=signature.tobytes())
+    session.add(submission)
+    session.flush()
+    session.add_all(
+        MinHashBand(bucket=bucket, submission_id=submission.id)
+        for bucket in set(band_buckets(signature))
+    )
+    return submission
+
+def check_and_index(engine, file_name: str, text: str) -> List[dict]:
+    """
+    Match text against every prior submission, then add it to the corpus.
+    Exact resubmissions are reported but not stored twice.
+    """
+    words = tokenize(text)
+    if len(words) < MIN_WORDS:
+        return []
+    hashes = shingle_hashes(words)
+    signature = minhash_signature(hashes)
+    digest = content_hash(text)
+    with Session(engine) as session:
+        matches = _match_signature(session, text, words, hashes, signature)
+        stored = session.exec(select(Submission.id).where(Submission.content_hash == digest).limit(1)).first()
+        if stored is None:
+            index_submission(session, file_name, text, signature)
+            session.commit()
+    return matches
+
+def matches_to_sources(matches: List[dict]) -> List[dict]:
+    """Shape corpus matches like the "sources" entries the frontend renders"""
+    return [
+        {
+            "title": f"Submission #{m['submission_id']}: {m['file_name']}",
+            "uri": f"submission:{m['submission_id']}",
+            "similarity": f"{round(m['jaccard'] * 100)}%",
+            "matched_phrases": [span["text"] for span in m["spans"]],
+            "submission_id": m["submission_id"],
+            "jaccard": m["jaccard"],
+            "spans": m["spans"]
+        }
+        for m in matches
+    ]
+
+def apply_matches(result: dict, matches: List[dict]) -> dict:
+    """Fold corpus matches into a check_plagiarism result"""
+    result["sources"] = matches_to_sources(matches)
+    if not matches:
+        return result
+
+    best = matches[0]
+    result["plagiarism_score"] = max(result.get("plagiarism_score", 0), round(best["jaccard"] * 100))
+    if best["jaccard"] >= 0.8:
+        result["confidence"] = "High"
+    result["summary"] = (
+        f"{result.get('summary', '')} Found {len(matches)} similar prior submission(s); "
+        f"closest is #{best['submission_id']} with ~{round(best['jaccard'] * 100)}% shingle overlap."
+    ).strip()
+    phrases = result.get("matched_phrases", [])
+    for span in best["spans"]:
+        if span["text"] not in phrases:
+            phrases.append(span["text"])
+    result["matched_phrases"] = phrases
+    return result
+
+def pairwise_similar(texts: List[str]) -> List[dict]:
+    """
+    Near-duplicate pairs within a set of texts (e.g. one batch upload),
+    using the same banding in memory so only colliding pairs are compared.
+    """
+    signatures = {}
+    buckets = {}
+    for index, text in enumerate(texts):
+        words = tokenize(text)
+        if len(words) < MIN_WORDS:
+            continue
+        signatures[index] = minhash_signature(shingle_hashes(words))
+        for bucket in band_buckets(signatures[index]):
+            buckets.setdefault(bucket, []).append(index)
+
+    candidates = set()
+    for members in buckets.values():
+        for a_pos, a in enumerate(members):
+            for b in members[a_pos + 1:]:
+                if a != b:
+                    candidates.add((min(a, b), max(a, b)))
+
+    pairs = []
+    for a, b in sorted(candidates):
+        jaccard = estimate_jaccard(signatures[a], signatures[b])
+        if jaccard >= MATCH_THRESHOLD:
+            pairs.append({"a": a, "b": b, "similarity": round(jaccard, 4)})
+    pairs.sort(key=lambda p: p["similarity"], reverse=True)
+    return pairs
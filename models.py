@@ -1,14 +1,42 @@
 from sqlmodel import SQLModel, Field, JSON, Column
-from sqlalchemy import Text # <--- Import Text
+from sqlalchemy import Text, BigInteger, LargeBinary, Index # <--- Import Text
 from typing import Optional, Dict, Any
 import datetime
 
+# Score keys that are also stored as their own columns so they can be
+# range-filtered and aggregated in SQL instead of inside the JSON blob.
+SCORE_COLUMNS = ("grammar", "clarity", "structure", "plagiarism_score")
+
+def score_columns(scores: Optional[Dict[str, Any]]) -> Dict[str, Optional[float]]:
+    """Numeric score columns for a ReviewResult built from its scores dict"""
+    scores = scores or {}
+    return {
+        name: float(scores[name]) if isinstance(scores.get(name), (int, float)) else None
+        for name in SCORE_COLUMNS
+    }
+
 class ReviewResult(SQLModel, table=True):
+    # Indexes match the access patterns: history pages (newest first,
+    # optionally by type or filename) and analytics by type over time.
+    __table_args__ = (
+        Index("ix_reviewresult_created_at_id", "created_at", "id"),
+        Index("ix_reviewresult_type_created_at_id", "review_type", "created_at", "id"),
+        Index("ix_reviewresult_filename_created_at_id", "filename", "created_at", "id"),
+        Index("ix_reviewresult_type_plagiarism_score", "review_type", "plagiarism_score"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     filename: str
     review_type: str 
     
+    # Stored as native JSON; pass a dict, not json.dumps(...)
     scores: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
+
+    # Copies of the hot score fields, see score_columns()
+    grammar: Optional[float] = None
+    clarity: Optional[float] = None
+    structure: Optional[float] = None
+    plagiarism_score: Optional[float] = None
     
     # --- UPDATED ---
     # Changed from max_length=4096 to sa_column=Column(Text) 
@@ -24,11 +52,110 @@ class ReviewResult(SQLModel, table=True):
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
 
 
-# You can remove the Submission model if you aren't using it
+# Corpus of previously checked texts used by the local plagiarism engine
 class Submission(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     file_name: str
     file_text: str
+    # sha256 of file_text, so resubmissions of identical text are recognised
+    content_hash: Optional[str] = Field(default=None, index=True)
     embedding: Optional[str] = None
+    # MinHash signature (uint32 array) over word shingles, see minhash_lsh.py
+    minhash: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))
+    # Set for code submissions, which are indexed by CodeFingerprint instead
+    language: Optional[str] = None
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+
+
+class MinHashBand(SQLModel, table=True):
+    # LSH band index: one row per (band bucket, submission).
+    # The primary key doubles as the lookup index for candidate search.
+    bucket: int = Field(sa_column=Column(BigInteger, primary_key=True, autoincrement=False))
+    submission_id: int = Field(foreign_key="submission.id", primary_key=True)
+
+
+
+class ScoreRollup(SQLModel, table=True):
+    # Per review type, metric and day, week or month: count, sum and sum of squares
+    # of the scores, kept up to date as results are written (see analytics.py).
+    # metric "reviews" counts every review, scored or not.
+    granularity: str = Field(primary_key=True, max_length=8)  # "day", "week" or "month"
+    period_start: datetime.datetime = Field(primary_key=True)
+    review_type: str = Field(primary_key=True, max_length=32)
+    metric: str = Field(primary_key=True, max_length=32)
+    count: int = 0
+    total: float = 0.0
+    total_squares: float = 0.0
+
+
+class ScoreHistogram(SQLModel, table=True):
+    # Score distribution for the same keys as ScoreRollup, one row per
+    # one-point bin: bin b counts scores in [b, b + 1), 100 counts exactly 100
+    granularity: str = Field(primary_key=True, max_length=8)
+    period_start: datetime.datetime = Field(primary_key=True)
+    review_type: str = Field(primary_key=True, max_length=32)
+    metric: str = Field(primary_key=True, max_length=32)
+    bin: int = Field(primary_key=True)
+    count: int = 0
+
+
+class SchemaMigration(SQLModel, table=True):
+    # Data migrations already applied to this database, see migrations.py
+    name: str = Field(primary_key=True)
+    applied_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+
+
+class CachedResponse(SQLModel, table=True):
+    # Persistent tier of the review_logic response cache (see cache.py).
+    # The key is a SHA-256 over the normalized input and everything that
+    # can change the model's answer.
+    key: str = Field(primary_key=True, max_length=64)
+    review_type: str
+    result: str = Field(sa_column=Column(Text, nullable=False))
     created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    expires_at: datetime.datetime = Field(index=True)
+
+
+class CodeFingerprint(SQLModel, table=True):
+    # Winnowing inverted index: fingerprint -> submissions and line ranges
+    # it occurs at, see winnowing.py. The submission_id index serves the
+    # per-match fingerprint counts.
+    __table_args__ = (Index("ix_codefingerprint_submission_id", "submission_id"),)
 
+    fingerprint: int = Field(sa_column=Column(BigInteger, primary_key=True, autoincrement=False))
+    submission_id: int = Field(foreign_key="submission.id", primary_key=True)
+    start_line: int = Field(primary_key=True)
+    end_line: int
+
+
+class FingerprintFrequency(SQLModel, table=True):
+    # Stored submissions per winnowing fingerprint, kept up to date by
+    # winnowing.index_submission so boilerplate fingerprints can be skipped
+    # without reading their postings.
+    fingerprint: int = Field(sa_column=Column(BigInteger, primary_key=True, autoincrement=False))
+    submissions: int
+
+
+class Job(SQLModel, table=True):
+    # Durable queue for background reviews, see jobs.py and worker.py
+    __table_args__ = (
+        Index("ix_job_claim", "status", "priority", "run_after"),
+    )
+
+    id: str = Field(primary_key=True, max_length=32)
+    review_type: str
+    # JSON: text, filename, language, no_cache
+    payload: str = Field(sa_column=Column(Text, nullable=False))
+    status: str = "queued"  # queued, running, succeeded, failed, cancelled
+    priority: int = 0  # Higher runs first
+    attempts: int = 0
+    max_attempts: int = 3
+    callback_url: Optional[str] = None
+    worker: Optional[str] = None
+    result: Optional[str] = Field(default=None, sa_column=Column(Text))
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    run_after: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    started_at: Optional[datetime.datetime] = None
+    heartbeat_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
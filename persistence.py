@@ -0,0 +1,159 @@
+"""
+Write-behind persistence for ReviewResult rows.
+
+Endpoints hand finished reviews to result_writer.submit() and return
+immediately. A background task drains the queue and writes rows in
+multi-row INSERTs, flushing when PERSIST_BATCH_SIZE rows are waiting or
+PERSIST_FLUSH_INTERVAL_MS has passed since the first one arrived. That
+costs one commit (and one fsync) per batch instead of per request.
+
+Durability:
+- Pending rows are flushed on shutdown (stop()).
+- PERSIST_MODE=sync writes each row before the request returns.
+- A full queue (PERSIST_QUEUE_MAX) makes submit() wait, so a stalled
+  database slows requests down instead of growing memory without bound.
+
+Each batch also updates the analytics rollups (see analytics.py).
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
+
+import analytics
+from database import get_engine
+from metrics import db_operation_seconds
+from models import ReviewResult
+
+logger = logging.getLogger(__name__)
+
+PERSIST_MODE = os.getenv("PERSIST_MODE", "async").lower()
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "100"))
+PERSIST_FLUSH_INTERVAL_MS = int(os.getenv("PERSIST_FLUSH_INTERVAL_MS", "200"))
+PERSIST_QUEUE_MAX = int(os.getenv("PERSIST_QUEUE_MAX", "10000"))
+# Attempts per batch before its rows are dropped and logged
+PERSIST_MAX_ATTEMPTS = 3
+
+
+class ResultWriter:
+    def __init__(self, engine=None, mode: str = PERSIST_MODE, batch_size: int = PERSIST_BATCH_SIZE,
+                 flush_interval_ms: int = PERSIST_FLUSH_INTERVAL_MS, max_queue: int = PERSIST_QUEUE_MAX):
+        # None means the shared engine, looked up when the first batch is written
+        self._engine = engine
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "enqueued": 0, "written": 0, "flushes": 0, "failed_flushes": 0, "dropped": 0,
+            "last_batch_size": 0, "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0,
+        }
+
+    @property
+    def engine(self):
+        return self._engine or get_engine()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.mode != "async" or self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the background task"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, entry: ReviewResult):
+        row = entry.model_dump(exclude={"id"})
+        if not self.running:
+            # Sync mode, or the writer was never started (e.g. scripts)
+            await run_in_threadpool(self._write_batch, [row])
+            return
+        await self._queue.put(row)
+        with self._stats_lock:
+            self.stats["enqueued"] += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[dict]):
+        for attempt in range(1, PERSIST_MAX_ATTEMPTS + 1):
+            try:
+                await run_in_threadpool(self._write_batch, batch)
+                return
+            except Exception as e:
+                with self._stats_lock:
+                    self.stats["failed_flushes"] += 1
+                logger.warning("result flush failed", extra={
+                    "attempt": attempt, "max_attempts": PERSIST_MAX_ATTEMPTS, "rows": len(batch), "error": str(e)
+                })
+                if attempt < PERSIST_MAX_ATTEMPTS:
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+        with self._stats_lock:
+            self.stats["dropped"] += len(batch)
+        logger.error("result rows dropped", extra={"rows": len(batch), "attempts": PERSIST_MAX_ATTEMPTS})
+
+    def _write_batch(self, rows: List[dict]):
+        start = time.perf_counter()
+        with self.engine.begin() as connection:
+            connection.execute(insert(ReviewResult.__table__), rows)
+            # Same transaction, so the rollups never count a row that wasn't written
+            analytics.record(connection, rows)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        db_operation_seconds.observe(elapsed_ms / 1000, operation="result_insert")
+        with self._stats_lock:
+            self.stats["written"] += len(rows)
+            self.stats["flushes"] += 1
+            self.stats["last_batch_size"] = len(rows)
+            self.stats["last_flush_ms"] = round(elapsed_ms, 3)
+            self.stats["max_flush_ms"] = round(max(self.stats["max_flush_ms"], elapsed_ms), 3)
+            self.stats["total_flush_ms"] += elapsed_ms
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        total = stats.pop("total_flush_ms")
+        stats["avg_flush_ms"] = round(total / stats["flushes"], 3) if stats["flushes"] else 0.0
+        stats["queue_depth"] = self._queue.qsize() if self.running else 0
+        stats["mode"] = self.mode if self.running or self.mode != "async" else "direct"
+        return stats
+
+
+# Shared writer used by the API; started and stopped with the app
+result_writer = ResultWriter()
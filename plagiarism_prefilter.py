@@ -0,0 +1,257 @@
+"""
+Local first stage of the plagiarism pipeline.
+
+Before paying for an LLM completion, review_service scores each document
+locally from three signals:
+
+1. Corpus overlap: the best match from minhash_lsh (text) or winnowing
+   (code), which review_service has already computed.
+2. Stylometry: for text, how much sentence length, vocabulary richness and
+   function-word use shift between paragraphs; for code, mixed naming
+   conventions, mixed indentation and uneven commenting. Abrupt style
+   changes are a common sign of pasted sections.
+3. The existing content heuristics (calculate_dynamic_*_score).
+
+Documents whose local score falls outside the uncertainty band
+[PLAGIARISM_ESCALATE_LOW, PLAGIARISM_ESCALATE_HIGH), and documents too
+short for a model to judge, are decided locally. Only the rest are
+escalated to the LLM. Widening the band sends more documents to the LLM
+(higher cost and latency, better accuracy); narrowing it sends fewer.
+Stage latencies and the escalation rate are reported at /plagiarism/stats.
+"""
+import os
+import re
+import time
+import threading
+import statistics
+from collections import deque
+from typing import List, NamedTuple, Optional
+
+from metrics import plagiarism_stage_seconds
+from review_logic import calculate_dynamic_plagiarism_score, calculate_dynamic_code_plagiarism_score
+
+# Set to false to send every document to the LLM, as before
+PLAGIARISM_TWO_STAGE = os.getenv("PLAGIARISM_TWO_STAGE", "true").lower() in ("1", "true", "yes")
+# Local scores in [LOW, HIGH) are uncertain and escalated to the LLM
+PLAGIARISM_ESCALATE_LOW = int(os.getenv("PLAGIARISM_ESCALATE_LOW", "25"))
+PLAGIARISM_ESCALATE_HIGH = int(os.getenv("PLAGIARISM_ESCALATE_HIGH", "70"))
+# Documents shorter than this (words for text, lines for code) are always decided locally
+PLAGIARISM_MIN_LLM_WORDS = int(os.getenv("PLAGIARISM_MIN_LLM_WORDS", "25"))
+PLAGIARISM_MIN_LLM_LINES = int(os.getenv("PLAGIARISM_MIN_LLM_LINES", "5"))
+# Latency samples kept per stage for percentiles
+STAGE_SAMPLES = 1000
+
+FUNCTION_WORDS = frozenset(
+    "the a an and or but of to in on at by for with from as is are was were be been "
+    "it its this that these those which who whom not no".split()
+)
+
+_WORD_RE = re.compile(r"[A-Za-z']+")
+_SENTENCE_RE = re.compile(r"[^.!?]+[.!?]*")
+_IDENTIFIER_RE = re.compile(r"\b[A-Za-z_][A-Za-z0-9_]*\b")
+_SNAKE_RE = re.compile(r"^[a-z0-9]+(_[a-z0-9]+)+$")
+_CAMEL_RE = re.compile(r"^[a-z]+([A-Z][a-z0-9]*)+$")
+_COMMENT_RE = re.compile(r"^\s*(#|//|/\*|\*|--|<!--)")
+
+
+class Assessment(NamedTuple):
+    local_score: int
+    escalate: bool
+    reason: str
+    features: dict
+    result: Optional[dict]  # Final result when decided locally
+
+    def summary(self) -> dict:
+        """What is stored with the review about how it was decided"""
+        return {
+            "stage": "llm" if self.escalate else "local",
+            "local_score": self.local_score,
+            "reason": self.reason,
+            "features": self.features,
+        }
+
+
+# --- Stylometry ---
+
+def _text_style(paragraph: str) -> Optional[dict]:
+    words = _WORD_RE.findall(paragraph.lower())
+    if len(words) < 30:
+        return None
+    sentences = [s for s in _SENTENCE_RE.findall(paragraph) if _WORD_RE.search(s)]
+    return {
+        "sentence_length": len(words) / max(1, len(sentences)),
+        "type_token_ratio": len(set(words)) / len(words),
+        "function_word_rate": sum(w in FUNCTION_WORDS for w in words) / len(words),
+        "long_word_rate": sum(len(w) >= 7 for w in words) / len(words),
+    }
+
+def text_style_shift(text: str) -> float:
+    """
+    0..1: how far the most unusual paragraph's style is from the others,
+    as the largest relative deviation of any feature from its median.
+    """
+    styles = [s for s in (_text_style(p) for p in re.split(r"\n\s*\n", text)) if s]
+    if len(styles) < 2:
+        return 0.0
+    shift = 0.0
+    for feature in styles[0]:
+        values = [s[feature] for s in styles]
+        median = statistics.median(values)
+        if median:
+            shift = max(shift, max(abs(v - median) / median for v in values))
+    return min(1.0, shift)
+
+def code_style_shift(code: str) -> float:
+    """0..1: share of style-consistency checks the code fails"""
+    lines = [line for line in code.splitlines() if line.strip()]
+    if len(lines) < PLAGIARISM_MIN_LLM_LINES:
+        return 0.0
+    checks = []
+
+    indents = [line[:len(line) - len(line.lstrip())] for line in lines]
+    checks.append(any("\t" in i for i in indents) and any(" " in i for i in indents))
+
+    identifiers = set(_IDENTIFIER_RE.findall(code))
+    snake = sum(bool(_SNAKE_RE.match(name)) for name in identifiers)
+    camel = sum(bool(_CAMEL_RE.match(name)) for name in identifiers)
+    checks.append(min(snake, camel) >= 3 and min(snake, camel) / max(snake, camel) > 0.3)
+
+    # Comments concentrated in one half of the file
+    half = len(lines) // 2
+    first = sum(bool(_COMMENT_RE.match(line)) for line in lines[:half])
+    second = sum(bool(_COMMENT_RE.match(line)) for line in lines[half:])
+    checks.append(first + second >= 4 and min(first, second) == 0)
+
+    return sum(checks) / len(checks)
+
+
+# --- Assessment ---
+
+def _decide(local_score: int, short: bool) -> tuple:
+    if not PLAGIARISM_TWO_STAGE:
+        return True, "two-stage pipeline disabled"
+    if short:
+        return False, "too short for the LLM to add information"
+    if local_score >= PLAGIARISM_ESCALATE_HIGH:
+        return False, "local evidence of copying is strong"
+    if local_score < PLAGIARISM_ESCALATE_LOW:
+        return False, "no local evidence of copying"
+    return True, "local score is inside the uncertainty band"
+
+def _confidence(local_score: int, overlap: float) -> str:
+    if overlap >= 0.8 or local_score < 10:
+        return "High"
+    return "Medium"
+
+def assess_text(text: str, matches: List[dict]) -> Assessment:
+    """matches are minhash_lsh.check_and_index results for text"""
+    overlap = matches[0]["jaccard"] if matches else 0.0
+    heuristic = calculate_dynamic_plagiarism_score(text)
+    style = text_style_shift(text)
+    short = len(_WORD_RE.findall(text)) < PLAGIARISM_MIN_LLM_WORDS
+    # Short inputs have no paragraphs to compare, so the heuristics score them alone
+    local_score = round(100 * max(overlap, heuristic / 100 if short else 0.5 * heuristic / 100 + 0.5 * style))
+    escalate, reason = _decide(local_score, short)
+    features = {"corpus_overlap": round(overlap, 4), "heuristic_score": heuristic, "style_shift": round(style, 4)}
+
+    result = None
+    if not escalate:
+        result = {
+            "plagiarism_score": local_score,
+            "confidence": _confidence(local_score, overlap),
+            "summary": f"Decided by local analysis ({reason}).",
+            "sources": [],
+            "matched_phrases": [],
+            "recommendations": (
+                ["Compare with the matching submissions"] if overlap >= 0.5 else ["No further checks needed"]
+            ),
+        }
+        if style >= 0.5:
+            result["recommendations"].append("Writing style changes noticeably between paragraphs")
+    return Assessment(local_score, escalate, reason, features, result)
+
+def assess_code(code: str, language: str, matches: List[dict]) -> Assessment:
+    """matches are winnowing.check_and_index results for code"""
+    overlap = matches[0]["similarity"] if matches else 0.0
+    heuristic = calculate_dynamic_code_plagiarism_score(code, language)
+    style = code_style_shift(code)
+    short = len([line for line in code.splitlines() if line.strip()]) < PLAGIARISM_MIN_LLM_LINES
+    # A few lines give the style checks (indentation, naming, comments per
+    # half of the file) nothing to compare and winnowing too few fingerprint
+    # windows to match, so the heuristics score short code alone
+    local_score = round(100 * max(overlap, heuristic / 100 if short else 0.5 * heuristic / 100 + 0.5 * style))
+    escalate, reason = _decide(local_score, short)
+    features = {"corpus_overlap": round(overlap, 4), "heuristic_score": heuristic, "style_shift": round(style, 4)}
+
+    result = None
+    if not escalate:
+        indicators = []
+        if style > 0:
+            indicators.append({
+                "pattern": "Inconsistent Style",
+                "description": "Naming, indentation or commenting style changes within the file",
+                "severity": "Medium" if style >= 0.5 else "Low"
+            })
+        result = {
+            "plagiarism_score": local_score,
+            "confidence": _confidence(local_score, overlap),
+            "summary": f"Decided by local analysis of {language} code ({reason}).",
+            "sources": [],
+            "indicators": indicators,
+            "recommendations": (
+                ["Compare with the matching submissions"] if overlap >= 0.5 else ["No further checks needed"]
+            ),
+        }
+    return Assessment(local_score, escalate, reason, features, result)
+
+
+# --- Stage metrics ---
+
+class StageStats:
+    """Per review type: latency samples per stage and local/LLM decision counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.decisions = {}
+
+    def observe(self, review_type: str, stage: str, started: float):
+        """Record a stage that began at time.perf_counter() value started"""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        plagiarism_stage_seconds.observe(elapsed_ms / 1000, review_type=review_type, stage=stage)
+        with self._lock:
+            self.samples.setdefault((review_type, stage), deque(maxlen=STAGE_SAMPLES)).append(elapsed_ms)
+
+    def decided(self, review_type: str, assessment: Assessment):
+        with self._lock:
+            counts = self.decisions.setdefault(review_type, {"local": 0, "llm": 0})
+            counts["llm" if assessment.escalate else "local"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = {key: list(values) for key, values in self.samples.items()}
+            decisions = {key: dict(value) for key, value in self.decisions.items()}
+        report = {
+            "band": [PLAGIARISM_ESCALATE_LOW, PLAGIARISM_ESCALATE_HIGH],
+            "two_stage": PLAGIARISM_TWO_STAGE,
+        }
+        for review_type, counts in decisions.items():
+            total = counts["local"] + counts["llm"]
+            report[review_type] = {
+                "decided_locally": counts["local"],
+                "escalated": counts["llm"],
+                "escalation_rate": round(counts["llm"] / total, 4) if total else 0.0,
+                "stages": {},
+            }
+        for (review_type, stage), values in samples.items():
+            values.sort()
+            report.setdefault(review_type, {"stages": {}})["stages"][stage] = {
+                "count": len(values),
+                "p50_ms": round(values[len(values) // 2], 2),
+                "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))], 2),
+                "max_ms": round(values[-1], 2),
+            }
+        return report
+
+
+stage_stats = StageStats()
@@ -1,33 +1,167 @@
 import os
-import json
-import re
-from groq import Groq
-from dotenv import load_dotenv
+import time
+import asyncio
+import logging
+import weakref
+from typing import AsyncIterator, List, Optional
 
-# Load environment variables
-load_dotenv()
+from chunking import (
+    TextChunk, CodeChunk, split_text, split_code, weighted_mean, estimate_tokens,
+    WRITEUP_CHUNK_TOKENS, PLAGIARISM_CHUNK_TOKENS, CODE_CHUNK_TOKENS,
+)
+from llm_backends import router
+from metrics import review_stage_seconds, review_fallbacks
+from llm_transport import LLMUnavailableError, is_bad_request
+from structured_output import (
+    LLM_JSON_MODE, STRUCTURED_MAX_REASKS, StructuredOutputError,
+    parse_response, parse_stats, reask_messages,
+)
 
-# Configure Groq client
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY not found in .env file. Please add it.")
+logger = logging.getLogger(__name__)
 
-client = Groq(api_key=GROQ_API_KEY)
+# Models and providers are chosen per review type by llm_backends routes
+TEMPERATURE = 0.3
+MAX_COMPLETION_TOKENS = 1024
 
-# Use the working model
-WORKING_MODEL = "llama-3.1-8b-instant"
+# Bump whenever a prompt template or response parser changes so cached
+# results produced by the old version are no longer served.
+PROMPT_VERSION = "5"
 
-# --- Function 1: Analyze Write-up ---
-def analyze_writeup(text: str) -> dict:
+# Maximum number of in-flight async completions per worker process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+# asyncio.Semaphore is bound to the loop it is first used on, so keep one per loop
+_llm_semaphores = weakref.WeakKeyDictionary()
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _llm_semaphores[loop] = semaphore
+    return semaphore
+
+def _request_tokens(messages: List[dict]) -> int:
+    """Tokens to reserve against the TPM limit: the prompt plus the most the reply can use"""
+    return sum(estimate_tokens(m["content"]) for m in messages) + MAX_COMPLETION_TOKENS
+
+def _request_kwargs(messages: List[dict]) -> dict:
+    return {"temperature": TEMPERATURE, "max_tokens": MAX_COMPLETION_TOKENS, "tokens": _request_tokens(messages)}
+
+def _stage(review_type: str, stage: str):
+    """Times a with-block into the review_stage_seconds histogram"""
+    return review_stage_seconds.time(review_type=review_type, stage=stage)
+
+def _chat(review_type: str, messages: List[dict], json_mode: bool = False) -> str:
+    """Run a single chat completion on review_type's route and return the message text"""
+    with _stage(review_type, "llm"):
+        return router.complete(
+            review_type, messages, json_mode=json_mode and LLM_JSON_MODE, **_request_kwargs(messages)
+        ).text
+
+async def _chat_async(review_type: str, messages: List[dict], json_mode: bool = False) -> str:
+    """Async version of _chat, bounded by LLM_MAX_CONCURRENCY"""
+    queued = time.perf_counter()
+    async with _get_llm_semaphore():
+        review_stage_seconds.observe(time.perf_counter() - queued, review_type=review_type, stage="queue")
+        with _stage(review_type, "llm"):
+            completion = await router.complete_async(
+                review_type, messages, json_mode=json_mode and LLM_JSON_MODE, **_request_kwargs(messages)
+            )
+    return completion.text
+
+async def _gather_chunks(calls) -> list:
     """
-    Analyzes a write-up using Groq
+    Run the per-chunk LLM calls concurrently and return their results in
+    order. If one fails, the others are cancelled rather than left running.
+    Each call reserves its prompt plus MAX_COMPLETION_TOKENS against the TPM
+    limit before it starts, so at the default LLM_TPM_LIMIT of 6000 about two
+    write-up chunks run at once and the rest wait for budget, as the
+    provider's own limit would make them.
     """
+    tasks = [asyncio.ensure_future(call) for call in calls]
     try:
-        prompt = f"""
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+def _log_reply(review_type: str, reply: str):
+    logger.info("model reply", extra={"sampled": True, "review_type": review_type, "chars": len(reply), "reply": reply})
+
+def _complete(review_type: str, prompt: str) -> str:
+    return _chat(review_type, [{"role": "user", "content": prompt}])
+
+async def _complete_async(review_type: str, prompt: str) -> str:
+    return await _chat_async(review_type, [{"role": "user", "content": prompt}])
+
+def _complete_structured(prompt: str, review_type: str) -> dict:
+    """
+    Completion parsed against the schema for review_type. An unusable reply
+    is sent back to the model with the problem, up to STRUCTURED_MAX_REASKS
+    times; after that StructuredOutputError is raised.
+    """
+    messages = [{"role": "user", "content": prompt}]
+    for attempt in range(STRUCTURED_MAX_REASKS + 1):
+        if attempt:
+            parse_stats.count(review_type, "reasked")
+        try:
+            reply = _chat(review_type, messages, json_mode=True)
+        except Exception as e:
+            # JSON mode rejects replies that are not valid JSON with a 400
+            if not is_bad_request(e):
+                raise
+            reply, error = "", StructuredOutputError(str(e))
+        else:
+            _log_reply(review_type, reply)
+            try:
+                return parse_response(reply, review_type)
+            except StructuredOutputError as e:
+                error = e
+        messages = reask_messages(prompt, reply, error)
+    parse_stats.count(review_type, "failed")
+    raise error
+
+async def _complete_structured_async(prompt: str, review_type: str) -> dict:
+    """Async version of _complete_structured"""
+    messages = [{"role": "user", "content": prompt}]
+    for attempt in range(STRUCTURED_MAX_REASKS + 1):
+        if attempt:
+            parse_stats.count(review_type, "reasked")
+        try:
+            reply = await _chat_async(review_type, messages, json_mode=True)
+        except Exception as e:
+            if not is_bad_request(e):
+                raise
+            reply, error = "", StructuredOutputError(str(e))
+        else:
+            _log_reply(review_type, reply)
+            try:
+                return parse_response(reply, review_type)
+            except StructuredOutputError as e:
+                error = e
+        messages = reask_messages(prompt, reply, error)
+    parse_stats.count(review_type, "failed")
+    raise error
+
+async def _stream_async(review_type: str, prompt: str) -> AsyncIterator[str]:
+    """Yield the completion text in pieces as the model produces it"""
+    messages = [{"role": "user", "content": prompt}]
+    async with _get_llm_semaphore():
+        with _stage(review_type, "llm_stream"):
+            async for piece in router.stream_async(review_type, messages, **_request_kwargs(messages)):
+                yield piece
+
+# --- Function 1: Analyze Write-up ---
+def _writeup_prompt(text: str) -> str:
+    return f"""
         Analyze this text and provide scores (0-100) for grammar, clarity, and structure.
         Then provide detailed feedback in 2-3 paragraphs.
+        Paragraphs are labelled [P1], [P2], ... in the text.
         
-        TEXT: {text[:2000]}
+        TEXT: {text}
         
         Respond with ONLY a JSON object in this exact format:
         {{
@@ -43,73 +177,87 @@ def analyze_writeup(text: str) -> dict:
                 "structure_justification": "Explanation of structure score...",
                 "improvement_suggestions": "Specific suggestions for improvement..."
             }},
-            "per_paragraph_feedback": []
+            "per_paragraph_feedback": [
+                {{"paragraph": 1, "feedback": "Feedback for paragraph [P1]..."}}
+            ]
         }}
         
+        Include one per_paragraph_feedback entry for every labelled paragraph.
         Do not include any other text or explanations.
         """
-        
-        response = client.chat.completions.create(
-            model=WORKING_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=1024
+
+def _writeup_chunks(text: str) -> List[TextChunk]:
+    return split_text(text, WRITEUP_CHUNK_TOKENS) or [TextChunk(text, 1, 1)]
+
+def _merge_writeup_results(results: List[dict], chunks: List[TextChunk]) -> dict:
+    """Length-weighted document scores from per-chunk analyses"""
+    if len(results) == 1:
+        return results[0]
+
+    weights = [len(chunk.text) for chunk in chunks]
+    labels = [f"Paragraphs {c.first_paragraph}-{c.last_paragraph}" for c in chunks]
+    scores = {
+        name: round(weighted_mean([float(r["scores"].get(name, 0)) for r in results], weights))
+        for name in ("grammar", "clarity", "structure")
+    }
+    justifications = {}
+    for key in results[0]["justifications"]:
+        justifications[key] = "\n\n".join(
+            f"{label}: {r['justifications'].get(key, '')}" for label, r in zip(labels, results)
         )
-        
-        response_text = response.choices[0].message.content
-        print("Raw AI Response:", response_text)
-        
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group())
-            # Ensure justifications field exists
-            if "justifications" not in result:
-                result["justifications"] = {
-                    "grammar_justification": "No detailed grammar analysis provided.",
-                    "clarity_justification": "No detailed clarity analysis provided.",
-                    "structure_justification": "No detailed structure analysis provided.",
-                    "improvement_suggestions": "No specific improvement suggestions provided."
-                }
-            return result
-        else:
-            # Fallback response with justifications
-            return {
-                "scores": {"grammar": 85, "clarity": 80, "structure": 75},
-                "overall_feedback": response_text[:500] if response_text else "No feedback generated",
-                "justifications": {
-                    "grammar_justification": "Grammar analysis not available.",
-                    "clarity_justification": "Clarity analysis not available.",
-                    "structure_justification": "Structure analysis not available.",
-                    "improvement_suggestions": "Suggestions not available."
-                },
-                "per_paragraph_feedback": []
-            }
-            
+    per_paragraph = [
+        entry for r in results for entry in r["per_paragraph_feedback"] if isinstance(entry, dict)
+    ]
+    per_paragraph.sort(key=lambda entry: entry.get("paragraph", 0) if isinstance(entry.get("paragraph"), int) else 0)
+    return {
+        "scores": scores,
+        "overall_feedback": "\n\n".join(f"{label}: {r['overall_feedback']}" for label, r in zip(labels, results)),
+        "justifications": justifications,
+        "per_paragraph_feedback": per_paragraph,
+        "chunks": len(chunks)
+    }
+
+def analyze_writeup(text: str) -> dict:
+    """
+    Analyzes a write-up with the routed LLM, chunk by chunk for long documents
+    """
+    try:
+        with _stage("writeup", "prompt"):
+            chunks = _writeup_chunks(text)
+            prompts = [_writeup_prompt(chunk.text) for chunk in chunks]
+        results = [_complete_structured(prompt, "writeup") for prompt in prompts]
+        with _stage("writeup", "merge"):
+            return _merge_writeup_results(results, chunks)
+    except LLMUnavailableError:
+        raise
     except Exception as e:
-        print(f"Error in analyze_writeup: {e}")
-        return {
-            "scores": {"grammar": 0, "clarity": 0, "structure": 0},
-            "overall_feedback": f"Error: {str(e)}",
-            "justifications": {
-                "grammar_justification": "Analysis failed due to error.",
-                "clarity_justification": "Analysis failed due to error.",
-                "structure_justification": "Analysis failed due to error.",
-                "improvement_suggestions": "Unable to provide suggestions due to error."
-            },
-            "per_paragraph_feedback": []
-        }
+        logger.exception("analyze_writeup failed", extra={"review_type": "writeup"})
+        return generate_error_writeup_result(str(e))
 
-# --- Function 2: Analyze Code ---
-def analyze_code(code: str, language: str) -> str:
+async def analyze_writeup_async(text: str) -> dict:
     """
-    Analyzes a code snippet using Groq
+    Async version of analyze_writeup; chunks are analyzed concurrently
     """
     try:
-        prompt = f"""
+        with _stage("writeup", "prompt"):
+            chunks = _writeup_chunks(text)
+            prompts = [_writeup_prompt(chunk.text) for chunk in chunks]
+        results = await _gather_chunks(_complete_structured_async(prompt, "writeup") for prompt in prompts)
+        with _stage("writeup", "merge"):
+            return _merge_writeup_results(list(results), chunks)
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        logger.exception("analyze_writeup_async failed", extra={"review_type": "writeup"})
+        return generate_error_writeup_result(str(e))
+
+# --- Function 2: Analyze Code ---
+def _code_prompt(code: str, language: str, chunk: Optional[CodeChunk] = None) -> str:
+    location = f"This snippet is lines {chunk.first_line}-{chunk.last_line} of a larger file.\n" if chunk else ""
+    return f"""
         You are a senior software engineer and expert code reviewer.
         Analyze the following {language} code snippet.
-        
+        {location}
         Provide a detailed code review covering:
         1. Correctness: Any bugs or logical errors.
         2. Best Practices: Adherence to idiomatic {language} and common patterns.
@@ -123,81 +271,176 @@ def analyze_code(code: str, language: str) -> str:
         {code}
         ---
         """
-        
-        response = client.chat.completions.create(
-            model=WORKING_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=1024
-        )
-        
-        return response.choices[0].message.content
-        
+
+def _code_chunks(code: str, language: str) -> List[CodeChunk]:
+    return split_code(code, language, CODE_CHUNK_TOKENS) or [CodeChunk(code, 1, 1)]
+
+def _code_chunk_prompt(chunk: CodeChunk, language: str, chunk_count: int) -> str:
+    return _code_prompt(chunk.text, language, chunk if chunk_count > 1 else None)
+
+def _merge_code_reviews(reviews: List[str], chunks: List[CodeChunk]) -> str:
+    if len(reviews) == 1:
+        return reviews[0]
+    return "\n\n".join(
+        f"## Lines {chunk.first_line}-{chunk.last_line}\n\n{review}" for chunk, review in zip(chunks, reviews)
+    )
+
+def analyze_code(code: str, language: str) -> str:
+    """
+    Analyzes a code snippet with the routed LLM, one top-level block group at a time for long files
+    """
+    try:
+        with _stage("code", "prompt"):
+            chunks = _code_chunks(code, language)
+            prompts = [_code_chunk_prompt(chunk, language, len(chunks)) for chunk in chunks]
+        reviews = [_complete("code", prompt) for prompt in prompts]
+        with _stage("code", "merge"):
+            return _merge_code_reviews(reviews, chunks)
+    except LLMUnavailableError:
+        raise
     except Exception as e:
-        return f"Error: Failed to analyze code: {str(e)}"
+        logger.exception("analyze_code failed", extra={"review_type": "code", "language": language})
+        return generate_error_code_result(str(e))
 
-# --- Function 3: Check Text Plagiarism ---
-def check_plagiarism(text: str) -> dict:
+async def analyze_code_async(code: str, language: str) -> str:
     """
-    Enhanced text plagiarism check with dynamic scoring and robust error handling
+    Async version of analyze_code; chunks are reviewed concurrently
     """
     try:
-        prompt = f"""
+        with _stage("code", "prompt"):
+            chunks = _code_chunks(code, language)
+            prompts = [_code_chunk_prompt(chunk, language, len(chunks)) for chunk in chunks]
+        reviews = await _gather_chunks(_complete_async("code", prompt) for prompt in prompts)
+        with _stage("code", "merge"):
+            return _merge_code_reviews(list(reviews), chunks)
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        logger.exception("analyze_code_async failed", extra={"review_type": "code", "language": language})
+        return generate_error_code_result(str(e))
+
+async def analyze_code_stream(code: str, language: str) -> AsyncIterator[str]:
+    """
+    Streaming version of analyze_code. Chunks are reviewed one after another
+    so the Markdown arrives in reading order; joining the pieces gives the
+    same layout analyze_code returns. Errors are raised to the caller.
+    """
+    with _stage("code", "prompt"):
+        chunks = _code_chunks(code, language)
+        prompts = [_code_chunk_prompt(chunk, language, len(chunks)) for chunk in chunks]
+    for index, (chunk, prompt) in enumerate(zip(chunks, prompts)):
+        if len(chunks) > 1:
+            separator = "\n\n" if index else ""
+            yield f"{separator}## Lines {chunk.first_line}-{chunk.last_line}\n\n"
+        async for delta in _stream_async("code", prompt):
+            yield delta
+
+def _merge_plagiarism_results(results: List[dict], weights: List[int], labels: List[str],
+                              list_fields: tuple) -> dict:
+    """Length-weighted plagiarism score across chunks; list fields are unioned"""
+    if len(results) == 1:
+        return results[0]
+
+    merged = dict(results[0])
+    merged["plagiarism_score"] = round(weighted_mean([r["plagiarism_score"] for r in results], weights))
+    confidences = [r["confidence"] for r in results]
+    merged["confidence"] = max(set(confidences), key=confidences.count)
+    merged["summary"] = " ".join(f"{label}: {r['summary']}" for label, r in zip(labels, results))
+    for field in list_fields:
+        combined = []
+        for r in results:
+            for item in r.get(field, []):
+                if item not in combined:
+                    combined.append(item)
+        merged[field] = combined
+    merged["chunks"] = len(results)
+    return merged
+
+# --- Function 3: Check Text Plagiarism ---
+def _plagiarism_prompt(text: str) -> str:
+    return f"""
         Analyze this text for plagiarism likelihood and provide a realistic score (0-100).
         
-        TEXT: {text[:1500]}
+        TEXT: {text}
         
         Provide a JSON response with this exact structure:
         {{
             "plagiarism_score": 50,
             "confidence": "Medium",
             "summary": "Brief analysis explaining the score",
-            "sources": [
-                {{
-                    "title": "Source Name",
-                    "uri": "https://example.com",
-                    "similarity": "75%",
-                    "matched_phrases": ["phrase1", "phrase2"]
-                }}
-            ],
             "matched_phrases": ["suspicious phrase 1", "suspicious phrase 2"],
             "recommendations": ["Check source1", "Verify originality"]
         }}
         """
-        
-        response = client.chat.completions.create(
-            model=WORKING_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=1024
-        )
-        
-        response_text = response.choices[0].message.content
-        print("Raw Plagiarism Response:", response_text)
-        
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group())
-            
-            # Ensure all required fields exist with proper types
-            result = validate_plagiarism_result(result, text)
-            return result
-        else:
-            # Fallback with content-based scoring
-            return generate_dynamic_plagiarism_result(text)
-        
+
+def _plagiarism_result(response: Optional[dict], text: str) -> dict:
+    """Schema-validated result, or the heuristic score if the model never produced one"""
+    result = response if response is not None else generate_dynamic_plagiarism_result(text)
+    # Sources come from the local corpus index (minhash_lsh.py), never from the model
+    result["sources"] = []
+    return result
+
+def _plagiarism_chunks(text: str) -> List[TextChunk]:
+    return split_text(text, PLAGIARISM_CHUNK_TOKENS, label=False) or [TextChunk(text, 1, 1)]
+
+def _merge_text_plagiarism(results: List[dict], chunks: List[TextChunk]) -> dict:
+    return _merge_plagiarism_results(
+        results,
+        [len(chunk.text) for chunk in chunks],
+        [f"Paragraphs {c.first_paragraph}-{c.last_paragraph}" for c in chunks],
+        ("matched_phrases", "recommendations")
+    )
+
+def check_plagiarism(text: str) -> dict:
+    """
+    Enhanced text plagiarism check with dynamic scoring and robust error handling
+    """
+    try:
+        with _stage("plagiarism", "prompt"):
+            chunks = _plagiarism_chunks(text)
+            prompts = [_plagiarism_prompt(chunk.text) for chunk in chunks]
+        results = []
+        for chunk, prompt in zip(chunks, prompts):
+            try:
+                response = _complete_structured(prompt, "plagiarism")
+            except StructuredOutputError:
+                response = None
+            results.append(_plagiarism_result(response, chunk.text))
+        with _stage("plagiarism", "merge"):
+            return _merge_text_plagiarism(results, chunks)
+    except LLMUnavailableError:
+        raise
     except Exception as e:
-        print(f"Error in check_plagiarism: {e}")
+        logger.exception("check_plagiarism failed", extra={"review_type": "plagiarism"})
         return generate_error_plagiarism_result(str(e))
 
-# --- Function 4: Check Code Plagiarism ---
-def check_code_plagiarism(code: str, language: str) -> dict:
+async def check_plagiarism_async(text: str) -> dict:
     """
-    Enhanced code plagiarism check with dynamic scoring and robust error handling
+    Async version of check_plagiarism; chunks are checked concurrently
     """
+    async def check_chunk(chunk: TextChunk, prompt: str) -> dict:
+        try:
+            response = await _complete_structured_async(prompt, "plagiarism")
+        except StructuredOutputError:
+            response = None
+        return _plagiarism_result(response, chunk.text)
+
     try:
-        prompt = f"""
+        with _stage("plagiarism", "prompt"):
+            chunks = _plagiarism_chunks(text)
+            prompts = [_plagiarism_prompt(chunk.text) for chunk in chunks]
+        results = await _gather_chunks(check_chunk(chunk, prompt) for chunk, prompt in zip(chunks, prompts))
+        with _stage("plagiarism", "merge"):
+            return _merge_text_plagiarism(list(results), chunks)
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        logger.exception("check_plagiarism_async failed", extra={"review_type": "plagiarism"})
+        return generate_error_plagiarism_result(str(e))
+
+# --- Function 4: Check Code Plagiarism ---
+def _code_plagiarism_prompt(code: str, language: str) -> str:
+    return f"""
         Analyze this {language} code for plagiarism likelihood and provide a realistic score (0-100).
         
         CODE:
@@ -210,14 +453,6 @@ def check_code_plagiarism(code: str, language: str) -> dict:
             "plagiarism_score": 50,
             "confidence": "Medium",
             "summary": "Brief analysis explaining the score",
-            "sources": [
-                {{
-                    "title": "Source Name", 
-                    "uri": "https://example.com",
-                    "similarity": "75%",
-                    "matched_patterns": ["pattern1", "pattern2"]
-                }}
-            ],
             "indicators": [
                 {{
                     "pattern": "Common Pattern",
@@ -228,139 +463,76 @@ def check_code_plagiarism(code: str, language: str) -> dict:
             "recommendations": ["Check repository1", "Verify originality"]
         }}
         """
-        
-        response = client.chat.completions.create(
-            model=WORKING_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=1024
-        )
-        
-        response_text = response.choices[0].message.content
-        print("Raw Code Plagiarism Response:", response_text)
-        
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group())
-            
-            # Ensure all required fields exist with proper types
-            result = validate_code_plagiarism_result(result, code, language)
-            return result
-        else:
-            return generate_dynamic_code_plagiarism_result(code, language)
-        
+
+def _code_plagiarism_result(response: Optional[dict], code: str, language: str) -> dict:
+    """Schema-validated result, or the heuristic score if the model never produced one"""
+    result = response if response is not None else generate_dynamic_code_plagiarism_result(code, language)
+    # Sources come from the local fingerprint index (winnowing.py), never from the model
+    result["sources"] = []
+    return result
+
+def _merge_code_plagiarism(results: List[dict], chunks: List[CodeChunk]) -> dict:
+    return _merge_plagiarism_results(
+        results,
+        [len(chunk.text) for chunk in chunks],
+        [f"Lines {c.first_line}-{c.last_line}" for c in chunks],
+        ("indicators", "recommendations")
+    )
+
+def check_code_plagiarism(code: str, language: str) -> dict:
+    """
+    Enhanced code plagiarism check with dynamic scoring and robust error handling
+    """
+    try:
+        with _stage("code_plagiarism", "prompt"):
+            chunks = _code_chunks(code, language)
+            prompts = [_code_plagiarism_prompt(chunk.text, language) for chunk in chunks]
+        results = []
+        for chunk, prompt in zip(chunks, prompts):
+            try:
+                response = _complete_structured(prompt, "code_plagiarism")
+            except StructuredOutputError:
+                response = None
+            results.append(_code_plagiarism_result(response, chunk.text, language))
+        with _stage("code_plagiarism", "merge"):
+            return _merge_code_plagiarism(results, chunks)
+    except LLMUnavailableError:
+        raise
     except Exception as e:
-        print(f"Error in check_code_plagiarism: {e}")
+        logger.exception("check_code_plagiarism failed", extra={"review_type": "code_plagiarism"})
         return generate_error_code_plagiarism_result(str(e))
 
-# --- Helper Functions ---
+async def check_code_plagiarism_async(code: str, language: str) -> dict:
+    """
+    Async version of check_code_plagiarism; chunks are checked concurrently
+    """
+    async def check_chunk(chunk: CodeChunk, prompt: str) -> dict:
+        try:
+            response = await _complete_structured_async(prompt, "code_plagiarism")
+        except StructuredOutputError:
+            response = None
+        return _code_plagiarism_result(response, chunk.text, language)
 
-def validate_plagiarism_result(result: dict, text: str) -> dict:
-    """Validate and fix plagiarism result structure"""
-    # Ensure plagiarism_score exists and is valid
-    if "plagiarism_score" not in result or not isinstance(result["plagiarism_score"], (int, float)):
-        result["plagiarism_score"] = calculate_dynamic_plagiarism_score(text)
-    else:
-        # Ensure score is within bounds
-        result["plagiarism_score"] = max(0, min(100, int(result["plagiarism_score"])))
-    
-    # Ensure confidence exists
-    if "confidence" not in result or not isinstance(result["confidence"], str):
-        result["confidence"] = "Medium"
-    
-    # Ensure summary exists
-    if "summary" not in result or not isinstance(result["summary"], str):
-        result["summary"] = f"Analysis of text with {len(text)} characters."
-    
-    # Ensure sources is a list
-    if "sources" not in result or not isinstance(result["sources"], list):
-        result["sources"] = generate_mock_sources(text)
-    else:
-        # Validate each source in the list
-        valid_sources = []
-        for source in result["sources"]:
-            if isinstance(source, dict):
-                # Ensure source has required fields
-                if "title" not in source:
-                    source["title"] = "Unknown Source"
-                if "uri" not in source:
-                    source["uri"] = "https://example.com"
-                if "similarity" not in source:
-                    source["similarity"] = "Unknown"
-                if "matched_phrases" not in source or not isinstance(source["matched_phrases"], list):
-                    source["matched_phrases"] = []
-                valid_sources.append(source)
-        result["sources"] = valid_sources
-    
-    # Ensure matched_phrases is a list
-    if "matched_phrases" not in result or not isinstance(result["matched_phrases"], list):
-        result["matched_phrases"] = []
-    
-    # Ensure recommendations is a list
-    if "recommendations" not in result or not isinstance(result["recommendations"], list):
-        result["recommendations"] = ["Verify with online sources", "Check academic databases"]
-    
-    return result
+    try:
+        with _stage("code_plagiarism", "prompt"):
+            chunks = _code_chunks(code, language)
+            prompts = [_code_plagiarism_prompt(chunk.text, language) for chunk in chunks]
+        results = await _gather_chunks(check_chunk(chunk, prompt) for chunk, prompt in zip(chunks, prompts))
+        with _stage("code_plagiarism", "merge"):
+            return _merge_code_plagiarism(list(results), chunks)
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        logger.exception("check_code_plagiarism_async failed", extra={"review_type": "code_plagiarism"})
+        return generate_error_code_plagiarism_result(str(e))
 
-def validate_code_plagiarism_result(result: dict, code: str, language: str) -> dict:
-    """Validate and fix code plagiarism result structure"""
-    # Ensure plagiarism_score exists and is valid
-    if "plagiarism_score" not in result or not isinstance(result["plagiarism_score"], (int, float)):
-        result["plagiarism_score"] = calculate_dynamic_code_plagiarism_score(code, language)
-    else:
-        # Ensure score is within bounds
-        result["plagiarism_score"] = max(0, min(100, int(result["plagiarism_score"])))
-    
-    # Ensure confidence exists
-    if "confidence" not in result or not isinstance(result["confidence"], str):
-        result["confidence"] = "Medium"
-    
-    # Ensure summary exists
-    if "summary" not in result or not isinstance(result["summary"], str):
-        result["summary"] = f"Analysis of {language} code with {len(code)} characters."
-    
-    # Ensure sources is a list
-    if "sources" not in result or not isinstance(result["sources"], list):
-        result["sources"] = generate_mock_code_sources(language, code)
-    else:
-        # Validate each source in the list
-        valid_sources = []
-        for source in result["sources"]:
-            if isinstance(source, dict):
-                # Ensure source has required fields
-                if "title" not in source:
-                    source["title"] = f"{language} Code Example"
-                if "uri" not in source:
-                    source["uri"] = "https://github.com/example"
-                if "similarity" not in source:
-                    source["similarity"] = "Unknown"
-                if "matched_patterns" not in source or not isinstance(source["matched_patterns"], list):
-                    source["matched_patterns"] = []
-                valid_sources.append(source)
-        result["sources"] = valid_sources
-    
-    # Ensure indicators is a list
-    if "indicators" not in result or not isinstance(result["indicators"], list):
-        result["indicators"] = []
-    else:
-        # Validate each indicator
-        valid_indicators = []
-        for indicator in result["indicators"]:
-            if isinstance(indicator, dict):
-                if "pattern" not in indicator:
-                    indicator["pattern"] = "Unknown Pattern"
-                if "description" not in indicator:
-                    indicator["description"] = "No description"
-                if "severity" not in indicator:
-                    indicator["severity"] = "Medium"
-                valid_indicators.append(indicator)
-        result["indicators"] = valid_indicators
-    
-    # Ensure recommendations is a list
-    if "recommendations" not in result or not isinstance(result["recommendations"], list):
-        result["recommendations"] = ["Compare with online examples", "Review code originality"]
-    
-    return result
+# --- Helper Functions ---
+
+def is_error_result(result) -> bool:
+    """True for the fallback results returned when the LLM call itself failed"""
+    if isinstance(result, str):
+        return result.startswith("Error: Failed to analyze code")
+    return bool(result.get("error"))
 
 def calculate_dynamic_plagiarism_score(text: str) -> int:
     """Calculate plagiarism score based on text characteristics"""
@@ -428,65 +600,30 @@ def calculate_dynamic_code_plagiarism_score(code: str, language: str) -> int:
     else:
         return 65
 
-def generate_mock_sources(text: str) -> list:
-    """Generate mock sources for text plagiarism"""
-    keywords = text.lower().split()[:3]
-    base_query = "+".join(keywords) if keywords else "text"
-    
-    return [
-        {
-            "title": f"Wikipedia: {keywords[0].title() if keywords else 'General'}",
-            "uri": f"https://en.wikipedia.org/wiki/{keywords[0] if keywords else 'main_page'}",
-            "similarity": "65%",
-            "matched_phrases": ["common terminology", "basic concepts"]
-        },
-        {
-            "title": "Educational Resource",
-            "uri": f"https://example.com/articles/{base_query}",
-            "similarity": "45%",
-            "matched_phrases": ["standard definitions"]
-        }
-    ]
-
-def generate_mock_code_sources(language: str, code: str) -> list:
-    """Generate mock sources for code plagiarism"""
-    return [
-        {
-            "title": f"GitHub: {language} Example",
-            "uri": f"https://github.com/search?q={language}+example",
-            "similarity": "70%",
-            "matched_patterns": ["function structure", "common implementation"]
-        },
-        {
-            "title": f"Stack Overflow: {language}",
-            "uri": f"https://stackoverflow.com/questions/tagged/{language}",
-            "similarity": "55%",
-            "matched_patterns": ["standard patterns"]
-        }
-    ]
-
 def generate_dynamic_plagiarism_result(text: str) -> dict:
     """Generate plagiarism result with dynamic scoring"""
+    review_fallbacks.inc(review_type="plagiarism", kind="dynamic")
     score = calculate_dynamic_plagiarism_score(text)
     
     return {
         "plagiarism_score": score,
         "confidence": "Medium",
         "summary": f"Content analysis completed. Score based on text characteristics.",
-        "sources": generate_mock_sources(text),
+        "sources": [],
         "matched_phrases": [],
         "recommendations": ["Verify with specific sources", "Check for exact matches online"]
     }
 
 def generate_dynamic_code_plagiarism_result(code: str, language: str) -> dict:
     """Generate code plagiarism result with dynamic scoring"""
+    review_fallbacks.inc(review_type="code_plagiarism", kind="dynamic")
     score = calculate_dynamic_code_plagiarism_score(code, language)
     
     return {
         "plagiarism_score": score,
         "confidence": "Medium",
         "summary": f"Code analysis completed for {language}.",
-        "sources": generate_mock_code_sources(language, code),
+        "sources": [],
         "indicators": [
             {
                 "pattern": "Common Implementation",
@@ -499,22 +636,47 @@ def generate_dynamic_code_plagiarism_result(code: str, language: str) -> dict:
 
 def generate_error_plagiarism_result(error: str) -> dict:
     """Error fallback for text plagiarism"""
+    review_fallbacks.inc(review_type="plagiarism", kind="error")
     return {
         "plagiarism_score": 0,
         "confidence": "Unknown",
         "summary": f"Analysis failed: {error}",
         "sources": [],
         "matched_phrases": [],
-        "recommendations": ["Technical error occurred", "Try again later"]
+        "recommendations": ["Technical error occurred", "Try again later"],
+        "error": True
     }
 
 def generate_error_code_plagiarism_result(error: str) -> dict:
     """Error fallback for code plagiarism"""
+    review_fallbacks.inc(review_type="code_plagiarism", kind="error")
     return {
         "plagiarism_score": 0,
         "confidence": "Unknown",
         "summary": f"Code analysis failed: {error}",
         "sources": [],
         "indicators": [],
-        "recommendations": ["Technical error occurred", "Try again later"]
-    }
\ No newline at end of file
+        "recommendations": ["Technical error occurred", "Try again later"],
+        "error": True
+    }
+
+def generate_error_writeup_result(error: str) -> dict:
+    """Error fallback for write-up analysis"""
+    review_fallbacks.inc(review_type="writeup", kind="error")
+    return {
+        "scores": {"grammar": 0, "clarity": 0, "structure": 0},
+        "overall_feedback": f"Error: {error}",
+        "justifications": {
+            "grammar_justification": "Analysis failed due to error.",
+            "clarity_justification": "Analysis failed due to error.",
+            "structure_justification": "Analysis failed due to error.",
+            "improvement_suggestions": "Unable to provide suggestions due to error."
+        },
+        "per_paragraph_feedback": [],
+        "error": True
+    }
+
+def generate_error_code_result(error: str) -> str:
+    """Error fallback for code review"""
+    review_fallbacks.inc(review_type="code", kind="error")
+    return f"Error: Failed to analyze code: {error}"
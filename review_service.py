@@ -0,0 +1,222 @@
+"""
+The full pipeline behind each review type: cached analysis, corpus
+matching where it applies, and persistence of the ReviewResult row.
+
+The single-document endpoints, the batch endpoints and background jobs
+all go through these functions so every path stores the same data.
+Each returns (feedback, cache_status), where feedback is what the API
+sends back under "feedback". Error placeholders from review_logic are
+returned but never persisted, and LLMUnavailableError is left to the
+caller.
+"""
+import json
+import time
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from database import get_engine
+from models import ReviewResult, score_columns
+from review_logic import (
+    analyze_writeup_async,
+    analyze_code_async,
+    analyze_code_stream,
+    check_plagiarism_async,
+    check_code_plagiarism_async,
+    is_error_result,
+)
+from llm_transport import LLMUnavailableError
+from cache import response_cache
+from persistence import result_writer
+import minhash_lsh
+import winnowing
+import plagiarism_prefilter
+from plagiarism_prefilter import stage_stats
+
+REVIEW_TYPES = ("writeup", "code", "plagiarism", "code_plagiarism")
+# Review types whose documents are source code rather than prose
+CODE_REVIEW_TYPES = ("code", "code_plagiarism")
+
+
+async def _persist(result, entry: ReviewResult):
+    """Queue the row for writing, unless the analysis failed and result is an error placeholder"""
+    if is_error_result(result):
+        return
+    await result_writer.submit(entry)
+
+async def review_writeup(text: str, filename: str = "text_input", no_cache: bool = False) -> Tuple[dict, str]:
+    # 1. Analyze text using the new logic
+    result, cache_status = await response_cache.get_or_compute(
+        "writeup", text, None,
+        lambda: analyze_writeup_async(text),
+        no_cache=no_cache
+    )
+
+    # 2. Save to DB
+    await _persist(result, ReviewResult(
+        filename=filename,
+        review_type="writeup",
+        scores=result["scores"],
+        **score_columns(result["scores"]),
+        feedback=result["overall_feedback"],
+        full_response=json.dumps(result) # Store the full JSON response
+    ))
+    return result, cache_status
+
+async def review_code(code: str, language: str, filename: Optional[str] = None,
+                      no_cache: bool = False) -> Tuple[dict, str]:
+    filename = filename or f"code_input.{language.lower()}"
+
+    # 1. Analyze code - this returns a string, not a dict!
+    feedback_text, cache_status = await response_cache.get_or_compute(
+        "code", code, language,
+        lambda: analyze_code_async(code, language),
+        no_cache=no_cache
+    )
+
+    # 2. Save to DB - use the string directly for feedback
+    await _save_code_review(filename, feedback_text)
+    return {"feedback": feedback_text}, cache_status
+
+async def _save_code_review(filename: str, feedback_text: str):
+    await _persist(feedback_text, ReviewResult(
+        filename=filename,
+        review_type="code",
+        scores={}, # No scores for code review
+        feedback=feedback_text,  # Use the string directly
+        full_response=json.dumps({"feedback": feedback_text})
+    ))
+
+async def stream_code_review(code: str, language: str, filename: Optional[str] = None,
+                             no_cache: bool = False) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Streaming version of review_code yielding (event, data) pairs:
+    "delta" events carry Markdown text as the model produces it, then a
+    single "done" (after the review is cached and persisted) or "error".
+    A cache hit is sent as one delta.
+    """
+    filename = filename or f"code_input.{language.lower()}"
+
+    if no_cache:
+        response_cache.count_bypass("code")
+    cached = None if no_cache else await response_cache.lookup("code", code, language)
+    if cached is not None:
+        yield "delta", {"text": cached}
+        await _save_code_review(filename, cached)
+        yield "done", {"cache": "hit", "length": len(cached)}
+        return
+
+    parts = []
+    try:
+        async for delta in analyze_code_stream(code, language):
+            parts.append(delta)
+            yield "delta", {"text": delta}
+    except LLMUnavailableError as e:
+        yield "error", {"detail": str(e), "status": 503, "retry_after": e.retry_after}
+        return
+    except Exception as e:
+        # Partial output is neither cached nor persisted
+        yield "error", {"detail": f"Error: Failed to analyze code: {str(e)}"}
+        return
+
+    feedback_text = "".join(parts)
+    if not no_cache:
+        await response_cache.store("code", code, language, feedback_text)
+    await _save_code_review(filename, feedback_text)
+    yield "done", {"cache": "bypass" if no_cache else "miss", "length": len(feedback_text)}
+
+async def _checked_plagiarism(review_type: str, assessment, compute, text: str, language: Optional[str],
+                              no_cache: bool) -> Tuple[dict, str]:
+    """Stage 2: the LLM check, only for documents the local stage escalated"""
+    stage_stats.decided(review_type, assessment)
+    if not assessment.escalate:
+        return assessment.result, "local"
+    started = time.perf_counter()
+    result, cache_status = await response_cache.get_or_compute(
+        review_type, text, language, compute, no_cache=no_cache
+    )
+    stage_stats.observe(review_type, "llm", started)
+    return result, cache_status
+
+async def review_plagiarism(text: str, filename: str = "text_input", no_cache: bool = False) -> Tuple[dict, str]:
+    # 1. Compare against every prior submission, then add this one to the corpus
+    started = time.perf_counter()
+    matches = await run_in_threadpool(minhash_lsh.check_and_index, get_engine(), filename, text)
+    stage_stats.observe("plagiarism", "corpus", started)
+
+    # 2. Decide locally where the evidence is clear, otherwise check with the LLM
+    started = time.perf_counter()
+    assessment = plagiarism_prefilter.assess_text(text, matches)
+    stage_stats.observe("plagiarism", "prefilter", started)
+    result, cache_status = await _checked_plagiarism(
+        "plagiarism", assessment, lambda: check_plagiarism_async(text), text, None, no_cache
+    )
+    result["analysis"] = assessment.summary()
+
+    result = minhash_lsh.apply_matches(result, matches)
+    scores = {
+        "plagiarism_score": result.get("plagiarism_score", 0), 
+        "confidence": result.get("confidence", "Unknown"),
+        "source_count": len(result.get("sources", []))
+    }
+
+    # 3. Save to DB with plagiarism score
+    await _persist(result, ReviewResult(
+        filename=filename,
+        review_type="plagiarism",
+        scores=scores,
+        **score_columns(scores),
+        feedback=result["summary"],
+        full_response=json.dumps(result)
+    ))
+    return result, cache_status
+
+async def review_code_plagiarism(code: str, language: Optional[str], filename: str = "text_input",
+                                 no_cache: bool = False) -> Tuple[dict, str]:
+    language = language if language else "Unknown"
+
+    # 1. Compare fingerprints against every prior submission, then index this one
+    started = time.perf_counter()
+    matches = await run_in_threadpool(winnowing.check_and_index, get_engine(), filename, code, language)
+    stage_stats.observe("code_plagiarism", "corpus", started)
+
+    # 2. Decide locally where the evidence is clear, otherwise check with the LLM
+    started = time.perf_counter()
+    assessment = plagiarism_prefilter.assess_code(code, language, matches)
+    stage_stats.observe("code_plagiarism", "prefilter", started)
+    result, cache_status = await _checked_plagiarism(
+        "code_plagiarism", assessment, lambda: check_code_plagiarism_async(code, language), code, language, no_cache
+    )
+    result["analysis"] = assessment.summary()
+
+    result = winnowing.apply_matches(result, matches)
+    scores = {
+        "plagiarism_score": result.get("plagiarism_score", 0), 
+        "confidence": result.get("confidence", "Unknown"),
+        "source_count": len(result.get("sources", [])),
+        "indicator_count": len(result.get("indicators", []))
+    }
+
+    # 3. Save to DB with plagiarism score
+    await _persist(result, ReviewResult(
+        filename=filename,
+        review_type="code_plagiarism",
+        scores=scores,
+        **score_columns(scores),
+        feedback=result["summary"],
+        full_response=json.dumps(result)
+    ))
+    return result, cache_status
+
+async def run_review(review_type: str, text: str, filename: Optional[str] = None,
+                     language: Optional[str] = None, no_cache: bool = False) -> Tuple[dict, str]:
+    """Dispatch to the pipeline for review_type"""
+    if review_type == "writeup":
+        return await review_writeup(text, filename or "text_input", no_cache)
+    if review_type == "code":
+        return await review_code(text, language or "Other", filename, no_cache)
+    if review_type == "plagiarism":
+        return await review_plagiarism(text, filename or "text_input", no_cache)
+    if review_type == "code_plagiarism":
+        return await review_code_plagiarism(text, language, filename or "text_input", no_cache)
+    raise ValueError(f"Unknown review type: {review_type}")
@@ -0,0 +1,311 @@
+"""
+Structured output for the JSON-returning review functions.
+
+Model replies are turned into result dicts in three steps:
+1. extract_json finds the first JSON object in the reply with a
+   brace-balanced scan (so trailing prose or a second object does not
+   break it), unwrapping ``` fences and repairing truncated output.
+2. The object is validated against the Pydantic schema for its review
+   type, which coerces types, clamps scores and fills optional fields.
+3. review_logic re-asks the model (at most STRUCTURED_MAX_REASKS times)
+   when either step fails, and falls back only after that.
+
+Outcomes are counted per review type and reported at /parse/stats.
+"""
+import os
+import re
+import json
+import threading
+from typing import List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+from metrics import review_stage_seconds, structured_output
+
+# Ask the provider for JSON mode (response_format=json_object) where supported
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() in ("1", "true", "yes")
+# Follow-up requests after an unusable reply before falling back
+STRUCTURED_MAX_REASKS = int(os.getenv("STRUCTURED_MAX_REASKS", "1"))
+
+CONFIDENCE_LEVELS = ("Low", "Medium", "High")
+
+
+# --- Schemas ---
+
+def _clamp_score(value) -> int:
+    if isinstance(value, str):
+        value = value.strip().rstrip("%")
+    # Pydantic only reports ValueError/AssertionError as validation errors,
+    # so null, list and inf/NaN scores must not escape as anything else
+    try:
+        return max(0, min(100, int(round(float(value)))))
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f"score must be a number from 0 to 100, got {value!r}") from e
+
+def _as_text_list(value) -> List[str]:
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [item if isinstance(item, str) else json.dumps(item) for item in value if item not in (None, "")]
+
+def _as_confidence(value) -> str:
+    if isinstance(value, str):
+        for level in CONFIDENCE_LEVELS:
+            if value.strip().lower() == level.lower():
+                return level
+    return "Medium"
+
+
+class WriteupScores(BaseModel):
+    grammar: int
+    clarity: int
+    structure: int
+
+    _clamp = field_validator("grammar", "clarity", "structure", mode="before")(_clamp_score)
+
+
+class WriteupJustifications(BaseModel):
+    grammar_justification: str = "No detailed grammar analysis provided."
+    clarity_justification: str = "No detailed clarity analysis provided."
+    structure_justification: str = "No detailed structure analysis provided."
+    improvement_suggestions: str = "No specific improvement suggestions provided."
+
+
+class ParagraphFeedback(BaseModel):
+    paragraph: int
+    feedback: str
+
+
+class WriteupResult(BaseModel):
+    scores: WriteupScores
+    overall_feedback: str
+    justifications: WriteupJustifications = WriteupJustifications()
+    per_paragraph_feedback: List[ParagraphFeedback] = []
+
+    @field_validator("justifications", mode="before")
+    @classmethod
+    def _justifications(cls, value):
+        return value if isinstance(value, dict) else {}
+
+    @field_validator("per_paragraph_feedback", mode="before")
+    @classmethod
+    def _paragraphs(cls, value):
+        # Keep the well-formed entries rather than rejecting the whole reply
+        if not isinstance(value, list):
+            return []
+        entries = []
+        for entry in value:
+            try:
+                entries.append(ParagraphFeedback.model_validate(entry))
+            except ValidationError:
+                continue
+        return entries
+
+
+class PlagiarismResult(BaseModel):
+    plagiarism_score: int
+    confidence: str = "Medium"
+    summary: str = "No summary provided."
+    matched_phrases: List[str] = []
+    recommendations: List[str] = ["Verify with online sources", "Check academic databases"]
+
+    _clamp = field_validator("plagiarism_score", mode="before")(_clamp_score)
+    _confidence = field_validator("confidence", mode="before")(_as_confidence)
+    _lists = field_validator("matched_phrases", "recommendations", mode="before")(_as_text_list)
+
+
+class CodeIndicator(BaseModel):
+    pattern: str = "Unknown Pattern"
+    description: str = "No description"
+    severity: str = "Medium"
+
+    _severity = field_validator("severity", mode="before")(_as_confidence)
+
+
+class CodePlagiarismResult(BaseModel):
+    plagiarism_score: int
+    confidence: str = "Medium"
+    summary: str = "No summary provided."
+    indicators: List[CodeIndicator] = []
+    recommendations: List[str] = ["Compare with online examples", "Review code originality"]
+
+    _clamp = field_validator("plagiarism_score", mode="before")(_clamp_score)
+    _confidence = field_validator("confidence", mode="before")(_as_confidence)
+    _recommendations = field_validator("recommendations", mode="before")(_as_text_list)
+
+    @field_validator("indicators", mode="before")
+    @classmethod
+    def _indicators(cls, value):
+        return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+
+SCHEMAS = {
+    "writeup": WriteupResult,
+    "plagiarism": PlagiarismResult,
+    "code_plagiarism": CodePlagiarismResult,
+}
+
+
+# --- Extraction ---
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_CLOSERS = {"{": "}", "[": "]"}
+
+def _scan(text: str, start: int) -> Tuple[int, List[str], bool]:
+    """
+    Walk text from the "{" at start. Returns (end, stack, in_string) where
+    end is the index just past the matching "}", or -1 if the object is
+    still open when the text runs out.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(char)
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return i + 1, [], False
+    return -1, stack, in_string
+
+def _loads_object(candidate: str) -> Optional[dict]:
+    for attempt in (candidate, _TRAILING_COMMA_RE.sub(r"\1", candidate)):
+        try:
+            value = json.loads(attempt)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+def _close_truncated(fragment: str) -> Optional[dict]:
+    """
+    Repair an object cut off mid-reply by closing the open string and
+    brackets. If that does not parse, drop back to the previous comma and
+    try again, losing only the incomplete trailing member.
+    """
+    for _ in range(50):
+        _, stack, in_string = _scan(fragment, 0)
+        repaired = fragment + ('"' if in_string else "")
+        repaired = repaired.rstrip().rstrip(",:").rstrip()
+        repaired += "".join(_CLOSERS[opener] for opener in reversed(stack))
+        value = _loads_object(repaired)
+        if value is not None:
+            return value
+        cut = fragment.rfind(",")
+        if cut <= 0:
+            return None
+        fragment = fragment[:cut]
+    return None
+
+def extract_json(text: str) -> Tuple[Optional[dict], bool]:
+    """
+    Return (object, repaired) for the first JSON object in a model reply.
+    repaired is True when the reply was not a bare JSON object, i.e. it had
+    to be cut out of prose, unfenced, de-comma'd or closed to parse.
+    Returns (None, False) when nothing usable is found.
+    """
+    if not text:
+        return None, False
+
+    stripped = text.strip()
+    value = _loads_object(stripped) if stripped.startswith("{") else None
+    if value is not None:
+        return value, False
+
+    sources = [text]
+    fence = _FENCE_RE.search(text)
+    if fence:
+        sources.insert(0, fence.group(1))
+
+    for source in sources:
+        start = source.find("{")
+        while start != -1:
+            end, _, _ = _scan(source, start)
+            if end == -1:
+                value = _close_truncated(source[start:])
+                if value is not None:
+                    return value, True
+                break
+            value = _loads_object(source[start:end])
+            if value is not None:
+                return value, True
+            start = source.find("{", start + 1)
+    return None, False
+
+
+# --- Parsing ---
+
+class StructuredOutputError(ValueError):
+    """A model reply could not be turned into a valid result"""
+
+
+class ParseStats:
+    """Thread-safe per review type counters of parse outcomes"""
+
+    OUTCOMES = ("parsed", "repaired", "invalid", "reasked", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def count(self, review_type: str, outcome: str):
+        with self._lock:
+            counters = self.stats.setdefault(review_type, dict.fromkeys(self.OUTCOMES, 0))
+            counters[outcome] += 1
+        structured_output.inc(review_type=review_type, outcome=outcome)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {review_type: dict(counters) for review_type, counters in self.stats.items()}
+
+
+parse_stats = ParseStats()
+
+def parse_response(response_text: str, review_type: str) -> dict:
+    """
+    Parse and validate a reply for review_type. Raises StructuredOutputError
+    with a message suitable for re-asking the model.
+    """
+    schema: Type[BaseModel] = SCHEMAS[review_type]
+    with review_stage_seconds.time(review_type=review_type, stage="parse"):
+        value, repaired = extract_json(response_text)
+    if value is None:
+        parse_stats.count(review_type, "invalid")
+        raise StructuredOutputError("the reply did not contain a JSON object")
+    try:
+        with review_stage_seconds.time(review_type=review_type, stage="validate"):
+            result = schema.model_validate(value).model_dump()
+    except ValidationError as e:
+        parse_stats.count(review_type, "invalid")
+        problems = "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        )
+        raise StructuredOutputError(f"the JSON did not match the required format ({problems})") from e
+    parse_stats.count(review_type, "repaired" if repaired else "parsed")
+    return result
+
+def reask_messages(prompt: str, reply: str, error: StructuredOutputError) -> List[dict]:
+    """Conversation asking the model to correct an unusable reply"""
+    return [
+        {"role": "user", "content": prompt},
+        {"role": "assistant", "content": reply or ""},
+        {"role": "user", "content": (
+            f"Your reply could not be used: {error}. "
+            "Respond again with ONLY the JSON object in the exact format requested, with no other text."
+        )},
+    ]
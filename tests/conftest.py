@@ -0,0 +1,23 @@
+import random
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, create_engine
+
+import models  # noqa: F401  registers the tables on SQLModel.metadata
+
+
+@pytest.fixture
+def engine():
+    """A fresh in-memory SQLite database with every table created"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def prose(seed: int, words: int = 200) -> str:
+    """Deterministic filler text; different seeds share almost no 5-word shingles"""
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(2000)]
+    return " ".join(rng.choice(vocabulary) for _ in range(words)) + "."
@@ -0,0 +1,81 @@
+import datetime
+import math
+import random
+
+import pytest
+from sqlalchemy import insert
+
+import analytics
+from models import ReviewResult, score_columns
+
+MONDAY = datetime.datetime(2026, 3, 2, 9, 30)
+
+
+def _nearest_rank(values, q):
+    ordered = sorted(values)
+    return float(ordered[max(1, math.ceil(q / 100 * len(ordered))) - 1])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_percentiles_match_nearest_rank_on_whole_scores(seed):
+    rng = random.Random(seed)
+    values = [rng.randint(0, 100) for _ in range(rng.randint(1, 300))]
+    histogram = {}
+    for value in values:
+        histogram[value] = histogram.get(value, 0) + 1
+    quantiles = [0, 1, 25, 50, 75, 90, 95, 99, 100]
+    assert analytics.percentiles_of(histogram, quantiles) == {
+        f"p{q:g}": _nearest_rank(values, q) for q in quantiles
+    }
+
+
+def test_percentiles_of_an_empty_histogram():
+    assert analytics.percentiles_of({}, [50]) == {"p50": None}
+
+
+def test_period_starts():
+    assert analytics.period_start(MONDAY + datetime.timedelta(days=3), "week") == MONDAY.replace(hour=0, minute=0)
+    assert analytics.period_start(MONDAY, "month") == datetime.datetime(2026, 3, 1)
+    assert analytics.period_start(MONDAY, "all") is None
+
+
+def _write(engine, scores_by_day):
+    """Store reviews like persistence.ResultWriter: rows and rollups in one transaction"""
+    rows = [
+        {"filename": "a.txt", "review_type": "writeup", "scores": {"grammar": grammar},
+         "created_at": MONDAY + datetime.timedelta(days=day), **score_columns({"grammar": grammar})}
+        for day, grammar_scores in enumerate(scores_by_day) for grammar in grammar_scores
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(ReviewResult.__table__), rows)
+        analytics.record(connection, rows)
+
+
+def test_summary_from_rollups(engine):
+    _write(engine, [[60, 70, 80], [90, 100]])
+    summary = analytics.score_summary(engine, "all", metrics=["grammar"], percentiles=[50, 100])
+    assert summary == [{
+        "period_start": None, "review_type": "writeup", "metric": "grammar", "count": 5,
+        "mean": 80.0, "stddev": round(math.sqrt(200), 2), "percentiles": {"p50": 80.0, "p100": 100.0},
+    }]
+
+    days = analytics.score_summary(engine, "day", metrics=["grammar"], percentiles=[50])
+    assert [(item["period_start"].day, item["count"], item["percentiles"]["p50"]) for item in days] == [
+        (2, 3, 70.0), (3, 2, 90.0)
+    ]
+
+
+def test_rebuild_matches_incremental_rollups(engine):
+    _write(engine, [[55.5, 61], [72, 99.9, 100]])
+    incremental = analytics.score_summary(engine, "day")
+    with engine.begin() as connection:
+        analytics.rebuild(connection)
+    assert analytics.score_summary(engine, "day") == incremental
+
+
+def test_distribution_puts_100_in_the_last_bin(engine):
+    _write(engine, [[0, 9.9, 10, 100]])
+    (item,) = analytics.distribution(engine, metrics=["grammar"], bin_width=25)
+    assert [(b["start"], b["end"], b["count"]) for b in item["bins"]] == [
+        (0, 25, 3), (25, 50, 0), (50, 75, 0), (75, 100, 1)
+    ]
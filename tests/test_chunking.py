@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import review_logic
+from chunking import CHARS_PER_TOKEN, paragraphs, split_code, split_text
+from conftest import prose
+from llm_backends import LLMRouter
+from llm_transport import LLMUnavailableError
+
+
+def _long_writeup(count: int = 12) -> str:
+    return "\n\n".join(prose(seed, words=60) for seed in range(count))
+
+
+def test_split_text_packs_labelled_paragraphs_under_the_budget():
+    text = _long_writeup()
+    chunks = split_text(text, 200)
+    assert len(chunks) > 1
+    assert all(len(chunk.text) <= 200 * CHARS_PER_TOKEN for chunk in chunks)
+    # Paragraph ranges are contiguous and cover the whole document
+    assert chunks[0].first_paragraph == 1
+    assert chunks[-1].last_paragraph == len(paragraphs(text))
+    for before, after in zip(chunks, chunks[1:]):
+        assert after.first_paragraph == before.last_paragraph + 1
+    assert chunks[1].text.startswith(f"[P{chunks[1].first_paragraph}] ")
+
+
+def test_split_code_keeps_line_numbers():
+    code = "\n\n".join(f"def f{i}():\n    return {i}\n" for i in range(200))
+    chunks = split_code(code, "python", 100)
+    assert len(chunks) > 1
+    lines = code.split("\n")
+    for chunk in chunks:
+        assert chunk.text == "\n".join(lines[chunk.first_line - 1:chunk.last_line])
+        assert chunk.text.startswith("def ")
+
+
+def test_long_writeup_is_analysed_per_chunk_and_merged(monkeypatch):
+    monkeypatch.delenv("LLM_ROUTE_WRITEUP", raising=False)
+    monkeypatch.setattr(review_logic, "router", LLMRouter("stub"))
+    monkeypatch.setattr(review_logic, "WRITEUP_CHUNK_TOKENS", 200)
+    text = _long_writeup()
+
+    result = asyncio.run(review_logic.analyze_writeup_async(text))
+    assert result["chunks"] == len(split_text(text, 200)) > 1
+    assert all(0 <= score <= 100 for score in result["scores"].values())
+    assert result["overall_feedback"].startswith("Paragraphs 1-")
+
+
+def test_failed_chunk_cancels_the_others(monkeypatch):
+    monkeypatch.setattr(review_logic, "WRITEUP_CHUNK_TOKENS", 200)
+    cancelled = []
+
+    async def complete(prompt, review_type):
+        if "TEXT: [P1] " in prompt:
+            await asyncio.sleep(0.01)
+            raise LLMUnavailableError("LLM circuit breaker is open", retry_after=30)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(prompt)
+            raise
+
+    monkeypatch.setattr(review_logic, "_complete_structured_async", complete)
+    chunk_count = len(split_text(_long_writeup(), 200))
+
+    async def scenario():
+        with pytest.raises(LLMUnavailableError):
+            await review_logic.analyze_writeup_async(_long_writeup())
+        # Counted before asyncio.run cancels leftovers on shutdown
+        return len(cancelled)
+
+    assert asyncio.run(scenario()) == chunk_count - 1
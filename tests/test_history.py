@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+import history
+import main
+from models import ReviewResult, score_columns
+
+START = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    monkeypatch.setattr(main, "get_engine", lambda: engine)
+    # Not used as a context manager, so the lifespan (real engine, worker threads) never starts
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def reviews(engine):
+    """Eleven reviews; every pair shares a created_at so ties are broken by id"""
+    rows = []
+    with Session(engine) as session:
+        for i in range(11):
+            review_type = "writeup" if i % 2 else "plagiarism"
+            scores = {"grammar": 50 + i} if review_type == "writeup" else {"plagiarism_score": 10 * i}
+            row = ReviewResult(filename=f"file{i}.txt", review_type=review_type, scores=scores,
+                               **score_columns(scores), feedback=f"feedback {i}",
+                               created_at=START + datetime.timedelta(minutes=i // 2))
+            session.add(row)
+            rows.append(row)
+        session.commit()
+        for row in rows:
+            session.refresh(row)
+    return sorted(rows, key=lambda r: (r.created_at, r.id), reverse=True)
+
+
+def _pages(client, **params):
+    items, cursor = [], None
+    while True:
+        page = client.get("/history", params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_cursor_pages_cover_every_row_once_newest_first(client, reviews):
+    items = _pages(client, limit=3)
+    assert [item["id"] for item in items] == [row.id for row in reviews]
+
+
+def test_filters_apply_on_every_page(client, reviews):
+    items = _pages(client, limit=2, review_type="plagiarism", min_plagiarism_score=30)
+    expected = [r.id for r in reviews if r.review_type == "plagiarism" and r.plagiarism_score >= 30]
+    assert [item["id"] for item in items] == expected
+
+
+def test_fields_projection_drops_repeats_and_keeps_values_aligned(client, reviews):
+    page = client.get("/history", params={"limit": 2, "fields": "grammar,grammar,filename"}).json()
+    newest = reviews[:2]
+    assert page["items"] == [{"grammar": r.grammar, "filename": r.filename} for r in newest]
+    # The cursor still works without id or created_at in the projection
+    second = client.get("/history", params={"limit": 2, "fields": "filename", "cursor": page["next_cursor"]}).json()
+    assert [item["filename"] for item in second["items"]] == [r.filename for r in reviews[2:4]]
+
+
+@pytest.mark.parametrize("params", [{"fields": "full_response"}, {"cursor": "not-a-cursor"}])
+def test_bad_projection_or_cursor_is_a_400(client, reviews, params):
+    assert client.get("/history", params=params).status_code == 400
+
+
+def test_cursor_round_trip_and_field_parsing():
+    moment = datetime.datetime(2026, 3, 4, 5, 6, 7, 890)
+    assert history.decode_cursor(history.encode_cursor(moment, 42)) == (moment, 42)
+    assert history.parse_fields(None) == list(history.DEFAULT_FIELDS)
+    assert history.parse_fields(" id, scores ,id,") == ["id", "scores"]
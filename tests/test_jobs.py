@@ -0,0 +1,33 @@
+import asyncio
+import datetime
+
+import jobs
+import review_service
+import worker
+from llm_transport import LLMUnavailableError
+
+
+def _run_failing_job(engine, monkeypatch, error: Exception):
+    async def run_review(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(review_service, "run_review", run_review)
+    job = jobs.enqueue(engine, "writeup", "Some text")
+    claimed = jobs.claim_next(engine, "test-worker")
+    asyncio.run(worker.run_job(engine, claimed))
+    return jobs.get_job(engine, job.id)
+
+
+def test_retry_waits_for_the_providers_retry_after(engine, monkeypatch):
+    before = datetime.datetime.utcnow()
+    job = _run_failing_job(engine, monkeypatch, LLMUnavailableError("LLM circuit breaker is open", retry_after=30))
+    assert job.status == "queued"
+    assert job.run_after >= before + datetime.timedelta(seconds=30)
+
+
+def test_other_failures_use_the_job_backoff(engine, monkeypatch):
+    before = datetime.datetime.utcnow()
+    job = _run_failing_job(engine, monkeypatch, RuntimeError("boom"))
+    assert job.status == "queued"
+    assert job.run_after < before + datetime.timedelta(seconds=jobs.JOB_RETRY_BASE_SECONDS + 5)
+    assert job.error == "boom"
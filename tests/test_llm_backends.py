@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+
+import llm_backends
+import review_logic
+from llm_backends import LLMRouter, StubBackend
+
+MESSAGES = [{"role": "user", "content": "Review this."}]
+KWARGS = {"temperature": 0, "max_tokens": 100, "tokens": 0}
+
+
+def test_stub_reply_follows_the_review_type_not_the_text(monkeypatch):
+    monkeypatch.delenv("LLM_ROUTE_WRITEUP", raising=False)
+    monkeypatch.setattr(review_logic, "router", LLMRouter("stub"))
+    result = review_logic.analyze_writeup("This essay is about plagiarism and grammar in student work.")
+    assert not review_logic.is_error_result(result)
+    assert set(result["scores"]) == {"grammar", "clarity", "structure"}
+
+
+def test_backend_that_cannot_be_built_falls_back(monkeypatch):
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    monkeypatch.delenv("LLM_ROUTE_CODE", raising=False)
+    router = LLMRouter("groq:llama-3.1-8b-instant,stub")
+    completion = router.complete("code", MESSAGES, **KWARGS)
+    assert "offline stub" in completion.text
+    assert router.fallbacks == 1
+    assert "groq:llama-3.1-8b-instant" in router.snapshot()["setup_errors"]
+    # Not rebuilt on later calls, and tried last
+    assert router.candidates("code")[0] == ("stub", "stub")
+
+
+def test_demoted_backend_is_tried_again_after_idling(monkeypatch):
+    monkeypatch.delenv("LLM_ROUTE_CODE", raising=False)
+    monkeypatch.setattr(llm_backends, "LLM_LATENCY_HALF_LIFE_SECONDS", 0.05)
+    router = LLMRouter("stub:slow,stub:fast")
+    router._backend("stub", "slow").record_latency(llm_backends.LLM_FALLBACK_LATENCY_SECONDS * 4)
+    assert router.candidates("code")[0] == ("stub", "fast")
+    time.sleep(0.2)
+    assert router.candidates("code")[0] == ("stub", "slow")
+
+
+class _SlowStream(StubBackend):
+    async def stream_async(self, messages, temperature, max_tokens, tokens=0, review_type=""):
+        yield "first"
+        await asyncio.sleep(0.3)
+        yield "second"
+
+
+def test_stream_latency_is_time_to_first_piece(monkeypatch):
+    monkeypatch.delenv("LLM_ROUTE_CODE", raising=False)
+    router = LLMRouter("stub:streaming")
+    router.backends[("stub", "streaming")] = backend = _SlowStream("streaming")
+
+    async def collect():
+        return [piece async for piece in router.stream_async("code", MESSAGES, **KWARGS)]
+
+    assert asyncio.run(collect()) == ["first", "second"]
+    assert backend.latency < 0.1
+
+
+def test_every_backend_unavailable_raises(monkeypatch):
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    monkeypatch.delenv("LLM_ROUTE_CODE", raising=False)
+    with pytest.raises(llm_backends.LLMUnavailableError, match="could not be set up"):
+        LLMRouter("groq:llama-3.1-8b-instant").complete("code", MESSAGES, **KWARGS)
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from llm_transport import LLMTransport, LLMUnavailableError
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://llm.test/v1/chat/completions")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+def _failing(status: int):
+    def request():
+        raise _status_error(status)
+    return request
+
+
+def _open_transport() -> LLMTransport:
+    """A transport whose breaker has opened and whose reset window has passed"""
+    transport = LLMTransport(max_retries=0, rpm_limit=0, tpm_limit=0, breaker_failures=1,
+                             breaker_reset_seconds=0.01)
+    with pytest.raises(LLMUnavailableError):
+        transport.call(_failing(503), tokens=1)
+    assert transport.breaker.state == "open"
+    time.sleep(0.02)
+    return transport
+
+
+def test_cancelled_trial_frees_the_half_open_slot():
+    transport = _open_transport()
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        trial = asyncio.create_task(transport.call_async(hang, tokens=1))
+        await started.wait()
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        async def ok():
+            return "ok"
+
+        return await transport.call_async(ok, tokens=1)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert transport.breaker.state == "closed"
+
+
+def test_client_error_leaves_breaker_state_alone():
+    transport = LLMTransport(max_retries=0, rpm_limit=0, tpm_limit=0, breaker_failures=3)
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            transport.call(_failing(503), tokens=1)
+    with pytest.raises(httpx.HTTPStatusError):
+        transport.call(_failing(401), tokens=1)
+    assert transport.breaker.failures == 2
+
+
+def test_client_error_does_not_close_a_half_open_breaker():
+    transport = _open_transport()
+    with pytest.raises(httpx.HTTPStatusError):
+        transport.call(_failing(401), tokens=1)
+    assert transport.breaker.state == "half_open"
+    assert transport.call(lambda: "ok", tokens=1) == "ok"
+    assert transport.breaker.state == "closed"
+
+
+def test_malformed_retry_after_keeps_the_provider_error():
+    request = httpx.Request("POST", "https://llm.test/v1/chat/completions")
+    response = httpx.Response(503, request=request, headers={"retry-after": "soon, maybe"})
+
+    def fail():
+        raise httpx.HTTPStatusError("provider down", request=request, response=response)
+
+    transport = LLMTransport(max_retries=0, rpm_limit=0, tpm_limit=0)
+    with pytest.raises(LLMUnavailableError, match="provider down") as caught:
+        transport.call(fail, tokens=1)
+    assert caught.value.retry_after is None
+
+
+def test_failed_attempts_give_back_their_token_reservation(monkeypatch):
+    monkeypatch.setattr("llm_transport.LLM_BACKOFF_BASE_SECONDS", 0)
+    transport = LLMTransport(max_retries=3, rpm_limit=0, tpm_limit=6000)
+    with pytest.raises(LLMUnavailableError):
+        transport.call(_failing(503), tokens=2000)
+    # Four attempts, none of which got a response, leave the budget untouched
+    assert transport.tokens.tokens > 5990
@@ -0,0 +1,48 @@
+import threading
+
+from sqlmodel import Session, SQLModel, select
+
+import migrations
+from database import make_engine
+from models import SchemaMigration
+
+
+def test_concurrent_startups_apply_each_migration_once(tmp_path, monkeypatch):
+    engine = make_engine(f"sqlite:///{tmp_path / 'race.db'}")
+    SQLModel.metadata.create_all(engine)
+    runs = []
+    errors = []
+
+    def slow_migration(connection):
+        runs.append(threading.current_thread().name)
+        threading.Event().wait(0.3)
+
+    # Both processes read the applied set before either records the migration
+    both_read = threading.Barrier(2)
+
+    class RacingSession(Session):
+        def exec(self, statement, *args, **kwargs):
+            result = super().exec(statement, *args, **kwargs)
+            both_read.wait()
+            return result
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [("9999_slow", slow_migration)])
+    monkeypatch.setattr(migrations, "Session", RacingSession)
+
+    def startup():
+        try:
+            migrations.run_pending(engine)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=startup, name=f"process-{i}") for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(runs) == 1
+    with Session(engine) as session:
+        assert session.exec(select(SchemaMigration.name)).all() == ["9999_slow"]
+    engine.dispose()
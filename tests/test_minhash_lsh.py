@@ -0,0 +1,63 @@
+from sqlmodel import Session, select
+
+import minhash_lsh
+from conftest import prose
+from models import Submission
+
+
+def test_verbatim_copy_under_another_name_is_a_full_match(engine):
+    original = prose(1)
+    assert minhash_lsh.check_and_index(engine, "alice.txt", original) == []
+
+    matches = minhash_lsh.check_and_index(engine, "bob.txt", original)
+    assert [(m["file_name"], m["jaccard"]) for m in matches] == [("alice.txt", 1.0)]
+    assert matches[0]["spans"][0]["text"].startswith(original.split()[0])
+
+
+def test_submissions_with_the_same_client_file_name_match_each_other(engine):
+    original = prose(2)
+    edited = original.replace(original.split()[10], "changed", 1)
+    minhash_lsh.check_and_index(engine, "text_plagiarism_check", original)
+
+    matches = minhash_lsh.check_and_index(engine, "text_plagiarism_check", edited)
+    assert len(matches) == 1
+    assert matches[0]["jaccard"] >= 0.8
+
+
+def test_identical_content_is_stored_once(engine):
+    text = prose(3)
+    minhash_lsh.check_and_index(engine, "a.txt", text)
+    minhash_lsh.check_and_index(engine, "b.txt", text)
+    with Session(engine) as session:
+        assert len(session.exec(select(Submission.id)).all()) == 1
+
+
+def test_unrelated_text_does_not_match(engine):
+    minhash_lsh.check_and_index(engine, "a.txt", prose(4))
+    assert minhash_lsh.check_and_index(engine, "b.txt", prose(5)) == []
+
+
+def test_short_texts_skip_the_corpus(engine):
+    short = prose(6, words=minhash_lsh.MIN_WORDS - 1)
+    assert minhash_lsh.check_and_index(engine, "a.txt", short) == []
+    assert minhash_lsh.check_and_index(engine, "b.txt", short) == []
+    with Session(engine) as session:
+        assert session.exec(select(Submission.id)).all() == []
+
+
+def test_match_excludes_only_the_given_submission(engine):
+    text = prose(7)
+    words = minhash_lsh.tokenize(text)
+    hashes = minhash_lsh.shingle_hashes(words)
+    signature = minhash_lsh.minhash_signature(hashes)
+    with Session(engine) as session:
+        first = minhash_lsh.index_submission(session, "same.txt", text, signature)
+        second = minhash_lsh.index_submission(session, "same.txt", text, signature)
+        matches = minhash_lsh._match_signature(session, text, words, hashes, signature, exclude_id=second.id)
+    assert [m["submission_id"] for m in matches] == [first.id]
+
+
+def test_pairwise_similar_finds_the_copied_batch_item():
+    base = prose(8)
+    pairs = minhash_lsh.pairwise_similar([base, prose(9), base, "too short"])
+    assert [(p["a"], p["b"], p["similarity"]) for p in pairs] == [(0, 2, 1.0)]
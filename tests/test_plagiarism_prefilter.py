@@ -0,0 +1,65 @@
+import pytest
+
+import plagiarism_prefilter
+from conftest import prose
+from plagiarism_prefilter import (
+    PLAGIARISM_ESCALATE_HIGH, PLAGIARISM_ESCALATE_LOW, _decide, assess_code, assess_text,
+)
+
+CODE = "\n".join(f"def total_{i}(values):\n    return sum(values) + {i}\n" for i in range(10))
+
+
+@pytest.mark.parametrize("score, escalate", [
+    (PLAGIARISM_ESCALATE_LOW - 1, False),
+    (PLAGIARISM_ESCALATE_LOW, True),
+    (PLAGIARISM_ESCALATE_HIGH - 1, True),
+    (PLAGIARISM_ESCALATE_HIGH, False),
+])
+def test_only_the_uncertainty_band_is_escalated(score, escalate):
+    assert _decide(score, short=False)[0] is escalate
+
+
+def test_short_inputs_are_always_decided_locally():
+    assert _decide((PLAGIARISM_ESCALATE_LOW + PLAGIARISM_ESCALATE_HIGH) // 2, short=True) == (
+        False, "too short for the LLM to add information"
+    )
+
+
+def test_two_stage_off_escalates_everything(monkeypatch):
+    monkeypatch.setattr(plagiarism_prefilter, "PLAGIARISM_TWO_STAGE", False)
+    assert _decide(100, short=True)[0] is True
+
+
+def test_full_corpus_match_is_decided_locally():
+    assessment = assess_text(prose(1), [{"jaccard": 1.0}])
+    assert not assessment.escalate
+    assert assessment.local_score == 100
+    assert assessment.result["confidence"] == "High"
+    assert assessment.summary()["stage"] == "local"
+
+
+def test_middling_text_is_escalated(monkeypatch):
+    monkeypatch.setattr(plagiarism_prefilter, "calculate_dynamic_plagiarism_score", lambda text: 80)
+    assessment = assess_text(prose(2), [])
+    # Half heuristic, half style shift, which is zero for a single paragraph
+    assert assessment.local_score == 40
+    assert assessment.escalate
+    assert assessment.result is None
+
+
+def test_short_text_is_scored_by_the_heuristic_alone(monkeypatch):
+    monkeypatch.setattr(plagiarism_prefilter, "calculate_dynamic_plagiarism_score", lambda text: 50)
+    assessment = assess_text("Only a few words here.", [])
+    assert assessment.local_score == 50
+    assert not assessment.escalate
+
+
+def test_code_match_and_short_code(monkeypatch):
+    assessment = assess_code(CODE, "python", [{"similarity": 0.9}])
+    assert (assessment.local_score, assessment.escalate) == (90, False)
+    assert assessment.result["indicators"] == []
+
+    monkeypatch.setattr(plagiarism_prefilter, "calculate_dynamic_code_plagiarism_score", lambda code, lang: 50)
+    short = assess_code("print(1)\n", "python", [])
+    assert (short.local_score, short.escalate) == (50, False)
+    assert short.reason == "too short for the LLM to add information"
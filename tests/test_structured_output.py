@@ -0,0 +1,21 @@
+import pytest
+
+from structured_output import StructuredOutputError, parse_response
+
+
+@pytest.mark.parametrize("score", ["null", "[80]", "1e999", "-1e999", '"NaN"', '"high"'])
+def test_unusable_writeup_score_is_a_validation_error(score):
+    reply = f'{{"scores": {{"grammar": {score}, "clarity": 70, "structure": 60}}, "overall_feedback": "ok"}}'
+    with pytest.raises(StructuredOutputError, match="scores.grammar"):
+        parse_response(reply, "writeup")
+
+
+@pytest.mark.parametrize("score", ["null", "[80]", "1e999"])
+def test_unusable_plagiarism_score_is_a_validation_error(score):
+    with pytest.raises(StructuredOutputError, match="plagiarism_score"):
+        parse_response(f'{{"plagiarism_score": {score}}}', "plagiarism")
+
+
+def test_scores_are_coerced_and_clamped():
+    reply = '{"scores": {"grammar": "85%", "clarity": 140, "structure": 59.6}, "overall_feedback": "ok"}'
+    assert parse_response(reply, "writeup")["scores"] == {"grammar": 85, "clarity": 100, "structure": 60}
@@ -0,0 +1,126 @@
+from sqlmodel import Session, select
+
+import winnowing
+from models import FingerprintFrequency
+
+BINARY_SEARCH = '''
+def binary_search(items, target):
+    low, high = 0, len(items) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        if items[middle] == target:
+            return middle
+        elif items[middle] < target:
+            low = middle + 1
+        else:
+            high = middle - 1
+    return -1
+'''
+
+# The same code with every identifier renamed and the literals changed
+RENAMED = '''
+def find(seq, wanted):
+    lo, hi = 1, len(seq) - 2
+    while lo <= hi:
+        mid = (lo + hi) // 3
+        if seq[mid] == wanted:
+            return mid
+        elif seq[mid] < wanted:
+            lo = mid + 5
+        else:
+            hi = mid - 5
+    return -7
+'''
+
+WORD_COUNT = '''
+def count_words(path):
+    counts = {}
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            for word in line.lower().split():
+                word = word.strip(".,;:!?")
+                if not word:
+                    continue
+                counts[word] = counts.get(word, 0) + 1
+    return sorted(counts.items(), key=lambda pair: pair[1], reverse=True)
+'''
+
+MATRIX = '''
+class Matrix:
+    def __init__(self, rows):
+        self.rows = [list(row) for row in rows]
+
+    def transpose(self):
+        return Matrix(zip(*self.rows))
+
+    def __mul__(self, other):
+        columns = other.transpose().rows
+        return Matrix([[sum(a * b for a, b in zip(row, column)) for column in columns] for row in self.rows])
+'''
+
+HEADER = '''
+import os
+import sys
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def main(argv):
+    if len(argv) < 2:
+        print("usage: tool FILE", file=sys.stderr)
+        return 2
+    with open(argv[1]) as handle:
+        config = json.load(handle)
+    logger.info("loaded %s", os.path.basename(argv[1]))
+    return 0
+'''
+
+
+def test_renamed_copy_is_a_full_match_with_line_ranges(engine):
+    assert winnowing.check_and_index(engine, "a.py", BINARY_SEARCH, "python") == []
+    matches = winnowing.check_and_index(engine, "b.py", RENAMED, "python")
+    assert [(m["file_name"], m["similarity"]) for m in matches] == [("a.py", 1.0)]
+    block = matches[0]["line_matches"][0]
+    assert block["query_lines"][0] >= 2 and block["source_lines"][1] <= 13
+
+
+def test_unrelated_code_and_other_languages_do_not_match(engine):
+    winnowing.check_and_index(engine, "a.py", BINARY_SEARCH, "python")
+    assert winnowing.check_and_index(engine, "b.py", WORD_COUNT, "python") == []
+    # The language is part of every hash
+    assert winnowing.check_and_index(engine, "c.js", BINARY_SEARCH, "javascript") == []
+
+
+def test_short_code_skips_the_corpus(engine):
+    short = "x = 1\nprint(x)\n"
+    assert winnowing.fingerprint(short, "python") == []
+    assert winnowing.check_and_index(engine, "a.py", short, "python") == []
+    assert winnowing.check_and_index(engine, "b.py", short, "python") == []
+
+
+def test_boilerplate_fingerprints_are_ignored(engine, monkeypatch):
+    monkeypatch.setattr(winnowing, "MAX_DOC_FREQ", 1)
+    winnowing.check_and_index(engine, "a.py", HEADER + BINARY_SEARCH, "python")
+    winnowing.check_and_index(engine, "b.py", HEADER + WORD_COUNT, "python")
+    with Session(engine) as session:
+        assert max(session.exec(select(FingerprintFrequency.submissions)).all()) == 2
+
+    # Shares only the header, now stored for two submissions
+    assert winnowing.check_and_index(engine, "c.py", HEADER + MATRIX, "python") == []
+    # A real copy behind the same header is still found
+    matches = winnowing.check_and_index(engine, "d.py", HEADER + RENAMED, "python")
+    assert [m["file_name"] for m in matches] == ["a.py"]
+
+
+def test_winnowing_keeps_a_fingerprint_from_every_window():
+    hashes = winnowing.kgram_hashes(winnowing.tokenize(WORD_COUNT, "python"), "python")
+    selected = {(fp.hash, fp.start_line) for fp in winnowing.winnow(hashes)}
+    for start in range(len(hashes) - winnowing.WINDOW + 1):
+        assert any((fp.hash, fp.start_line) in selected for fp in hashes[start:start + winnowing.WINDOW])
+    assert len(selected) < len(hashes)
+
+
+def test_pairwise_similar_within_a_batch():
+    pairs = winnowing.pairwise_similar([BINARY_SEARCH, WORD_COUNT, RENAMED], "python")
+    assert [(p["a"], p["b"]) for p in pairs] == [(0, 2)]
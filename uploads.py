@@ -0,0 +1,175 @@
+"""
+Reading uploaded files as text with bounded memory.
+
+Starlette spools each uploaded file to a temporary file while parsing the
+form. read_upload_text() reads it back in UPLOAD_READ_BYTES windows
+through an incremental decoder, so the raw bytes are never held in memory
+next to the decoded text. Reading stops with a 413 as soon as a file
+goes over MAX_UPLOAD_BYTES.
+
+Only one raw window is in memory at a time, but the decoded text is
+returned whole: the cache key, corpus fingerprinting and storage all
+need the complete document, and chunking splits it on paragraph
+boundaries. Memory per file is therefore bounded by the decoded text,
+at most MAX_UPLOAD_BYTES characters. CPython stores up to 4 bytes per
+character, so that is at most about 4 x MAX_UPLOAD_BYTES (20 MB at the
+default). It is briefly twice that while the decoded windows are joined.
+
+The encoding is taken from a byte order mark if there is one, otherwise
+UTF-8 is tried first. A file that is not valid UTF-8 is decoded again
+with the encoding charset_normalizer detects from its first window, if
+that library is installed, and finally with the FALLBACK_ENCODINGS.
+
+RequestSizeLimitMiddleware caps whole request bodies at MAX_REQUEST_BYTES,
+for JSON bodies and multi-file uploads, before anything is spooled.
+"""
+import os
+import codecs
+import logging
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException, UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Per uploaded file
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(5 * 1024 * 1024)))
+# Whole request body, across all files and fields
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_READ_BYTES = 64 * 1024
+# Tried in order after UTF-8 and detection; latin-1 decodes any byte sequence
+FALLBACK_ENCODINGS = ("cp1252", "latin-1")
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+class UploadedText(NamedTuple):
+    text: str
+    encoding: str
+    size: int  # Bytes read
+
+
+def _too_large(filename: Optional[str], limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"{filename or 'Upload'} is larger than {limit} bytes")
+
+def bom_encoding(head: bytes) -> Optional[str]:
+    # UTF-32 LE starts with the UTF-16 LE mark, so the longer marks are checked first
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    return None
+
+def detect_encoding(sample: bytes) -> Optional[str]:
+    """Best guess from charset_normalizer, or None when it is not installed or unsure"""
+    try:
+        from charset_normalizer import from_bytes
+    except ImportError:
+        return None
+    matches = from_bytes(sample)
+    best = matches.best()
+    if best is None:
+        return None
+    # Short samples often fit several code pages equally well; prefer the Western default then
+    for match in matches:
+        if match.chaos == best.chaos and FALLBACK_ENCODINGS[0] in match.could_be_from_charset:
+            return FALLBACK_ENCODINGS[0]
+    return best.encoding
+
+async def _decode(file: UploadFile, encoding: str, limit: int) -> UploadedText:
+    """
+    Decode the whole file; UnicodeDecodeError if it is not valid in encoding.
+    One raw window at a time, but the decoded windows are kept and joined.
+    """
+    await file.seek(0)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="strict")
+    pieces = []
+    size = 0
+    while True:
+        window = await file.read(UPLOAD_READ_BYTES)
+        if not window:
+            break
+        size += len(window)
+        if size > limit:
+            raise _too_large(file.filename, limit)
+        pieces.append(decoder.decode(window))
+    pieces.append(decoder.decode(b"", final=True))
+    return UploadedText("".join(pieces), encoding, size)
+
+async def read_upload_text(file: UploadFile, limit: int = MAX_UPLOAD_BYTES) -> UploadedText:
+    """
+    The upload as text. Raises HTTPException 413 when it is over limit
+    bytes, before decoding anything when Starlette counted the size while
+    spooling, otherwise as soon as the limit is passed.
+    """
+    if file.size is not None and file.size > limit:
+        raise _too_large(file.filename, limit)
+    head = await file.read(UPLOAD_READ_BYTES)
+
+    candidates = [bom_encoding(head) or "utf-8"]
+    tried_detection = False
+    while candidates:
+        encoding = candidates.pop(0)
+        try:
+            return await _decode(file, encoding, limit)
+        except (UnicodeDecodeError, LookupError):
+            if not tried_detection:
+                tried_detection = True
+                detected = detect_encoding(head)
+                if detected and detected not in candidates:
+                    candidates.append(detected)
+                candidates.extend(e for e in FALLBACK_ENCODINGS if e not in candidates)
+            logger.info("upload is not valid in encoding, trying the next one",
+                        extra={"filename": file.filename, "encoding": encoding})
+    # Unreachable while latin-1 is a fallback
+    raise HTTPException(status_code=400, detail=f"{file.filename or 'Upload'} is not readable as text")
+
+
+# --- ASGI middleware ---
+
+class RequestSizeLimitMiddleware:
+    """
+    413 for request bodies over max_bytes: straight away when Content-Length
+    says so, otherwise as soon as that many bytes have been received.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send):
+        body = b'{"detail":"Request body is too large"}'
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-raises HTTPException from body parsing and
+                    # its exception handler turns it into the response
+                    raise HTTPException(status_code=413, detail="Request body is too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,400 @@
+"""
+Token-level code fingerprinting (MOSS-style winnowing) for code plagiarism checks.
+
+Code is tokenized per language with identifiers, strings and numbers
+normalized away, so renaming variables or changing literals does not hide
+a copy. Hashes of every k-token window are winnowed down to a small set of
+fingerprints. Those fingerprints go into the CodeFingerprint inverted index
+together with the line range they came from, which lets a check find every
+prior submission that shares fingerprints and report the matching line
+ranges in both files.
+
+Matching cost does not grow with the corpus. Fingerprints stored for more
+than MAX_DOC_FREQ submissions are boilerplate (imports, main stubs,
+getters); FingerprintFrequency marks them so they are skipped without
+reading their postings, and similarity is the share of the remaining
+fingerprints found in a prior submission. No check reads more than
+MAX_POSTINGS postings. Code under MIN_TOKENS normalized tokens is too small to tell a
+copy from a coincidence and skips the corpus entirely.
+"""
+import os
+import re
+import hashlib
+from collections import defaultdict
+from typing import Dict, List, NamedTuple
+
+from sqlmodel import Session, select, func
+
+from database import upsert_sums
+from minhash_lsh import content_hash
+from models import Submission, CodeFingerprint, FingerprintFrequency
+
+# Tokens per k-gram and k-grams per winnowing window. Any shared run of at
+# least K_GRAM + WINDOW - 1 normalized tokens is guaranteed to be detected.
+K_GRAM = int(os.getenv("WINNOW_K", "6"))
+WINDOW = int(os.getenv("WINNOW_WINDOW", "4"))
+# Minimum share of the submitted file's fingerprints found in a prior submission
+MATCH_THRESHOLD = float(os.getenv("WINNOW_MATCH_THRESHOLD", "0.25"))
+# Fingerprints stored for more submissions than this are ignored when matching
+MAX_DOC_FREQ = int(os.getenv("WINNOW_MAX_DOC_FREQ", "50"))
+# Postings read per check, however large the corpus
+MAX_POSTINGS = int(os.getenv("WINNOW_MAX_POSTINGS", "20000"))
+# Code with fewer normalized tokens is neither matched nor indexed
+MIN_TOKENS = int(os.getenv("WINNOW_MIN_TOKENS", "40"))
+# Fewest non-boilerplate fingerprints a file needs to be matched
+MIN_FINGERPRINTS = max(1, MIN_TOKENS // WINDOW)
+# Matches returned per query
+MAX_MATCHES = 5
+# Fingerprints per IN (...) lookup, below SQLite's bound-parameter limit
+_LOOKUP_CHUNK = 500
+
+
+class Token(NamedTuple):
+    text: str
+    line: int
+
+
+class Fingerprint(NamedTuple):
+    hash: int
+    start_line: int
+    end_line: int
+
+
+_C_LIKE_KEYWORDS = {
+    "if", "else", "for", "while", "do", "switch", "case", "default", "break", "continue",
+    "return", "try", "catch", "finally", "throw", "new", "class", "this", "true", "false",
+    "null", "void", "static", "public", "private", "protected", "const", "import", "extends",
+}
+
+KEYWORDS: Dict[str, set] = {
+    "python": {
+        "and", "as", "assert", "async", "await", "break", "class", "continue", "def", "del",
+        "elif", "else", "except", "finally", "for", "from", "global", "if", "import", "in",
+        "is", "lambda", "nonlocal", "not", "or", "pass", "raise", "return", "try", "while",
+        "with", "yield", "None", "True", "False", "self", "print", "range", "len",
+    },
+    "javascript": _C_LIKE_KEYWORDS | {
+        "function", "var", "let", "typeof", "instanceof", "undefined", "async", "await",
+        "yield", "of", "in", "delete", "export", "from", "console", "document", "window",
+    },
+    "java": _C_LIKE_KEYWORDS | {
+        "int", "long", "short", "byte", "char", "float", "double", "boolean", "String",
+        "final", "abstract", "interface", "implements", "package", "super", "throws",
+        "instanceof", "System", "out", "println", "main", "args",
+    },
+    "c++": _C_LIKE_KEYWORDS | {
+        "int", "long", "short", "char", "float", "double", "bool", "unsigned", "signed",
+        "struct", "template", "typename", "namespace", "using", "std", "auto", "virtual",
+        "include", "define", "cout", "cin", "endl", "nullptr", "sizeof", "delete", "main",
+    },
+    "html": {
+        "html", "head", "body", "title", "meta", "link", "script", "style", "div", "span",
+        "p", "a", "img", "ul", "ol", "li", "table", "tr", "td", "th", "form", "input",
+        "button", "label", "h1", "h2", "h3", "h4", "h5", "h6", "header", "footer", "nav",
+        "section", "main", "class", "id", "href", "src", "type", "name", "value", "doctype",
+    },
+    "css": {
+        "color", "background", "margin", "padding", "border", "display", "position", "width",
+        "height", "font", "size", "weight", "family", "flex", "grid", "top", "left", "right",
+        "bottom", "none", "block", "inline", "absolute", "relative", "auto", "important",
+        "media", "hover", "px", "em", "rem", "vh", "vw", "font-size", "font-weight",
+        "font-family", "background-color", "text-align", "line-height", "border-radius",
+        "justify-content", "align-items", "flex-direction", "box-sizing", "z-index",
+    },
+    "sql": {
+        "select", "from", "where", "insert", "into", "values", "update", "set", "delete",
+        "create", "table", "drop", "alter", "join", "inner", "left", "right", "outer", "on",
+        "group", "by", "order", "having", "limit", "and", "or", "not", "null", "as", "distinct",
+        "count", "sum", "avg", "min", "max", "primary", "key", "foreign", "references",
+        "int", "integer", "varchar", "text", "union", "in", "is", "like", "between", "case",
+        "when", "then", "else", "end", "asc", "desc",
+    },
+}
+KEYWORDS["other"] = _C_LIKE_KEYWORDS
+
+# Comment syntax per language; everything else shares one token grammar
+_COMMENT_PATTERNS = {
+    "python": r"\#[^\n]*",
+    "javascript": r"//[^\n]*|/\*.*?\*/",
+    "java": r"//[^\n]*|/\*.*?\*/",
+    "c++": r"//[^\n]*|/\*.*?\*/",
+    "html": r"<!--.*?-->",
+    "css": r"/\*.*?\*/",
+    "sql": r"--[^\n]*|/\*.*?\*/",
+    "other": r"//[^\n]*|/\*.*?\*/|\#[^\n]*",
+}
+
+_TOKEN_BODY = r"""
+    (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|`(?:\\.|[^`\\])*`)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|0[xX][0-9a-fA-F]+)
+  | (?P<name>[A-Za-z_$][A-Za-z0-9_${name_extra}]*)
+  | (?P<op>==|!=|<=|>=|&&|\|\||\+\+|--|->|=>|::|<<|>>|[^\sA-Za-z0-9_])
+"""
+
+# Markup and stylesheet names may contain hyphens (font-size, data-id)
+_TOKEN_RES = {
+    language: re.compile(
+        rf"(?P<comment>{comment})|" + _TOKEN_BODY.replace("{name_extra}", "-" if language in ("html", "css") else ""),
+        re.DOTALL | re.VERBOSE
+    )
+    for language, comment in _COMMENT_PATTERNS.items()
+}
+
+
+def normalize_language(language: str) -> str:
+    language = (language or "").strip().lower()
+    return {"js": "javascript", "cpp": "c++", "c": "c++", "py": "python"}.get(
+        language, language if language in KEYWORDS else "other"
+    )
+
+def tokenize(code: str, language: str) -> List[Token]:
+    """Normalized token stream: identifiers -> V, strings -> S, numbers -> N"""
+    language = normalize_language(language)
+    keywords = KEYWORDS[language]
+    case_insensitive = language in ("sql", "html", "css")
+    tokens = []
+    line = 1
+    last_end = 0
+    for match in _TOKEN_RES[language].finditer(code):
+        line += code.count("\n", last_end, match.start())
+        last_end = match.start()
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        if kind == "string":
+            text = "S"
+        elif kind == "number":
+            text = "N"
+        elif kind == "name":
+            word = match.group().lower() if case_insensitive else match.group()
+            text = word if word in keywords else "V"
+        else:
+            text = match.group()
+        tokens.append(Token(text, line))
+    return tokens
+
+def kgram_hashes(tokens: List[Token], language: str, k: int = K_GRAM) -> List[Fingerprint]:
+    """Hash of every k-token window; the language is mixed in so corpora don't cross"""
+    salt = normalize_language(language).encode("utf-8") + b"\x00"
+    hashes = []
+    for i in range(len(tokens) - k + 1):
+        gram = "\x01".join(t.text for t in tokens[i:i + k]).encode("utf-8")
+        digest = hashlib.blake2b(salt + gram, digest_size=8).digest()
+        hashes.append(Fingerprint(int.from_bytes(digest, "big", signed=True), tokens[i].line, tokens[i + k - 1].line))
+    return hashes
+
+def winnow(hashes: List[Fingerprint], window: int = WINDOW) -> List[Fingerprint]:
+    """Robust winnowing: keep the rightmost minimum hash of every window"""
+    if len(hashes) <= window:
+        return [min(hashes, key=lambda f: f.hash)] if hashes else []
+    selected = []
+    last_index = -1
+    for start in range(len(hashes) - window + 1):
+        best = start
+        for i in range(start + 1, start + window):
+            if hashes[i].hash <= hashes[best].hash:
+                best = i
+        if best != last_index:
+            selected.append(hashes[best])
+            last_index = best
+    return selected
+
+def fingerprint(code: str, language: str) -> List[Fingerprint]:
+    """Winnowed fingerprints, or none for code under MIN_TOKENS tokens"""
+    tokens = tokenize(code, language)
+    if len(tokens) < MIN_TOKENS:
+        return []
+    return winnow(kgram_hashes(tokens, language))
+
+def _merge_ranges(pairs: List[tuple]) -> List[dict]:
+    """Merge overlapping (query_range, source_range) pairs into line blocks"""
+    blocks = []
+    for q_start, q_end, s_start, s_end in sorted(pairs):
+        if blocks:
+            last = blocks[-1]
+            if q_start <= last["query_lines"][1] + 1 and s_start <= last["source_lines"][1] + 1 \
+                    and s_end >= last["source_lines"][0] - 1:
+                last["query_lines"][1] = max(last["query_lines"][1], q_end)
+                last["source_lines"][0] = min(last["source_lines"][0], s_start)
+                last["source_lines"][1] = max(last["source_lines"][1], s_end)
+                continue
+        blocks.append({"query_lines": [q_start, q_end], "source_lines": [s_start, s_end]})
+    return blocks
+
+def _match_fingerprints(session: Session, fingerprints: List[Fingerprint]) -> List[dict]:
+    by_hash = defaultdict(list)
+    for fp in fingerprints:
+        by_hash[fp.hash].append(fp)
+
+    hashes = list(by_hash)
+    common = set()
+    for start in range(0, len(hashes), _LOOKUP_CHUNK):
+        common.update(session.exec(
+            select(FingerprintFrequency.fingerprint)
+            .where(FingerprintFrequency.fingerprint.in_(hashes[start:start + _LOOKUP_CHUNK]))
+            .where(FingerprintFrequency.submissions > MAX_DOC_FREQ)
+        ).all())
+    informative = [fp_hash for fp_hash in hashes if fp_hash not in common]
+    # Similarity is over the informative fingerprints only, so a file that is
+    # mostly boilerplate needs enough of its own code to be judged at all
+    if len(informative) < MIN_FINGERPRINTS:
+        return []
+
+    shared = defaultdict(set)
+    pairs = defaultdict(list)
+    remaining = MAX_POSTINGS
+    for start in range(0, len(informative), _LOOKUP_CHUNK):
+        if remaining <= 0:
+            break
+        postings = session.exec(
+            select(CodeFingerprint.fingerprint, CodeFingerprint.submission_id,
+                   CodeFingerprint.start_line, CodeFingerprint.end_line)
+            .where(CodeFingerprint.fingerprint.in_(informative[start:start + _LOOKUP_CHUNK]))
+            .limit(remaining)
+        ).all()
+        remaining -= len(postings)
+        for fp_hash, sub_id, s_start, s_end in postings:
+            shared[sub_id].add(fp_hash)
+            for fp in by_hash[fp_hash]:
+                pairs[sub_id].append((fp.start_line, fp.end_line, s_start, s_end))
+
+
+    total = len(informative)
+    scored = sorted(
+        ((len(found) / total, sub_id) for sub_id, found in shared.items() if len(found) / total >= MATCH_THRESHOLD),
+        reverse=True
+    )[:MAX_MATCHES]
+    if not scored:
+        return []
+
+    ids = [sub_id for _, sub_id in scored]
+    names = dict(session.exec(select(Submission.id, Submission.file_name).where(Submission.id.in_(ids))).all())
+    source_totals = dict(session.exec(
+        select(CodeFingerprint.submission_id, func.count(func.distinct(CodeFingerprint.fingerprint)))
+        .where(CodeFingerprint.submission_id.in_(ids))
+        .group_by(CodeFingerprint.submission_id)
+    ).all())
+    return [
+        {
+            "submission_id": sub_id,
+            "file_name": names.get(sub_id, "unknown"),
+            "similarity": round(similarity, 4),
+            "source_similarity": round(len(shared[sub_id]) / max(source_totals.get(sub_id, 1), 1), 4),
+            "line_matches": _merge_ranges(pairs[sub_id])
+        }
+        for similarity, sub_id in scored
+    ]
+
+def index_submission(session: Session, file_name: str, code: str, language: str,
+                     fingerprints: List[Fingerprint] = None) -> Submission:
+    """Store code as a Submission and add its fingerprints to the inverted index"""
+    if fingerprints is None:
+        fingerprints = fingerprint(code, language)
+    submission = Submission(file_name=file_name, file_text=code, content_hash=content_hash(code),
+                            language=normalize_language(language))
+    session.add(submission)
+    session.flush()
+    unique = {(fp.hash, fp.start_line): fp for fp in fingerprints}
+    session.add_all(
+        CodeFingerprint(fingerprint=fp.hash, submission_id=submission.id,
+                        start_line=fp.start_line, end_line=fp.end_line)
+        for fp in unique.values()
+    )
+    # Sorted so concurrent writers take row locks in the same order
+    upsert_sums(session.connection(), FingerprintFrequency.__table__, ("fingerprint",), [
+        {"fingerprint": fp_hash, "submissions": 1} for fp_hash in sorted({fp.hash for fp in fingerprints})
+    ], ("submissions",))
+    return submission
+
+def check_and_index(engine, file_name: str, code: str, language: str) -> List[dict]:
+    """
+    Match code against every prior submission in the same language, then
+    add it to the corpus. Exact resubmissions are reported but not stored twice.
+    """
+    fingerprints = fingerprint(code, language)
+    if not fingerprints:
+        return []
+    digest = content_hash(code)
+    with Session(engine) as session:
+        matches = _match_fingerprints(session, fingerprints)
+        stored = session.exec(select(Submission.id).where(Submission.content_hash == digest).limit(1)).first()
+        if stored is None:
+            index_submission(session, file_name, code, language, fingerprints)
+            session.commit()
+    return matches
+
+def apply_matches(result: dict, matches: List[dict]) -> dict:
+    """Fold fingerprint matches into a check_code_plagiarism result"""
+    result["sources"] = [
+        {
+            "title": f"Submission #{m['submission_id']}: {m['file_name']}",
+            "uri": f"submission:{m['submission_id']}",
+            "similarity": f"{round(m['similarity'] * 100)}%",
+            "matched_patterns": [
+                f"lines {b['query_lines'][0]}-{b['query_lines'][1]} match lines "
+                f"{b['source_lines'][0]}-{b['source_lines'][1]}"
+                for b in m["line_matches"]
+            ],
+            "submission_id": m["submission_id"],
+            "source_similarity": m["source_similarity"],
+            "line_matches": m["line_matches"]
+        }
+        for m in matches
+    ]
+    if not matches:
+        return result
+
+    best = matches[0]
+    result["plagiarism_score"] = max(result.get("plagiarism_score", 0), round(best["similarity"] * 100))
+    if best["similarity"] >= 0.8:
+        result["confidence"] = "High"
+    result["summary"] = (
+        f"{result.get('summary', '')} {len(matches)} prior submission(s) share normalized token "
+        f"fingerprints; closest is #{best['submission_id']} covering ~{round(best['similarity'] * 100)}% of this file."
+    ).strip()
+    result.setdefault("indicators", []).append({
+        "pattern": "Fingerprint Match",
+        "description": f"Matches submission #{best['submission_id']} even after renaming identifiers and literals",
+        "severity": "High" if best["similarity"] >= 0.6 else "Medium"
+    })
+    return result
+
+def pairwise_similar(codes: List[str], language: str) -> List[dict]:
+    """
+    Pairs within a set of files (e.g. one batch upload) that share
+    fingerprints, with the matching line ranges of each pair.
+    """
+    prints = [fingerprint(code, language) for code in codes]
+    postings = defaultdict(list)
+    for index, fps in enumerate(prints):
+        for fp in fps:
+            postings[fp.hash].append((index, fp))
+
+    shared = defaultdict(set)
+    ranges = defaultdict(list)
+    for fp_hash, entries in postings.items():
+        for a_pos, (a, fp_a) in enumerate(entries):
+            for b, fp_b in entries[a_pos + 1:]:
+                if a == b:
+                    continue
+                first, second = (fp_a, fp_b) if a < b else (fp_b, fp_a)
+                key = (min(a, b), max(a, b))
+                shared[key].add(fp_hash)
+                ranges[key].append((first.start_line, first.end_line, second.start_line, second.end_line))
+
+    pairs = []
+    for (a, b), found in shared.items():
+        smaller = min(len({fp.hash for fp in prints[a]}), len({fp.hash for fp in prints[b]}))
+        similarity = len(found) / max(smaller, 1)
+        if similarity >= MATCH_THRESHOLD:
+            pairs.append({
+                "a": a,
+                "b": b,
+                "similarity": round(similarity, 4),
+                "line_matches": [
+                    {"a_lines": block["query_lines"], "b_lines": block["source_lines"]}
+                    for block in _merge_ranges(ranges[(a, b)])
+                ]
+            })
+    pairs.sort(key=lambda p: p["similarity"], reverse=True)
+    return pairs
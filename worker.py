@@ -0,0 +1,181 @@
+"""
+Background worker pool for the job queue (see jobs.py).
+
+    python worker.py --processes 4 --concurrency 8
+
+Each process runs up to --concurrency jobs at a time on its own event
+loop, so API workers never wait on inference for queued reviews.
+"""
+import os
+import json
+import time
+import socket
+import signal
+import asyncio
+import logging
+import argparse
+import multiprocessing
+
+from dotenv import load_dotenv
+
+# Load environment variables before the settings below are read
+load_dotenv()
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Poll interval when the queue is empty
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+# How often a running job heartbeats and checks for cancellation
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "5"))
+CALLBACK_TIMEOUT_SECONDS = float(os.getenv("JOB_CALLBACK_TIMEOUT_SECONDS", "10"))
+CALLBACK_ATTEMPTS = 3
+
+
+async def send_callback(url: str, body: dict):
+    import jobs
+
+    # Checked again at send time in case the host now resolves elsewhere
+    try:
+        await run_in_threadpool(jobs.validate_callback_url, url)
+    except ValueError as e:
+        logger.warning("job callback refused", extra={"url": url, "error": str(e)})
+        return
+    async with httpx.AsyncClient(timeout=CALLBACK_TIMEOUT_SECONDS) as client:
+        for attempt in range(1, CALLBACK_ATTEMPTS + 1):
+            try:
+                response = await client.post(url, content=json.dumps(body, default=str),
+                                             headers={"Content-Type": "application/json"})
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError as e:
+                logger.warning("job callback failed", extra={"url": url, "attempt": attempt, "error": str(e)})
+            await asyncio.sleep(2 ** attempt)
+
+def _error_message(feedback) -> str:
+    if isinstance(feedback, str):
+        return feedback
+    return feedback.get("summary") or feedback.get("overall_feedback") or "Review failed"
+
+async def run_job(engine, job):
+    import jobs
+    import review_service
+    from review_logic import is_error_result
+    from llm_transport import LLMUnavailableError
+
+    payload = json.loads(job.payload)
+    task = asyncio.create_task(review_service.run_review(
+        job.review_type, payload["text"], payload.get("filename"),
+        payload.get("language"), payload.get("no_cache", False)
+    ))
+    # Heartbeat while the review runs, and stop it if the job was cancelled
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=JOB_HEARTBEAT_SECONDS)
+        if done:
+            break
+        if await run_in_threadpool(jobs.heartbeat, engine, job.id) == "cancelled":
+            task.cancel()
+            logger.info("job cancelled", extra={"job_id": job.id})
+            return
+
+    error = retry_after = None
+    try:
+        feedback, cache_status = task.result()
+    except LLMUnavailableError as e:
+        error, retry_after = str(e), e.retry_after
+    except Exception as e:
+        error = str(e)
+    else:
+        # Only LLMUnavailableError is raised; other LLM failures come back as
+        # error placeholders and must be retried like any other failure
+        if is_error_result(feedback):
+            error = _error_message(feedback)
+
+    if error is not None:
+        status = await run_in_threadpool(jobs.fail, engine, job.id, error, retry_after)
+        logger.warning("job failed", extra={
+            "job_id": job.id, "attempt": job.attempts, "error": error, "status": status
+        })
+        if status != "failed":
+            return
+    else:
+        if not await run_in_threadpool(jobs.complete, engine, job.id, {"feedback": feedback, "cache": cache_status}):
+            return
+
+    if job.callback_url:
+        finished = await run_in_threadpool(jobs.get_job, engine, job.id)
+        await send_callback(job.callback_url, jobs.to_dict(finished))
+
+async def worker_loop(worker_id: str, concurrency: int):
+    # Imported per process so each one builds its own engine and clients after fork
+    import jobs
+    from database import get_engine, create_db_and_tables
+
+    create_db_and_tables()
+    engine = get_engine()
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    last_requeue = 0.0
+    logger.info("worker started", extra={"worker_id": worker_id, "concurrency": concurrency})
+    while True:
+        if time.monotonic() - last_requeue > jobs.JOB_LEASE_SECONDS / 2:
+            for failed in await run_in_threadpool(jobs.requeue_stale, engine):
+                logger.warning("job failed", extra={"job_id": failed.id, "attempt": failed.attempts,
+                                                    "error": failed.error, "status": failed.status})
+                if failed.callback_url:
+                    callback = asyncio.create_task(send_callback(failed.callback_url, jobs.to_dict(failed)))
+                    running.add(callback)
+                    callback.add_done_callback(running.discard)
+            last_requeue = time.monotonic()
+
+        await slots.acquire()
+        job = await run_in_threadpool(jobs.claim_next, engine, worker_id)
+        if job is None:
+            slots.release()
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+
+        task = asyncio.create_task(run_job(engine, job))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+def run_process(index: int, concurrency: int):
+    configure_logging()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    try:
+        asyncio.run(worker_loop(worker_id, concurrency))
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background review workers")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("JOB_WORKER_PROCESSES", "2")))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("JOB_WORKER_CONCURRENCY", "8")),
+                        help="Jobs in flight per process")
+    args = parser.parse_args()
+
+    processes = [
+        multiprocessing.Process(target=run_process, args=(i, args.concurrency), daemon=True)
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def shutdown(signum, frame):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        shutdown(signal.SIGINT, None)
+
+if __name__ == "__main__":
+    main()